@@ -1,27 +1,55 @@
 import logging
+import io
 import os
 import time
 import json
 import random
 import hashlib
+import hmac
+import re
 import tempfile
+import functools
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import closing
 from typing import cast
-import requests as _http
 from openai.types.chat import ChatCompletionMessageParam
 from collections import defaultdict
 from flask import (
     Flask,
+    Request,
     render_template,
     request,
     jsonify,
     Response,
     stream_with_context,
     send_from_directory,
+    send_file,
+    has_request_context,
+    copy_current_request_context,
     make_response,
+    g,
 )
 from openai import OpenAI
 from config import Config
 from flask_cors import CORS
+from srs import srs_store, GRADES as SRS_GRADES
+from exercise_bank import exercise_bank
+from vocab_store import vocab_store
+from routing import model_router, RoutedClient
+from structured import generate_json, stream_json_object, StructuredOutputError, SCHEMAS
+from structured import stats as structured_stats
+from lexicon import pronunciation_lexicon
+import audio as audio_prep
+from transcription import whisper_transcribe, StreamingTranscription, max_stream_bytes
+from transcription import audio_digest, transcription_cache
+from story_images import image_query, story_images
+import metrics
+import tracing
+import profiling
+import sse
+from stream_buffer import stream_buffer, StreamLost
+from usage import usage_ledger, DIMENSIONS as USAGE_DIMENSIONS
+from sessions import session_store, clean_history
 
 try:
     from auth_module.flask_auth_routes import auth_blueprint
@@ -33,6 +61,12 @@ try:
 except Exception:
     _decode_token = None
 
+# WebSocket support for streaming speech-to-text (optional)
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
+
 # Groq SDK for Whisper
 try:
     from groq import Groq
@@ -46,7 +80,23 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+
+class SpoolingRequest(Request):
+    """Request whose uploaded files stay in memory up to ``UPLOAD_SPOOL_BYTES``.
+
+    Werkzeug's default writes any upload over 500 KB to a temporary file;
+    voice recordings are usually a little larger than that, so they would hit
+    the disk on every turn.
+    """
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        return tempfile.SpooledTemporaryFile(max_size=Config.UPLOAD_SPOOL_BYTES)
+
+
 app = Flask(__name__)
+app.request_class = SpoolingRequest
 CORS(app)
 app.config.from_object(Config)
 if auth_blueprint is not None:
@@ -54,6 +104,91 @@ if auth_blueprint is not None:
 
 START_TIME = time.time()
 
+
+# --- Request metrics (see metrics.py) ---
+def _route_label():
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+@app.before_request
+def _metrics_start():
+    g.metrics_route = _route_label()
+    g.metrics_start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+
+def _metrics_finish(route, method, status, start):
+    metrics.HTTP_IN_FLIGHT.dec(route=route)
+    metrics.HTTP_REQUESTS.inc(route=route, method=method, status=status)
+    metrics.HTTP_LATENCY.observe(
+        time.perf_counter() - start, route=route, method=method
+    )
+
+
+@app.after_request
+def _metrics_response(response):
+    if "metrics_start" in g:
+        # Streamed bodies are still being sent; finish when the response closes
+        args = (g.metrics_route, request.method, str(response.status_code))
+        start = g.pop("metrics_start")
+        response.call_on_close(lambda: _metrics_finish(*args, start))
+    return response
+
+
+@app.before_request
+def _trace_start():
+    tracing.current()
+
+
+@app.after_request
+def _trace_response(response):
+    trace = g.get("trace")
+    if trace is not None:
+        # Streamed responses only carry the phases done before the body
+        response.headers["Server-Timing"] = trace.server_timing()
+        if trace.sampled:
+            args = (_route_label(), request.method, str(response.status_code))
+            response.call_on_close(lambda: trace.log(*args))
+    return response
+
+
+@app.before_request
+def _profile_start():
+    if Config.ADMIN_TOKEN and profiling.wanted(
+        request.headers.get("X-Echo-Profile"), _route_label()
+    ):
+        g.profiler = profiling.SamplingProfiler()
+        g.profiler.start()
+
+
+@app.after_request
+def _profile_response(response):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        # Sample until the body is fully sent, so SSE generators are included
+        info = dict(
+            route=_route_label(),
+            method=request.method,
+            status=response.status_code,
+        )
+        response.headers["X-Profile-Id"] = profiler.id
+        response.call_on_close(lambda: profiler.save(**info))
+    return response
+
+
+@app.teardown_request
+def _metrics_teardown(exc):
+    # Only reached with metrics_start still set if no response was produced
+    if "metrics_start" in g:
+        _metrics_finish(g.metrics_route, request.method, "500", g.pop("metrics_start"))
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    max_mb = app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024)
+    return jsonify({"error": f"Upload too large (max {max_mb:g} MB)"}), 413
+
+
 # --- Rate Limiter (in-memory) ---
 rate_limits = defaultdict(list)
 
@@ -68,13 +203,15 @@ def _cache_key(*parts: str) -> str:
     return hashlib.md5(raw.encode()).hexdigest()
 
 
-def _cache_get(key: str):
+def _cache_get(key: str, namespace: str = "response"):
     """Return cached value or None if missing/expired."""
     entry = _response_cache.get(key)
     if entry and entry["expires_at"] > time.time():
+        metrics.CACHE_REQUESTS.inc(namespace=namespace, result="hit")
         return entry["value"]
     if key in _response_cache:
         del _response_cache[key]
+    metrics.CACHE_REQUESTS.inc(namespace=namespace, result="miss")
     return None
 
 
@@ -89,6 +226,11 @@ def _cache_set(key: str, value, ttl: int = CACHE_TTL_SECONDS):
     _response_cache[key] = {"value": value, "expires_at": time.time() + ttl}
 
 
+# --- Bounded worker pool for fanning out independent LLM calls ---
+_llm_pool = ThreadPoolExecutor(
+    max_workers=Config.LLM_POOL_WORKERS, thread_name_prefix="llm"
+)
+
 # --- In-memory leaderboard ---
 _leaderboard: dict = {}  # keyed by email (from JWT) or IP
 
@@ -107,12 +249,25 @@ def get_client_ip():
     return request.remote_addr or "unknown"
 
 
+def get_user_key():
+    """Identify the learner: JWT ``sub`` when authenticated, client IP otherwise."""
+    key = get_client_ip()
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.lower().startswith("bearer ") and _decode_token:
+        token = auth_header.split(" ", 1)[1]
+        payload = _decode_token(token)
+        if payload:
+            key = payload.get("sub", key)
+    return key
+
+
 def is_rate_limited(ip):
     now = time.time()
     window = 60
     limit = app.config.get("RATE_LIMIT", 30)
     rate_limits[ip] = [t for t in rate_limits[ip] if now - t < window]
     if len(rate_limits[ip]) >= limit:
+        metrics.RATE_LIMITED.inc(route=_route_label())
         return True, limit, 0
     rate_limits[ip].append(now)
     remaining = limit - len(rate_limits[ip])
@@ -120,8 +275,7 @@ def is_rate_limited(ip):
 
 
 # --- OpenAI Client Factory (supports Groq key rotation) ---
-def get_client():
-    provider = Config.AI_PROVIDER
+def _provider_client(provider):
     if provider == "groq" and Config.GROQ_API_KEYS:
         api_key = random.choice(Config.GROQ_API_KEYS)
         base_url = Config.PROVIDERS["groq"]["base_url"]
@@ -131,19 +285,37 @@ def get_client():
     else:
         return None
     try:
-        return OpenAI(base_url=base_url, api_key=api_key)
+        with tracing.span("client"):
+            return OpenAI(base_url=base_url, api_key=api_key)
     except Exception as e:
         logging.error(f"Failed to create client: {e}")
         return None
 
 
+def get_client(route=None):
+    """Client for the active provider, or bound to ``route``'s model choice.
+
+    With a route (see ``Config.MODEL_ROUTES``) the returned client's
+    ``model`` is the model to call, and each call is recorded for routing.
+    """
+    if route is None:
+        return _provider_client(Config.AI_PROVIDER)
+    choice = model_router.choose(route)
+    client = _provider_client(choice.provider)
+    if client is None:
+        return None
+    attribution = (_route_label(), get_user_key()) if has_request_context() else None
+    return RoutedClient(client, choice, attribution=attribution)
+
+
 # --- Groq Client for Whisper ---
 def get_groq_client():
     if not GROQ_AVAILABLE or not Config.GROQ_API_KEYS:
         return None
     try:
         api_key = random.choice(Config.GROQ_API_KEYS)
-        return Groq(api_key=api_key)
+        with tracing.span("client"):
+            return Groq(api_key=api_key, base_url=Config.GROQ_BASE_URL)
     except Exception as e:
         logging.error(f"Failed to create Groq client: {e}")
         return None
@@ -157,7 +329,7 @@ else:
     logging.warning("No AI provider configured. AI features unavailable.")
 
 
-# --- Load Exercises ---
+# --- Load Exercises (static JSON seeds the searchable bank) ---
 EXERCISES = {}
 try:
     exercises_path = os.path.join(app.static_folder or "", "data", "exercises.json")
@@ -165,10 +337,43 @@ try:
         EXERCISES = json.load(f)
     total = sum(len(v) for v in EXERCISES.values())
     logging.info(f"Loaded {total} exercises across {len(EXERCISES)} types")
+    if exercise_bank is not None:
+        exercise_bank.load_static(EXERCISES)
+        logging.info(f"Exercise bank ready: {exercise_bank.count()} items")
 except Exception as e:
     logging.warning(f"Could not load exercises: {e}")
 
 
+def _exercise_types():
+    if exercise_bank is not None:
+        return exercise_bank.types()
+    return list(EXERCISES.keys())
+
+
+def _exercise_ids(ex_type, language=None, level=None, limit=None):
+    if exercise_bank is not None:
+        return exercise_bank.ids(ex_type, language, level, limit)
+    ids = [
+        e["id"]
+        for e in EXERCISES.get(ex_type, [])
+        if level is None or e.get("level", "intermediate") == level
+    ]
+    random.shuffle(ids)
+    return ids[:limit]
+
+
+def _exercises_by_id(ids):
+    if exercise_bank is not None:
+        return exercise_bank.get_many(ids)
+    ids = set(ids)
+    return {
+        e["id"]: dict(e, type=t)
+        for t, items in EXERCISES.items()
+        for e in items
+        if e["id"] in ids
+    }
+
+
 # --- System Prompt Builder (with language + scenario) ---
 def build_system_prompt(
     level="intermediate", topic="free", language="en", scenario=None
@@ -328,6 +533,53 @@ def topics():
 
 
 # ─── Whisper STT Endpoint ───
+def _audio_upload():
+    """Validate the ``audio`` upload; returns ``(file, error_response)``.
+
+    Parsing the form enforces MAX_CONTENT_LENGTH (413) before reading the
+    body; the upload is spooled in memory (see SpoolingRequest).
+    """
+    if "audio" not in request.files:
+        return None, (jsonify({"error": "No audio file provided"}), 400)
+    audio_file = request.files["audio"]
+    stream = audio_file.stream
+    stream.seek(0, os.SEEK_END)
+    if stream.tell() == 0:
+        return None, (jsonify({"error": "Empty audio file"}), 400)
+    stream.seek(0)
+    return audio_file, None
+
+
+def _transcribe_upload(groq_client, audio, filename, language):
+    """Transcribe an uploaded recording; returns ``(result, cached)``."""
+    filename = filename or ""
+    if "." not in filename:
+        filename = "audio.webm"  # Whisper detects the format from the extension
+
+    def run():
+        if audio_prep.enabled():
+            # Trim silence and downmix to 16 kHz mono before uploading
+            with tracing.span("preprocess"):
+                prepared = audio_prep.preprocess(audio.read(), filename)
+            if prepared.silent:
+                return {
+                    "text": "",
+                    "language": language,
+                    "duration": prepared.original_seconds,
+                }
+            with tracing.span("whisper"):
+                return whisper_transcribe(
+                    groq_client, prepared.filename, prepared.data, language
+                )
+        with tracing.span("whisper"):
+            return whisper_transcribe(groq_client, filename, audio, language)
+
+    # Retries and double submissions of the same recording share one call
+    with tracing.span("digest"):
+        key = audio_digest(audio, language)
+    return transcription_cache.get_or_compute(key, run)
+
+
 @app.route("/transcribe", methods=["POST"])
 def transcribe():
     """Transcribe audio using Groq Whisper API."""
@@ -343,51 +595,100 @@ def transcribe():
         resp.headers["Retry-After"] = "60"
         return resp, 429
 
-    if "audio" not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
-
-    audio_file = request.files["audio"]
+    with tracing.span("upload"):
+        audio_file, error = _audio_upload()
+    if error:
+        return error
     language = request.form.get("language", "en")
 
     try:
-        # Save to temp file (Groq needs a file path)
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as tmp:
-            audio_file.save(tmp)
-            tmp_path = tmp.name
-
-        with open(tmp_path, "rb") as f:
-            transcription = groq_client.audio.transcriptions.create(
-                file=(os.path.basename(tmp_path), f.read()),
-                model="whisper-large-v3-turbo",
-                language=language,
-                temperature=0,
-                response_format="verbose_json",
-            )
-
-        os.unlink(tmp_path)  # Clean up
-
-        return jsonify(
-            {
-                "text": transcription.text,
-                "language": getattr(transcription, "language", language),
-                "duration": getattr(transcription, "duration", 0),
-            }
+        result, cached = _transcribe_upload(
+            groq_client, audio_file.stream, audio_file.filename, language
         )
+        resp = jsonify(dict(result, cached=cached))
+        resp.headers["X-Cache"] = "HIT" if cached else "MISS"
+        return resp
 
     except Exception as e:
         logging.error(f"Transcription error: {e}", exc_info=True)
-        if "tmp_path" in locals():
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
         return jsonify({"error": str(e)}), 500
+    finally:
+        audio_file.close()
+
+
+# ─── Streaming STT over WebSocket ───
+_stt_pool = ThreadPoolExecutor(
+    max_workers=Config.LLM_POOL_WORKERS, thread_name_prefix="stt"
+)
+sock = Sock(app) if Sock is not None else None
+STT_IDLE_SECONDS = 10
+
+
+def transcribe_ws(ws):
+    """Live transcription: 16 kHz mono s16le PCM in, JSON transcripts out.
+
+    Optionally send ``{"language": "en"}`` first, then binary PCM chunks, then
+    ``{"type": "end"}``. Segments cut at pauses are transcribed while audio
+    keeps arriving; the server sends ``segment``/``partial`` events as they
+    complete and one ``final`` event after ``end``.
+    """
+    groq_client = get_groq_client()
+    if not groq_client:
+        ws.send(json.dumps({"type": "error", "error": "Whisper service unavailable"}))
+        return
+    if is_rate_limited(get_client_ip())[0]:
+        ws.send(json.dumps({"type": "error", "error": "Too many requests."}))
+        return
+
+    language = request.args.get("language", "en")
+    session = StreamingTranscription(
+        lambda filename, data: whisper_transcribe(
+            groq_client, filename, data, language
+        ),
+        _stt_pool,
+    )
+    last_message = time.time()
+    try:
+        while True:
+            message = ws.receive(timeout=0.05)
+            if message is None:
+                # Client stopped sending without "end": finish what we have
+                if time.time() - last_message > STT_IDLE_SECONDS:
+                    break
+            else:
+                last_message = time.time()
+            if isinstance(message, (bytes, bytearray)):
+                if session.bytes_received + len(message) > max_stream_bytes():
+                    ws.send(json.dumps({"type": "error", "error": "Stream too long"}))
+                    break
+                session.feed(bytes(message))
+            elif message:
+                try:
+                    control = json.loads(message)
+                except ValueError:
+                    control = {}
+                if control.get("type") == "end":
+                    break
+                if control.get("language"):
+                    language = str(control["language"])[:5]
+            for event in session.events():
+                ws.send(json.dumps(event, ensure_ascii=False))
+        for event in session.finish():
+            ws.send(json.dumps(event, ensure_ascii=False))
+    except Exception as e:
+        # Client went away (ConnectionClosed) or the socket failed
+        logging.info(f"Streaming transcription ended: {e}")
+        session.cancel()
+
+
+if sock is not None:
+    sock.route("/transcribe/ws")(transcribe_ws)
 
 
 # ─── Chat (non-streaming) ───
 @app.route("/chat", methods=["POST"])
 def chat():
-    client = get_client()
+    client = get_client("chat")
     if not client:
         return jsonify({"error": "AI service is currently unavailable."}), 503
 
@@ -400,7 +701,13 @@ def chat():
         return resp, 429
 
     data = request.json or {}
-    history = data.get("history", [])
+    session_id = data.get("session_id")
+    if session_id:
+        session_id, history, user_msg = _session_turn(session_id, data.get("message"))
+        if history is None:
+            return user_msg
+    else:
+        history = data.get("history", [])
     level = str(data.get("level", "intermediate"))[:20]
     topic = str(data.get("topic", "free"))[:50]
     language = str(data.get("language", "en"))[:5]
@@ -434,15 +741,19 @@ def chat():
     level_config = Config.DIFFICULTY_LEVELS.get(
         level, Config.DIFFICULTY_LEVELS["intermediate"]
     )
-    system_prompt = build_system_prompt(level, topic, language, scenario)
+    with tracing.span("prompt"):
+        system_prompt = build_system_prompt(level, topic, language, scenario)
 
     # Check cache for identical conversation state
-    last_user_msg = next(
-        (m["content"] for m in reversed(history) if m.get("role") == "user"), ""
-    )
-    cache_key = _cache_key(last_user_msg, level, topic, language, scenario or "")
-    cached = _cache_get(cache_key)
+    with tracing.span("cache"):
+        last_user_msg = next(
+            (m["content"] for m in reversed(history) if m.get("role") == "user"), ""
+        )
+        cache_key = _cache_key(last_user_msg, level, topic, language, scenario or "")
+        cached = _cache_get(cache_key, "chat")
     if cached:
+        if session_id:
+            _append_session_turn(session_id, user_msg, cached)
         resp = jsonify({"response": cached})
         resp.headers["X-Cache"] = "HIT"
         resp.headers["X-RateLimit-Remaining"] = str(remaining)
@@ -454,16 +765,19 @@ def chat():
     )
 
     try:
-        completion = client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=messages_payload,
-            temperature=level_config["temperature"],
-            top_p=0.95,
-            max_tokens=level_config["max_tokens"],
-            stream=False,
-        )
+        with tracing.span("llm"):
+            completion = client.chat.completions.create(
+                model=client.model,
+                messages=messages_payload,
+                temperature=level_config["temperature"],
+                top_p=0.95,
+                max_tokens=level_config["max_tokens"],
+                stream=False,
+            )
         reply = completion.choices[0].message.content
         _cache_set(cache_key, reply)
+        if session_id:
+            _append_session_turn(session_id, user_msg, reply)
         resp = jsonify({"response": reply})
         resp.headers["X-Cache"] = "MISS"
         resp.headers["X-RateLimit-Remaining"] = str(remaining)
@@ -477,9 +791,80 @@ def chat():
 
 
 # ─── Chat (streaming) ───
+def _chat_reply_events(messages_payload, level_config, on_complete=None):
+    """Stream the tutor's reply as SSE ``token`` events, then ``[DONE]``.
+
+    Model deltas are coalesced into fewer, larger ``token`` events (see
+    sse.py); the first one is sent as soon as it arrives. ``on_complete``
+    is called with the full reply once the model has finished it.
+
+    A ``{"timing": ...}`` event with the request's phase timings precedes
+    ``[DONE]`` (see tracing.py). Closing the generator early (the client
+    went away) closes the upstream stream, so generation stops there too.
+    """
+    try:
+        stream_client = get_client("chat")
+        if not stream_client:
+            yield f"data: {json.dumps({'error': 'AI service unavailable'})}\n\n"
+            return
+
+        with tracing.span("connect"):
+            stream = stream_client.chat.completions.create(
+                model=stream_client.model,
+                messages=messages_payload,
+                temperature=level_config["temperature"],
+                top_p=0.95,
+                max_tokens=level_config["max_tokens"],
+                stream=True,
+            )
+        received = 0  # model deltas so far, about one token each
+
+        def deltas():
+            nonlocal received
+            for chunk in tracing.timed_stream(stream):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    received += 1
+                    yield chunk.choices[0].delta.content
+
+        reply = []
+        try:
+            for token in sse.coalesce(deltas()):
+                reply.append(token)
+                yield sse.token_frame(token)
+        except GeneratorExit:
+            metrics.LLM_CANCELLED.inc(route="chat")
+            metrics.LLM_TOKENS_SAVED.inc(
+                max(0, level_config["max_tokens"] - received), route="chat"
+            )
+            raise
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        if on_complete is not None:
+            on_complete("".join(reply))
+        yield tracing.timing_event()
+        yield sse.DONE
+    except Exception as e:
+        logging.error(f"Streaming error: {e}", exc_info=True)
+        yield f"data: {json.dumps({'error': 'Connection interrupted. Please try again.'})}\n\n"
+
+
 @app.route("/chat/stream", methods=["POST"])
 def chat_stream():
-    client = get_client()
+    """Stream the tutor's reply as SSE, resumable after a dropped connection.
+
+    The reply is generated on its own thread into a stream buffer (see
+    stream_buffer.py), and every event carries an id. A reconnect that
+    sends ``Last-Event-ID`` gets the rest of the same reply instead of a
+    new generation. Without a reader for ``STREAM_RESUME_GRACE_S`` (or on
+    ``/chat/stream/<id>/cancel``) the generation is cancelled upstream.
+
+    With ``session_id`` + ``message`` instead of ``history`` the turn
+    continues a server-held session (see /sessions), which gets the message
+    and the reply appended once the reply is complete.
+    """
+    client = get_client("chat")
     if not client:
         return jsonify({"error": "AI service is currently unavailable."}), 503
 
@@ -489,8 +874,18 @@ def chat_stream():
         resp.headers["Retry-After"] = "60"
         return resp, 429
 
+    last_event_id = request.headers.get("Last-Event-ID")
+    if last_event_id:
+        return _resume_chat_stream(last_event_id)
+
     data = request.json or {}
-    history = data.get("history", [])
+    session_id = data.get("session_id")
+    if session_id:
+        session_id, history, user_msg = _session_turn(session_id, data.get("message"))
+        if history is None:
+            return user_msg
+    else:
+        history = data.get("history", [])
     level = data.get("level", "intermediate")
     topic = data.get("topic", "free")
     language = data.get("language", "en")
@@ -519,35 +914,234 @@ def chat_stream():
             },
         )
 
+    level_config = Config.DIFFICULTY_LEVELS.get(
+        level, Config.DIFFICULTY_LEVELS["intermediate"]
+    )
+    with tracing.span("prompt"):
+        system_prompt = build_system_prompt(level, topic, language, scenario)
+        messages_payload = [{"role": "system", "content": system_prompt}] + history
+
+    profiler = g.get("profiler")
+    trace = tracing.current()
+    on_complete = (
+        functools.partial(_append_session_turn, session_id, user_msg)
+        if session_id
+        else None
+    )
+
+    @copy_current_request_context
+    def produce(emit):
+        # The copied context has a fresh g: keep timing into the request's trace
+        g.trace = trace
+        if profiler is not None:
+            profiler.follow()
+        events = _chat_reply_events(messages_payload, level_config, on_complete)
+        with closing(events) as frames:
+            for frame in frames:
+                if not emit(frame):
+                    break  # cancelled; closing the generator stops the LLM call
+
+    stream_id = stream_buffer.start(produce)
+    return Response(
+        stream_with_context(_buffered_events(stream_id, 0)),
+        content_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Stream-Id": stream_id,
+        },
+    )
+
+
+def _buffered_events(stream_id, after):
+    """A buffered stream's events after ``after``, each with its SSE id."""
+    try:
+        for seq, frame in stream_buffer.events(stream_id, after):
+            yield sse.with_id(frame, f"{stream_id}:{seq}")
+    except StreamLost:
+        error = {"error": "The reply is no longer available. Please try again."}
+        yield f"data: {json.dumps(error)}\n\n"
+
+
+@app.route("/chat/stream/<stream_id>/cancel", methods=["POST"])
+def chat_stream_cancel(stream_id):
+    """Stop generating a /chat/stream reply now.
+
+    For when the learner ends the session mid-reply; an abandoned stream is
+    otherwise only cancelled after the resume grace period.
+    """
+    return jsonify({"cancelled": stream_buffer.cancel(stream_id)})
+
+
+def _resume_chat_stream(last_event_id):
+    """Continue a /chat/stream reply after a dropped connection.
+
+    ``Last-Event-ID`` is ``<stream_id>:<seq>`` of the last event received;
+    the rest of the reply is replayed from the stream buffer, then followed
+    live if it is still being generated. No new LLM call is made.
+    """
+    stream_id, _, seq = last_event_id.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+    return Response(
+        stream_with_context(_buffered_events(stream_id, int(seq))),
+        content_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Stream-Id": stream_id,
+        },
+    )
+
+
+# ─── Chat Sessions (server-held history) ───
+def _session_turn(session_id, message):
+    """History for a session turn: the stored messages plus the new one.
+
+    Returns ``(session_id, history, message)`` with the id normalized as it
+    is stored, or ``(session_id, None, error_response)`` when the message is
+    missing or the session is unknown or expired.
+    """
+    session_id = str(session_id)[:64]
+    if not isinstance(message, str) or not message.strip():
+        return session_id, None, (jsonify({"error": "message is required"}), 400)
+    history = session_store.history(session_id)
+    if history is None:
+        error = jsonify({"error": "Session not found or expired"})
+        return session_id, None, (error, 404)
+    message = message[:4000]
+    return session_id, history + [{"role": "user", "content": message}], message
+
+
+def _append_session_turn(session_id, user_msg, reply):
+    """Record a completed turn in its session."""
+    turn = [("user", user_msg), ("assistant", reply)]
+    if not session_store.append(session_id, turn):
+        logging.warning(f"Session {session_id} expired before its turn was saved")
+
+
+@app.route("/sessions", methods=["POST"])
+def create_session():
+    """Start a server-held conversation for /chat and /chat/stream.
+
+    Later turns send only ``session_id`` and the new ``message`` instead of
+    the whole history. An optional ``history`` seeds the session (e.g. to
+    move an existing conversation over); without one it starts with the
+    tutor's welcome message, which is returned as ``response``.
+    """
+    limited, _, _ = is_rate_limited(get_client_ip())
+    if limited:
+        resp = jsonify({"error": "Too many requests. Please slow down."})
+        resp.headers["Retry-After"] = "60"
+        return resp, 429
+
+    data = request.json or {}
+    history = data.get("history")
+    if history is not None and not isinstance(history, list):
+        return jsonify({"error": "Invalid history format"}), 400
+    messages = clean_history(history)
+    if messages:
+        session_id = session_store.create(messages)
+        return jsonify({"session_id": session_id, "length": len(messages)}), 201
+
+    welcome = get_welcome_message(
+        str(data.get("topic", "free"))[:50],
+        str(data.get("language", "en"))[:5],
+        data.get("scenario", None),
+        user_name=str(data.get("user_name", "") or "").strip()[:60],
+    )
+    session_id = session_store.create([("assistant", welcome)])
+    return jsonify({"session_id": session_id, "length": 1, "response": welcome}), 201
+
+
+@app.route("/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    history = session_store.history(session_id)
+    if history is None:
+        return jsonify({"error": "Session not found or expired"}), 404
+    return jsonify({"session_id": session_id, "messages": history})
+
+
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+def delete_session(session_id):
+    return jsonify({"deleted": session_store.delete(session_id)})
+
+
+# ─── Voice Turn (audio in, transcript + streamed reply out) ───
+@app.route("/voice/turn", methods=["POST"])
+def voice_turn():
+    """One round trip per voice turn.
+
+    Multipart form: ``audio`` plus the chat context (``history`` as a JSON
+    string, ``level``, ``topic``, ``language``, ``scenario``). Streams SSE:
+    first ``{"transcript": ...}``, then the reply ``token`` events exactly as
+    ``/chat/stream`` does; the LLM request starts as soon as the transcript
+    is ready. An empty transcript ends the stream without a reply.
+    """
+    groq_client = get_groq_client()
+    if not groq_client:
+        return jsonify({"error": "Whisper service unavailable"}), 503
+    if not get_client():
+        return jsonify({"error": "AI service is currently unavailable."}), 503
+
+    limited, limit, remaining = is_rate_limited(get_client_ip())
+    if limited:
+        resp = jsonify({"error": "Too many requests. Please slow down."})
+        resp.headers["Retry-After"] = "60"
+        return resp, 429
+
+    audio_file, error = _audio_upload()
+    if error:
+        return error
+    form = request.form
+    try:
+        history = json.loads(form.get("history") or "[]")
+    except ValueError:
+        return jsonify({"error": "Invalid history format"}), 400
+    if not isinstance(history, list):
+        return jsonify({"error": "Invalid history format"}), 400
+    history = [m for m in history[-100:] if isinstance(m, dict)]
+    for msg in history:
+        if len(str(msg.get("content", ""))) > 4000:
+            msg["content"] = str(msg["content"])[:4000]
+    level = str(form.get("level", "intermediate"))[:20]
+    topic = str(form.get("topic", "free"))[:50]
+    language = str(form.get("language", "en"))[:5]
+    scenario = form.get("scenario") or None
+
     level_config = Config.DIFFICULTY_LEVELS.get(
         level, Config.DIFFICULTY_LEVELS["intermediate"]
     )
     system_prompt = build_system_prompt(level, topic, language, scenario)
-    messages_payload = [{"role": "system", "content": system_prompt}] + history
+    # The upload is closed once the response starts; keep the bytes (bounded
+    # by MAX_CONTENT_LENGTH) for the generator
+    audio = io.BytesIO(audio_file.read())
+    filename = audio_file.filename
+    audio_file.close()
 
     def generate():
         try:
-            stream_client = get_client()
-            if not stream_client:
-                yield f"data: {json.dumps({'error': 'AI service unavailable'})}\n\n"
-                return
-
-            stream = stream_client.chat.completions.create(
-                model=Config.MODEL_NAME,
-                messages=messages_payload,
-                temperature=level_config["temperature"],
-                top_p=0.95,
-                max_tokens=level_config["max_tokens"],
-                stream=True,
-            )
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    token = chunk.choices[0].delta.content
-                    yield f"data: {json.dumps({'token': token})}\n\n"
-            yield "data: [DONE]\n\n"
+            result, cached = _transcribe_upload(groq_client, audio, filename, language)
         except Exception as e:
-            logging.error(f"Streaming error: {e}", exc_info=True)
-            yield f"data: {json.dumps({'error': 'Connection interrupted. Please try again.'})}\n\n"
+            logging.error(f"Voice turn transcription error: {e}", exc_info=True)
+            yield f"data: {json.dumps({'error': 'Transcription failed. Please try again.'})}\n\n"
+            return
+
+        transcript = (result.get("text") or "").strip()
+        event = {"transcript": transcript, "cached": cached}
+        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        if not transcript:
+            yield "data: [DONE]\n\n"
+            return
+
+        messages_payload = (
+            [{"role": "system", "content": system_prompt}]
+            + history
+            + [{"role": "user", "content": transcript}]
+        )
+        yield from _chat_reply_events(messages_payload, level_config)
 
     return Response(
         stream_with_context(generate()),
@@ -556,6 +1150,7 @@ def chat_stream():
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "X-Accel-Buffering": "no",
+            "X-RateLimit-Remaining": str(remaining),
         },
     )
 
@@ -566,74 +1161,190 @@ def get_exercises():
     """Return random exercises filtered by level and type."""
     level = request.args.get("level", "intermediate")
     ex_type = request.args.get("type", "all")
+    language = request.args.get("language", "en")[:5]
     count = min(int(request.args.get("count", 10)), 20)
 
-    result = []
-    types_to_fetch = [ex_type] if ex_type != "all" else list(EXERCISES.keys())
-
-    for t in types_to_fetch:
-        if t in EXERCISES:
-            filtered = [
-                e for e in EXERCISES[t] if e.get("level", "intermediate") == level
-            ]
-            if not filtered:
-                filtered = EXERCISES[t]  # fall back to all levels
-            result.extend(filtered)
+    # Only ids are selected here; just the exercises returned are loaded.
+    # Without SRS, count random ids per type are all that can be used.
+    limit = None if srs_store is not None else count
+    ids = []
+    for t in [ex_type] if ex_type != "all" else _exercise_types():
+        found = _exercise_ids(t, language, level, limit)
+        if not found:
+            found = _exercise_ids(t, language, None, limit)  # fall back to all levels
+        ids.extend(found)
+    random.shuffle(ids)
+
+    # Learners with scheduled reviews get due items first and skip the ones
+    # they have already answered well and are not due again yet.
+    due, seen = [], set()
+    if srs_store is not None:
+        user_key = get_user_key()
+        try:
+            due_cards = srs_store.due_batch(
+                user_key, "exercise", limit=count, card_ids=ids
+            )
+            due = [c["card_id"] for c in due_cards]
+            seen = srs_store.seen_ids(user_key, ids)
+        except Exception as e:
+            logging.warning(f"SRS lookup failed: {e}")
+            due, seen = [], set()
+    unseen = [i for i in ids if i not in seen]
+    picked = (due + unseen)[:count]
+    items = _exercises_by_id(picked)
+    exercises = [items[i] for i in picked if i in items]
 
-    random.shuffle(result)
-    return jsonify({"exercises": result[:count], "total": len(result)})
+    return jsonify({"exercises": exercises, "total": len(due) + len(unseen)})
 
 
 @app.route("/exercises/generate", methods=["POST"])
 def generate_exercises():
-    """AI-generate exercises based on user's past errors."""
-    client = get_client()
-    if not client:
-        return jsonify({"error": "AI unavailable"}), 503
-
+    """Serve exercises targeting the user's past errors, generating only the gap."""
     data = request.json or {}
     errors = data.get("errors", [])
-    level = data.get("level", "intermediate")
-    _language = data.get("language", "en")  # reserved for future i18n use
+    level = str(data.get("level", "intermediate"))[:20]
+    language = str(data.get("language", "en"))[:5]
+    wanted = 5
 
     if not errors:
         return jsonify({"error": "No errors provided"}), 400
+    errors = [e for e in errors[:10] if isinstance(e, dict)]
+
+    # 1. Retrieve matching items from the bank
+    found = {"items": [], "tags": []}
+    if exercise_bank is not None:
+        try:
+            found = exercise_bank.search_for_errors(errors, level, language, wanted)
+        except Exception as e:
+            logging.warning(f"Exercise bank search failed: {e}")
+    retrieved = found["items"]
+    retrieved_only = {
+        "exercises": retrieved,
+        "generated": False,
+        "retrieved": len(retrieved),
+    }
+    if len(retrieved) >= wanted:
+        return jsonify(retrieved_only)
+
+    # 2. Ask the LLM only for the missing ones
+    client = get_client("exercises")
+    if not client:
+        if retrieved:
+            return jsonify(retrieved_only)
+        return jsonify({"error": "AI unavailable"}), 503
 
     errors_text = "\n".join(
         [
             f"- Wrong: '{e.get('wrong','')}' → Right: '{e.get('right','')}'"
-            for e in errors[:10]
+            for e in errors
         ]
     )
+    avoid_text = ""
+    if retrieved:
+        avoid_text = (
+            "Do not repeat these questions:\n"
+            + "\n".join(f"- {e.get('q', '')}" for e in retrieved)
+            + "\n\n"
+        )
 
     prompt = (
         f"Based on these language mistakes a student made:\n{errors_text}\n\n"
-        f"Generate 5 fill-in-the-blank exercises at the {level} level that target these specific error patterns. "
+        f"{avoid_text}"
+        f"Generate {wanted - len(retrieved)} fill-in-the-blank exercises at the {level} level that target these specific error patterns. "
         f"Return ONLY valid JSON array, no other text. Each item should have: "
         f'"q" (question with ___ for blank), "options" (4 choices), "answer" (correct), "explain" (brief explanation). '
         f'Example: {{"q":"She ___ to school.","options":["go","goes","going","gone"],"answer":"goes","explain":"Third person singular."}}'
     )
 
     try:
-        completion = client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        exercises = generate_json(
+            client,
+            "generate_exercises",
+            prompt,
+            model=client.model,
             temperature=0.3,
             max_tokens=1024,
         )
-        raw = (completion.choices[0].message.content or "").strip()
-        # Try to parse JSON from response
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-        exercises = json.loads(raw)
-        return jsonify({"exercises": exercises, "generated": True})
+        if exercise_bank is not None:
+            try:
+                exercises = exercise_bank.add_generated(
+                    exercises, level, language, tags=found["tags"]
+                )
+            except Exception as e:
+                logging.warning(f"Could not store generated exercises: {e}")
+        return jsonify(
+            {
+                "exercises": retrieved + exercises,
+                "generated": True,
+                "retrieved": len(retrieved),
+            }
+        )
     except Exception as e:
         logging.error(f"Exercise generation error: {e}")
+        if retrieved:
+            return jsonify(retrieved_only)
         return jsonify({"error": "Could not generate exercises"}), 500
 
 
+# ─── Spaced Repetition Endpoints ───
+@app.route("/srs/due")
+def srs_due():
+    """Return the learner's next batch of cards due for review."""
+    if srs_store is None:
+        return jsonify({"error": "Review scheduler unavailable"}), 503
+
+    kind = request.args.get("kind", "all")
+    limit = max(1, min(int(request.args.get("limit", 20)), 100))
+
+    cards = srs_store.due_batch(
+        get_user_key(), kind=None if kind == "all" else kind[:20], limit=limit
+    )
+    items = _exercises_by_id(c["card_id"] for c in cards if c["kind"] == "exercise")
+    for card in cards:
+        if card["card_id"] in items:
+            card["item"] = items[card["card_id"]]
+    return jsonify({"cards": cards, "count": len(cards)})
+
+
+@app.route("/srs/review", methods=["POST"])
+def srs_review():
+    """Record one review (or a list under ``reviews``) and reschedule the cards."""
+    if srs_store is None:
+        return jsonify({"error": "Review scheduler unavailable"}), 503
+
+    data = request.json or {}
+    raw_reviews = data.get("reviews", [data])
+    if not isinstance(raw_reviews, list) or not raw_reviews:
+        return jsonify({"error": "No reviews provided"}), 400
+
+    reviews = []
+    for r in raw_reviews[:100]:
+        if not isinstance(r, dict) or not r.get("card_id"):
+            return jsonify({"error": "Each review needs a card_id"}), 400
+        if "grade" in r:
+            quality = SRS_GRADES.get(str(r["grade"]).lower())
+        elif "correct" in r:
+            quality = 4 if r["correct"] else 1
+        else:
+            quality = r.get("quality")
+        try:
+            quality = max(0, min(5, int(quality)))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Each review needs a quality 0-5"}), 400
+        payload = r.get("payload")
+        reviews.append(
+            {
+                "card_id": str(r["card_id"])[:120],
+                "kind": str(r.get("kind", "exercise"))[:20],
+                "quality": quality,
+                "payload": payload if isinstance(payload, dict) else None,
+            }
+        )
+
+    cards = srs_store.record_reviews(get_user_key(), reviews)
+    return jsonify({"cards": cards})
+
+
 @app.route("/leaderboard", methods=["GET"])
 def get_leaderboard():
     top = sorted(_leaderboard.values(), key=lambda x: x["xp"], reverse=True)[:10]
@@ -643,13 +1354,7 @@ def get_leaderboard():
 @app.route("/leaderboard", methods=["POST"])
 def submit_leaderboard():
     data = request.json or {}
-    key = get_client_ip()
-    auth_header = request.headers.get("Authorization", "")
-    if auth_header.lower().startswith("bearer ") and _decode_token:
-        token = auth_header.split(" ", 1)[1]
-        payload = _decode_token(token)
-        if payload:
-            key = payload.get("sub", key)
+    key = get_user_key()
     _leaderboard[key] = {
         "name": str(data.get("name", "Anonymous"))[:40],
         "xp": max(0, int(data.get("xp", 0))),
@@ -659,38 +1364,33 @@ def submit_leaderboard():
     return jsonify({"ok": True})
 
 
-@app.route("/story/generate", methods=["POST"])
-def generate_story():
-    story_client = get_client()
-    if not story_client:
-        return jsonify({"error": "AI service unavailable"}), 503
+STORY_LANG_NAMES = {
+    "en": "English",
+    "fr": "French",
+    "es": "Spanish",
+    "de": "German",
+    "ar": "Arabic",
+    "it": "Italian",
+    "pt": "Portuguese",
+    "ja": "Japanese",
+    "zh": "Chinese",
+}
+
 
+def _story_request():
+    """Read the story parameters; returns (language, level, topic, cache_key)."""
     data = request.json or {}
     language = data.get("language", "en")
     level = data.get("level", "intermediate")
     topic = data.get("topic", "daily life")
+    return language, level, topic, _cache_key("story", language, level, topic)
 
-    # Check cache first
-    story_key = _cache_key("story", language, level, topic)
-    cached_story = _cache_get(story_key)
-    if cached_story:
-        return jsonify(cached_story)
 
-    lang_names = {
-        "en": "English",
-        "fr": "French",
-        "es": "Spanish",
-        "de": "German",
-        "ar": "Arabic",
-        "it": "Italian",
-        "pt": "Portuguese",
-        "ja": "Japanese",
-        "zh": "Chinese",
-    }
-    lang_name = lang_names.get(language, "English")
+def _story_prompt(language: str, level: str, topic: str) -> str:
+    lang_name = STORY_LANG_NAMES.get(language, "English")
     word_counts = {"beginner": 80, "intermediate": 130, "advanced": 180}
     wc = word_counts.get(level, 130)
-    prompt = (
+    return (
         f"Write a short {lang_name} story for a {level} language learner about '{topic}'. "
         f"The story MUST be written entirely in {lang_name}. "
         f"Target length: {wc} words. Make it engaging and use common vocabulary. "
@@ -702,81 +1402,140 @@ def generate_story():
         f'  "image_prompt": vivid 12-word English description of the main scene for AI image generation\n'
         f"No markdown, no extra text — only the JSON object."
     )
+
+
+@app.route("/story/generate", methods=["POST"])
+def generate_story():
+    story_client = get_client("story")
+    if not story_client:
+        return jsonify({"error": "AI service unavailable"}), 503
+
+    language, level, topic, story_key = _story_request()
+
+    # Check cache first
+    cached_story = _cache_get(story_key, "story")
+    if cached_story:
+        story_images.prefetch(image_query(topic, cached_story.get("image_prompt")))
+        return jsonify(cached_story)
+
+    prompt = _story_prompt(language, level, topic)
     try:
-        completion = story_client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        story_data = generate_json(
+            story_client,
+            "generate_story",
+            prompt,
+            model=story_client.model,
             temperature=0.75,
             max_tokens=1400,
         )
-        raw = (completion.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-            raw = raw.strip("`").strip()
-        story_data = json.loads(raw)
         _cache_set(story_key, story_data, ttl=600)  # cache stories for 10 min
+        story_images.prefetch(image_query(topic, story_data.get("image_prompt")))
         return jsonify(story_data)
-    except json.JSONDecodeError as e:
-        logging.error(f"Story JSON parse error: {e} | raw: {raw[:200]}")
+    except StructuredOutputError as e:
+        logging.error(f"Story JSON parse error: {e}")
         return jsonify({"error": "Story format error. Please try again."}), 500
     except Exception as e:
         logging.error(f"Story generation error: {e}")
         return jsonify({"error": "Could not generate story"}), 500
 
 
-@app.route("/story/image", methods=["POST"])
-def get_story_image():
-    """Fetch a relevant image from Unsplash → Pexels → Pollinations fallback chain."""
-    data = request.json or {}
-    topic = str(data.get("topic", ""))[:60]
-    image_prompt = str(data.get("image_prompt", topic))[:80]
-    query = topic or image_prompt
+STORY_STREAM_FIELDS = ("title", "story")
 
-    # 1. Unsplash (highest quality, free API)
-    if Config.UNSPLASH_ACCESS_KEY:
-        try:
-            r = _http.get(
-                "https://api.unsplash.com/photos/random",
-                params={
-                    "query": query,
-                    "orientation": "landscape",
-                    "count": 1,
-                    "content_filter": "high",
-                },
-                headers={"Authorization": f"Client-ID {Config.UNSPLASH_ACCESS_KEY}"},
-                timeout=5,
-            )
-            if r.ok:
-                photos = r.json()
-                if isinstance(photos, list) and photos:
-                    return jsonify(
-                        {"url": photos[0]["urls"]["regular"], "source": "unsplash"}
-                    )
-        except Exception as e:
-            logging.warning(f"Unsplash image fetch failed: {e}")
 
-    # 2. Pexels fallback
-    if Config.PEXELS_API_KEY:
+@app.route("/story/generate/stream", methods=["POST"])
+def generate_story_stream():
+    """Stream a story over SSE as it is generated.
+
+    Events: ``{"field": "title"|"story", "delta": "..."}`` while the text is
+    written, ``{"field": ..., "value": ...}`` as each field completes, and a
+    final ``{"done": true, "story": {...}}`` with the validated object.
+    """
+    language, level, topic, story_key = _story_request()
+    cached_story = _cache_get(story_key, "story")
+
+    def _event(payload):
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def replay(story_data):
+        for field in STORY_STREAM_FIELDS:
+            yield _event({"field": field, "delta": story_data.get(field, "")})
+        for field, value in story_data.items():
+            yield _event({"field": field, "value": value})
+        yield _event({"done": True, "story": story_data, "cached": True})
+        yield sse.DONE
+
+    if cached_story:
+        story_images.prefetch(image_query(topic, cached_story.get("image_prompt")))
+        return Response(
+            stream_with_context(replay(cached_story)),
+            mimetype="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+                "X-Cache": "HIT",
+            },
+        )
+
+    story_client = get_client("story")
+    if not story_client:
+        return jsonify({"error": "AI service unavailable"}), 503
+    prompt = _story_prompt(language, level, topic)
+
+    def generate():
         try:
-            r = _http.get(
-                "https://api.pexels.com/v1/search",
-                params={"query": query, "per_page": 1, "orientation": "landscape"},
-                headers={"Authorization": Config.PEXELS_API_KEY},
-                timeout=5,
-            )
-            if r.ok:
-                d = r.json()
-                if d.get("photos"):
-                    return jsonify(
-                        {"url": d["photos"][0]["src"]["large"], "source": "pexels"}
-                    )
+            for kind, field, value in stream_json_object(
+                story_client,
+                "generate_story",
+                prompt,
+                stream_keys=STORY_STREAM_FIELDS,
+                model=story_client.model,
+                temperature=0.75,
+                max_tokens=1400,
+            ):
+                if kind == "delta":
+                    yield _event({"field": field, "delta": value})
+                elif kind == "value":
+                    if field == "image_prompt":
+                        story_images.prefetch(image_query(topic, value))
+                    yield _event({"field": field, "value": value})
+                else:
+                    _cache_set(story_key, value, ttl=600)
+                    yield _event({"done": True, "story": value})
+        except StructuredOutputError as e:
+            logging.error(f"Story stream JSON error: {e}")
+            yield _event({"error": "Story format error. Please try again."})
         except Exception as e:
-            logging.warning(f"Pexels image fetch failed: {e}")
+            logging.error(f"Story stream error: {e}")
+            yield _event({"error": "Could not generate story"})
+        yield tracing.timing_event()
+        yield sse.DONE
 
-    # 3. Signal client to use Pollinations (no server-side key needed)
-    return jsonify({"url": None, "source": "pollinations"})
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "X-Cache": "MISS",
+        },
+    )
+
+
+@app.route("/story/image", methods=["POST"])
+def get_story_image():
+    """Fetch a relevant image from Unsplash or Pexels, else signal Pollinations.
+
+    Both providers are queried at once and results are cached by query (see
+    story_images.py); ``generate_story`` prefetches the lookup.
+    """
+    data = request.json or {}
+    query = image_query(data.get("topic", ""), data.get("image_prompt", ""))
+    result, cached = story_images.lookup(query)
+    resp = jsonify(result)
+    resp.headers["X-Cache"] = "HIT" if cached else "MISS"
+    return resp
 
 
 def get_welcome_message(topic="free", language="en", scenario=None, user_name=""):
@@ -838,6 +1597,107 @@ def api_status():
                 "limit_per_minute": app.config.get("RATE_LIMIT", 30),
             },
             "leaderboard_entries": len(_leaderboard),
+            "structured_output": structured_stats(),
+            "model_routing": model_router.stats(),
+            "transcription_cache": transcription_cache.stats(),
+            "story_images": story_images.stats(),
+            "usage": usage_ledger.stats(),
+            "streams": stream_buffer.stats(),
+            "sessions": session_store.stats(),
+        }
+    )
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text-format metrics, summed across all gunicorn workers."""
+    if Config.METRICS_TOKEN:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth, f"Bearer {Config.METRICS_TOKEN}"):
+            return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.registry.render(), content_type="text/plain; version=0.0.4")
+
+
+# ─── Admin: request profiles (see profiling.py) ───
+def _admin_error():
+    auth = request.headers.get("Authorization", "")
+    if not Config.ADMIN_TOKEN:
+        return jsonify({"error": "Admin routes are disabled"}), 404
+    if not profiling.is_admin(auth[7:] if auth.startswith("Bearer ") else ""):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    """Stored request profiles, newest first."""
+    error = _admin_error()
+    if error:
+        return error
+    return jsonify({"profiles": profiling.list_profiles(), "armed": profiling.armed()})
+
+
+@app.route("/admin/profiles/<profile_id>")
+def admin_profile(profile_id):
+    """A profile as folded stacks, ready for flamegraph.pl or speedscope."""
+    error = _admin_error()
+    if error:
+        return error
+    path = profiling.profile_path(profile_id)
+    if not path:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(
+        path,
+        mimetype="text/plain",
+        as_attachment=True,
+        download_name=f"{profile_id}.folded",
+    )
+
+
+@app.route("/admin/profile/arm", methods=["POST", "DELETE"])
+def admin_profile_arm():
+    """Profile the next ``count`` requests to ``route`` ("*" for any), or disarm."""
+    error = _admin_error()
+    if error:
+        return error
+    if request.method == "DELETE":
+        return jsonify({"armed": profiling.disarm()})
+    data = request.get_json(silent=True) or {}
+    route = str(data.get("route") or "*")
+    try:
+        count = max(1, min(int(data.get("count", 1)), 100))
+    except (TypeError, ValueError):
+        return jsonify({"error": "count must be an integer"}), 400
+    return jsonify({"armed": profiling.arm(route, count)})
+
+
+@app.route("/admin/usage")
+def admin_usage():
+    """Daily LLM tokens and spend, optionally split by one dimension.
+
+    ``?days=7&by=model`` (by: endpoint, task, provider, model, api_key,
+    user_key). Other workers' calls appear once they have flushed.
+    """
+    error = _admin_error()
+    if error:
+        return error
+    group_by = request.args.get("by") or None
+    if group_by is not None and group_by not in USAGE_DIMENSIONS:
+        return (
+            jsonify({"error": f"by must be one of {', '.join(USAGE_DIMENSIONS)}"}),
+            400,
+        )
+    try:
+        days = max(1, min(int(request.args.get("days", 7)), 366))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    rows = usage_ledger.rollup(days, group_by)
+    return jsonify(
+        {
+            "days": days,
+            "by": group_by,
+            "rows": rows,
+            "total_cost_usd": round(sum(r["cost_usd"] for r in rows), 6),
         }
     )
 
@@ -845,20 +1705,21 @@ def api_status():
 # ─── Vocabulary Suggestion Endpoint ───
 @app.route("/vocab/suggest", methods=["POST"])
 def vocab_suggest():
-    """AI-powered vocabulary suggestions based on topic, level, and language."""
-    client = get_client()
-    if not client:
-        return jsonify({"error": "AI service unavailable"}), 503
+    """AI-powered vocabulary suggestions based on topic, level, and language.
 
+    Served from the vocabulary store; the LLM only tops up a list that holds
+    fewer words than requested.
+    """
     limited, _, _ = is_rate_limited(get_client_ip())
     if limited:
         return jsonify({"error": "Too many requests. Please slow down."}), 429
 
     data = request.json or {}
     topic = str(data.get("topic", "daily life"))[:100]
-    level = str(data.get("level", "intermediate"))
+    level = str(data.get("level", "intermediate"))[:20]
     language = str(data.get("language", "en"))[:5]
     count = min(int(data.get("count", 8)), 15)
+    sample = bool(data.get("shuffle", False))
 
     lang_names = {
         "en": "English",
@@ -870,53 +1731,215 @@ def vocab_suggest():
     }
     lang_name = lang_names.get(language, "English")
 
-    cache_key = _cache_key("vocab_suggest", topic, level, language, str(count))
-    cached = _cache_get(cache_key)
-    if cached:
-        resp = jsonify(cached)
-        resp.headers["X-Cache"] = "HIT"
+    def respond(words, cache_status):
+        resp = jsonify(
+            {"words": words, "topic": topic, "level": level, "language": language}
+        )
+        resp.headers["X-Cache"] = cache_status
+        metrics.CACHE_REQUESTS.inc(namespace="vocab", result=cache_status.lower())
         return resp
 
+    held = vocab_store.count(language, topic, level) if vocab_store else 0
+    if held >= count:
+        return respond(vocab_store.words(language, topic, level, count, sample), "HIT")
+
+    client = get_client("vocab")
+    if not client:
+        return jsonify({"error": "AI service unavailable"}), 503
+
+    missing = count - held
+    exclude = vocab_store.known_words(language, topic, level) if held else []
     prompt = (
-        f"Generate {count} useful {lang_name} vocabulary words for a {level} learner studying '{topic}'.\n"
+        f"Generate {missing} useful {lang_name} vocabulary words for a {level} learner studying '{topic}'.\n"
         f"Return ONLY a valid JSON array. Each item must have:\n"
         f'  "word": the word in {lang_name}\n'
         f'  "translation": English translation\n'
         f'  "example": short natural sentence using the word in {lang_name}\n'
         f'  "tip": one memory tip or usage note (in English)\n'
-        f"No markdown, no extra text — only the JSON array."
     )
+    if exclude:
+        prompt += f"Do NOT include any of these words: {', '.join(exclude)}\n"
+    prompt += "No markdown, no extra text — only the JSON array."
 
     try:
-        completion = client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        words = generate_json(
+            client,
+            "vocab_suggest",
+            prompt,
+            model=client.model,
             temperature=0.5,
             max_tokens=900,
         )
-        raw = (completion.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-            raw = raw.strip("`").strip()
-        words = json.loads(raw)
-        result = {"words": words, "topic": topic, "level": level, "language": language}
-        _cache_set(cache_key, result, ttl=600)
-        return jsonify(result)
-    except json.JSONDecodeError as e:
+    except StructuredOutputError as e:
         logging.error(f"Vocab suggest JSON parse error: {e}")
         return jsonify({"error": "Could not parse vocabulary. Try again."}), 500
     except Exception as e:
         logging.error(f"Vocab suggest error: {e}")
         return jsonify({"error": "Could not generate vocabulary."}), 500
 
+    if vocab_store is None:
+        return respond(words[:count], "MISS")
+    vocab_store.add(language, topic, level, words)
+    return respond(
+        vocab_store.words(language, topic, level, count, sample),
+        "PARTIAL" if held else "MISS",
+    )
+
+
+# ─── Grammar / Pronunciation Prompts (shared by single and batch endpoints) ───
+BASIC_LANG_NAMES = {
+    "en": "English",
+    "fr": "French",
+    "es": "Spanish",
+    "de": "German",
+    "ar": "Arabic",
+    "it": "Italian",
+}
+
+_GRAMMAR_FIELDS = (
+    '  "is_correct": boolean\n'
+    '  "corrected": the fully corrected version (same as input if no errors)\n'
+    '  "errors": array of {"original": str, "corrected": str, "explanation": str}\n'
+    '  "score": integer 1-10 (grammar quality)\n'
+    '  "tip": one concise improvement tip\n'
+)
+
+_PRONUNCIATION_FIELDS = (
+    '  "word": the word\n'
+    '  "ipa": IPA phonetic transcription\n'
+    '  "phonetic": simple phonetic spelling (e.g. SEE-ren-DIP-ih-tee)\n'
+    '  "tips": array of 2-3 short tips for native English speakers to pronounce it correctly\n'
+    '  "similar_sound": an English word that has a similar sound (if applicable)\n'
+)
+
+
+def _grammar_prompt(text, lang_name):
+    return (
+        f"You are a {lang_name} grammar expert. Analyze this text and return a grammar check report.\n\n"
+        f'Text: "{text}"\n\n'
+        f"Return ONLY valid JSON with these fields:\n"
+        + _GRAMMAR_FIELDS
+        + "No markdown, no extra text."
+    )
+
+
+def _grammar_batch_prompt(texts, lang_name):
+    numbered = "\n".join(f'{i}. "{t}"' for i, t in enumerate(texts, 1))
+    return (
+        f"You are a {lang_name} grammar expert. Analyze each of these {len(texts)} texts independently.\n\n"
+        f"{numbered}\n\n"
+        f"Return ONLY a valid JSON array with exactly {len(texts)} reports, one per text, in the same order. "
+        f"Each report has these fields:\n"
+        + _GRAMMAR_FIELDS
+        + "No markdown, no extra text."
+    )
+
+
+def _pronunciation_prompt(word, lang_name):
+    return (
+        f'Give a pronunciation guide for the {lang_name} word or phrase: "{word}".\n'
+        f"Return ONLY valid JSON:\n"
+        + _PRONUNCIATION_FIELDS
+        + "No markdown, no extra text."
+    )
+
+
+def _pronunciation_batch_prompt(words, lang_name):
+    numbered = "\n".join(f'{i}. "{w}"' for i, w in enumerate(words, 1))
+    return (
+        f"Give a pronunciation guide for each of these {len(words)} {lang_name} words or phrases:\n"
+        f"{numbered}\n\n"
+        f"Return ONLY a valid JSON array with exactly {len(words)} guides, one per word, in the same order. "
+        f"Each guide has these fields:\n"
+        + _PRONUNCIATION_FIELDS
+        + "No markdown, no extra text."
+    )
+
+
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?…؟。]+[\"'”’)\]]*(?=\s|$)|$)", re.S)
+
+
+def split_sentences(text):
+    """Split ``text`` into ``(start, end, sentence)`` spans."""
+    return [(m.start(), m.end(), m.group()) for m in _SENTENCE_RE.finditer(text)]
+
+
+def _normalize_grammar_report(report):
+    """A grammar report with the field types ``_merge_grammar_reports`` needs.
+
+    The schema lets the model send ``null`` for optional fields; those (and
+    wrongly typed values) fall back to defaults before the report is cached.
+    """
+    is_correct = report.get("is_correct")
+    is_correct = is_correct if isinstance(is_correct, bool) else True
+    score = report.get("score")
+    if not isinstance(score, int) or isinstance(score, bool):
+        score = 10 if is_correct else 5
+    errors = report.get("errors")
+    return dict(
+        report,
+        is_correct=is_correct,
+        corrected=report.get("corrected") or "",
+        errors=(
+            [e for e in errors if isinstance(e, dict)]
+            if isinstance(errors, list)
+            else []
+        ),
+        score=score,
+        tip=report.get("tip") or "",
+    )
+
+
+def _merge_grammar_reports(text, sentences, reports):
+    """Merge per-sentence grammar reports into one report for the whole text.
+
+    Errors gain ``sentence``, ``offset`` and ``length`` fields locating them in
+    the original text; the score is the length-weighted average. Reports go through
+    ``_normalize_grammar_report`` first (a no-op for ones already normalized).
+    """
+    reports = {i: _normalize_grammar_report(r) for i, r in reports.items()}
+    corrected, errors, spans = [], [], []
+    prev_end, weighted, worst = 0, 0, None
+    for i, (start, end, sentence) in enumerate(sentences):
+        report = reports[i]
+        corrected.append(text[prev_end:start])
+        corrected.append(report["corrected"] or sentence)
+        prev_end = end
+
+        is_correct, score = report["is_correct"], report["score"]
+        weighted += score * len(sentence)
+        if not is_correct and (worst is None or score < worst[0]):
+            worst = (score, report["tip"])
+
+        for err in report["errors"]:
+            original = str(err.get("original") or "")
+            pos = sentence.find(original) if original else -1
+            offset, length = (
+                (start + pos, len(original)) if pos >= 0 else (start, end - start)
+            )
+            errors.append(dict(err, sentence=i, offset=offset, length=length))
+        spans.append(
+            {"start": start, "end": end, "is_correct": is_correct, "score": score}
+        )
+    corrected.append(text[prev_end:])
+
+    total = sum(len(s) for _, _, s in sentences) or 1
+    first_tip = next((r["tip"] for r in reports.values() if r["tip"]), "")
+    return {
+        "is_correct": all(span["is_correct"] for span in spans),
+        "corrected": "".join(corrected),
+        "errors": errors,
+        "score": round(weighted / total),
+        "tip": worst[1] if worst and worst[1] else first_tip,
+        "sentences": spans,
+    }
+
 
 # ─── Grammar Check Endpoint ───
 @app.route("/grammar/check", methods=["POST"])
 def grammar_check():
     """Check a sentence or paragraph for grammar errors and return corrections."""
-    client = get_client()
+    client = get_client("grammar")
     if not client:
         return jsonify({"error": "AI service unavailable"}), 503
 
@@ -933,67 +1956,56 @@ def grammar_check():
     if len(text) > 1000:
         return jsonify({"error": "Text too long (max 1000 characters)"}), 400
 
-    lang_names = {
-        "en": "English",
-        "fr": "French",
-        "es": "Spanish",
-        "de": "German",
-        "ar": "Arabic",
-        "it": "Italian",
-    }
-    lang_name = lang_names.get(language, "English")
-
-    cache_key = _cache_key("grammar", text[:200], language)
-    cached = _cache_get(cache_key)
-    if cached:
-        resp = jsonify(cached)
-        resp.headers["X-Cache"] = "HIT"
-        return resp
+    lang_name = BASIC_LANG_NAMES.get(language, "English")
 
-    prompt = (
-        f"You are a {lang_name} grammar expert. Analyze this text and return a grammar check report.\n\n"
-        f'Text: "{text}"\n\n'
-        f"Return ONLY valid JSON with these fields:\n"
-        f'  "is_correct": boolean\n'
-        f'  "corrected": the fully corrected version (same as input if no errors)\n'
-        f'  "errors": array of {{"original": str, "corrected": str, "explanation": str}}\n'
-        f'  "score": integer 1-10 (grammar quality)\n'
-        f'  "tip": one concise improvement tip\n'
-        f"No markdown, no extra text."
-    )
+    # Check sentence by sentence so re-checking an edited paragraph only
+    # costs LLM time for the sentences that changed.
+    sentences = split_sentences(text)
+    reports = {}
+    futures = {}
+    for i, (_, _, sentence) in enumerate(sentences):
+        cached = _cache_get(
+            _cache_key("grammar_sentence", sentence, language), "grammar"
+        )
+        if cached:
+            reports[i] = cached
+        elif sentence not in futures:
+            futures[sentence] = _llm_pool.submit(
+                _batch_call, client, "grammar", [sentence], lang_name
+            )
+    misses = sum(1 for i in range(len(sentences)) if i not in reports)
 
     try:
-        completion = client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=600,
-        )
-        raw = (completion.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-            raw = raw.strip("`").strip()
-        result = json.loads(raw)
-        _cache_set(cache_key, result, ttl=300)
-        return jsonify(result)
-    except json.JSONDecodeError as e:
+        for sentence, fut in futures.items():
+            report = fut.result()[0]
+            _cache_set(
+                _cache_key("grammar_sentence", sentence, language), report, ttl=600
+            )
+            for i, (_, _, s) in enumerate(sentences):
+                if s == sentence:
+                    reports[i] = report
+        merged = _merge_grammar_reports(text, sentences, reports)
+    except StructuredOutputError as e:
         logging.error(f"Grammar check JSON parse error: {e}")
         return jsonify({"error": "Could not parse grammar check response."}), 500
     except Exception as e:
         logging.error(f"Grammar check error: {e}")
         return jsonify({"error": "Grammar check failed. Try again."}), 500
 
+    resp = jsonify(merged)
+    if not misses:
+        resp.headers["X-Cache"] = "HIT"
+    elif misses < len(sentences):
+        resp.headers["X-Cache"] = "PARTIAL"
+    else:
+        resp.headers["X-Cache"] = "MISS"
+    return resp
+
 
 # ─── Pronunciation Tip Endpoint ───
 @app.route("/pronunciation/tip", methods=["POST"])
 def pronunciation_tip():
     """Get pronunciation tips for a word or phrase."""
-    client = get_client()
-    if not client:
-        return jsonify({"error": "AI service unavailable"}), 503
-
     limited, _, _ = is_rate_limited(get_client_ip())
     if limited:
         return jsonify({"error": "Too many requests."}), 429
@@ -1005,55 +2017,301 @@ def pronunciation_tip():
     if not word:
         return jsonify({"error": "No word provided"}), 400
 
+    # Offline lexicon (CMUdict for English) plus previously generated overlay
+    known = pronunciation_lexicon.lookup(word, language)
+    metrics.CACHE_REQUESTS.inc(namespace="lexicon", result="hit" if known else "miss")
+    if known:
+        resp = jsonify(known)
+        resp.headers["X-Cache"] = "LEXICON"
+        return resp
+
     cache_key = _cache_key("pron_tip", word.lower(), language)
-    cached = _cache_get(cache_key)
+    cached = _cache_get(cache_key, "pron_tip")
     if cached:
         resp = jsonify(cached)
         resp.headers["X-Cache"] = "HIT"
         return resp
 
-    lang_names = {
-        "en": "English",
-        "fr": "French",
-        "es": "Spanish",
-        "de": "German",
-        "ar": "Arabic",
-        "it": "Italian",
-    }
-    lang_name = lang_names.get(language, "English")
+    client = get_client("pronunciation")
+    if not client:
+        return jsonify({"error": "AI service unavailable"}), 503
 
-    prompt = (
-        f'Give a pronunciation guide for the {lang_name} word or phrase: "{word}".\n'
-        f"Return ONLY valid JSON:\n"
-        f'  "word": the word\n'
-        f'  "ipa": IPA phonetic transcription\n'
-        f'  "phonetic": simple phonetic spelling (e.g. SEE-ren-DIP-ih-tee)\n'
-        f'  "tips": array of 2-3 short tips for native English speakers to pronounce it correctly\n'
-        f'  "similar_sound": an English word that has a similar sound (if applicable)\n'
-        f"No markdown, no extra text."
-    )
+    lang_name = BASIC_LANG_NAMES.get(language, "English")
+
+    prompt = _pronunciation_prompt(word, lang_name)
 
     try:
-        completion = client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        result = generate_json(
+            client,
+            "pronunciation_tip",
+            prompt,
+            model=client.model,
             temperature=0.2,
             max_tokens=400,
         )
-        raw = (completion.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-            raw = raw.strip("`").strip()
-        result = json.loads(raw)
         _cache_set(cache_key, result, ttl=3600)  # cache 1 hour
+        pronunciation_lexicon.remember(word, language, result)
         return jsonify(result)
     except Exception as e:
         logging.error(f"Pronunciation tip error: {e}")
         return jsonify({"error": "Could not generate pronunciation tip."}), 500
 
 
+# ─── Batch Grammar / Pronunciation Endpoint ───
+_BATCH_KINDS = {
+    "grammar": {
+        "field": "text",
+        "max_len": 1000,
+        "truncate": False,
+        "endpoint": "grammar_check",
+        "route": "grammar",
+        "chunk": 5,
+        "temperature": 0.1,
+        "max_tokens": 600,
+        "tokens_per_item": 350,
+        # Texts are checked per sentence, sharing /grammar/check's cache
+        "ttl": 600,
+        "key": lambda sentence, lang: _cache_key("grammar_sentence", sentence, lang),
+        "normalize": _normalize_grammar_report,
+        "prompt": _grammar_prompt,
+        "batch_prompt": _grammar_batch_prompt,
+    },
+    "pronunciation": {
+        "field": "word",
+        "max_len": 100,
+        "truncate": True,
+        "endpoint": "pronunciation_tip",
+        "route": "pronunciation",
+        "chunk": 10,
+        "temperature": 0.2,
+        "max_tokens": 400,
+        "tokens_per_item": 200,
+        "ttl": 3600,
+        "key": lambda word, lang: _cache_key("pron_tip", word.lower(), lang),
+        "normalize": None,
+        "prompt": _pronunciation_prompt,
+        "batch_prompt": _pronunciation_batch_prompt,
+    },
+}
+
+
+def _batch_call(client, kind, values, lang_name):
+    """One LLM call covering ``values``; returns one result per value, in order."""
+    spec = _BATCH_KINDS[kind]
+    if len(values) == 1:
+        results = [
+            generate_json(
+                client,
+                spec["endpoint"],
+                spec["prompt"](values[0], lang_name),
+                model=client.model,
+                temperature=spec["temperature"],
+                max_tokens=spec["max_tokens"],
+            )
+        ]
+    else:
+        results = generate_json(
+            client,
+            spec["endpoint"] + "_batch",
+            spec["batch_prompt"](values, lang_name),
+            model=client.model,
+            temperature=spec["temperature"],
+            max_tokens=spec["tokens_per_item"] * len(values) + 200,
+            schema={
+                "type": "array",
+                "minItems": len(values),
+                "items": SCHEMAS[spec["endpoint"]],
+            },
+        )
+        if len(results) != len(values):
+            raise StructuredOutputError(
+                f"expected {len(values)} results, got {len(results)}"
+            )
+    if spec["normalize"]:
+        results = [spec["normalize"](result) for result in results]
+    return results
+
+
+def _batch_units(kind, value):
+    """What an item is checked as: its sentences for grammar, else itself."""
+    if kind == "grammar":
+        return [sentence for _, _, sentence in split_sentences(value)]
+    return [value]
+
+
+def _batch_result(kind, value, found):
+    """An item's result from its units' results (``found``: unit -> result)."""
+    if kind == "grammar":
+        sentences = split_sentences(value)
+        reports = {i: found[sentence] for i, (_, _, sentence) in enumerate(sentences)}
+        return _merge_grammar_reports(value, sentences, reports)
+    return found[value]
+
+
+def _run_batch(items, language):
+    """Yield one result dict per item as soon as it is available.
+
+    Grammar texts are checked sentence by sentence and merged exactly like
+    /grammar/check, sharing its per-sentence cache. Items answered from the
+    cache are yielded first; the missing units are de-duplicated, coalesced
+    into a few multi-item LLM calls and fanned out over the bounded worker
+    pool. A coalesced call that fails is retried one unit per call.
+    """
+    lang_name = BASIC_LANG_NAMES.get(language, "English")
+    groups = {}  # (kind, unit) -> item indexes waiting for that result
+    found = {}  # item index -> {unit: result}
+    missing = {}  # item index -> units still to come
+    for i, (kind, value) in enumerate(items):
+        if kind == "pronunciation":
+            known = pronunciation_lexicon.lookup(value, language)
+            if known:
+                yield {"index": i, "type": kind, "result": known, "cached": True}
+                continue
+        key = _BATCH_KINDS[kind]["key"]
+        found[i] = {}
+        for unit in _batch_units(kind, value):
+            cached = _cache_get(key(unit, language), kind)
+            if cached:
+                found[i][unit] = cached
+            else:
+                missing.setdefault(i, set()).add(unit)
+                groups.setdefault((kind, unit), []).append(i)
+        if i not in missing:
+            result = _batch_result(kind, value, found[i])
+            yield {"index": i, "type": kind, "result": result, "cached": True}
+    if not groups:
+        return
+
+    clients = {kind: get_client(_BATCH_KINDS[kind]["route"]) for kind, _ in groups}
+    for i in [i for i in missing if not clients[items[i][0]]]:
+        del missing[i]
+        yield {"index": i, "type": items[i][0], "error": "AI service unavailable"}
+
+    futures = {}
+    for kind, client in clients.items():
+        if not client:
+            continue
+        spec = _BATCH_KINDS[kind]
+        units = [u for (k, u) in groups if k == kind]
+        for start in range(0, len(units), spec["chunk"]):
+            chunk = units[start : start + spec["chunk"]]
+            fut = _llm_pool.submit(_batch_call, client, kind, chunk, lang_name)
+            futures[fut] = (kind, chunk)
+
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for fut in done:
+            kind, chunk = futures.pop(fut)
+            try:
+                results = fut.result()
+            except Exception as e:
+                if len(chunk) > 1:
+                    logging.warning(f"Batch {kind} call failed, splitting: {e}")
+                    for unit in chunk:
+                        single = _llm_pool.submit(
+                            _batch_call, clients[kind], kind, [unit], lang_name
+                        )
+                        futures[single] = (kind, [unit])
+                    continue
+                logging.error(f"Batch {kind} item failed: {e}")
+                for i in groups[(kind, chunk[0])]:
+                    if missing.pop(i, None) is not None:
+                        yield {
+                            "index": i,
+                            "type": kind,
+                            "error": "Could not check item.",
+                        }
+                continue
+            spec = _BATCH_KINDS[kind]
+            for unit, result in zip(chunk, results):
+                _cache_set(spec["key"](unit, language), result, ttl=spec["ttl"])
+                if kind == "pronunciation":
+                    pronunciation_lexicon.remember(unit, language, result)
+                for i in groups[(kind, unit)]:
+                    if i not in missing:
+                        continue  # another unit of this item failed
+                    found[i][unit] = result
+                    missing[i].discard(unit)
+                    if not missing[i]:
+                        del missing[i]
+                        result_i = _batch_result(kind, items[i][1], found[i])
+                        yield {
+                            "index": i,
+                            "type": kind,
+                            "result": result_i,
+                            "cached": False,
+                        }
+
+
+@app.route("/batch", methods=["POST"])
+def batch_check():
+    """Grammar checks and pronunciation tips for many items in one request.
+
+    Body: ``{"items": [{"type": "grammar", "text": ...},
+    {"type": "pronunciation", "word": ...}], "language": "en", "stream": false}``.
+    With ``stream`` (or ``Accept: text/event-stream``) results are sent as SSE
+    events in completion order; otherwise they are returned in item order.
+    """
+    limited, _, _ = is_rate_limited(get_client_ip())
+    if limited:
+        return jsonify({"error": "Too many requests. Please slow down."}), 429
+
+    data = request.json or {}
+    raw_items = data.get("items", [])
+    language = str(data.get("language", "en"))[:5]
+
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({"error": "No items provided"}), 400
+    if len(raw_items) > Config.BATCH_MAX_ITEMS:
+        return (
+            jsonify({"error": f"Too many items (max {Config.BATCH_MAX_ITEMS})"}),
+            400,
+        )
+
+    items = []
+    for raw in raw_items:
+        spec = _BATCH_KINDS.get(raw.get("type")) if isinstance(raw, dict) else None
+        if not spec:
+            return jsonify({"error": "Item type must be grammar or pronunciation"}), 400
+        value = str(raw.get(spec["field"], "")).strip()
+        if spec["truncate"]:
+            value = value[: spec["max_len"]]
+        if not value or len(value) > spec["max_len"]:
+            return (
+                jsonify(
+                    {
+                        "error": f"Each {raw['type']} item needs a {spec['field']} "
+                        f"of at most {spec['max_len']} characters"
+                    }
+                ),
+                400,
+            )
+        items.append((raw["type"], value))
+
+    wants_stream = bool(data.get("stream")) or "text/event-stream" in (
+        request.headers.get("Accept", "")
+    )
+    if wants_stream:
+
+        def generate():
+            for result in _run_batch(items, language):
+                yield f"data: {json.dumps(result)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(
+            stream_with_context(generate()),
+            content_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+            },
+        )
+
+    results = sorted(_run_batch(items, language), key=lambda r: r["index"])
+    return jsonify({"results": results, "count": len(results)})
+
+
 # ─── Daily Challenge Endpoint ───
 @app.route("/challenge/daily", methods=["GET"])
 def daily_challenge():
@@ -1061,14 +2319,14 @@ def daily_challenge():
     level = request.args.get("level", "intermediate")
     language = request.args.get("language", "en")
 
-    client = get_client()
+    client = get_client("challenge")
     if not client:
         return jsonify({"error": "AI service unavailable"}), 503
 
     # Use date as seed for consistent daily challenge
     today = time.strftime("%Y-%m-%d")
     cache_key = _cache_key("daily_challenge", today, level, language)
-    cached = _cache_get(cache_key)
+    cached = _cache_get(cache_key, "daily_challenge")
     if cached:
         resp = jsonify(cached)
         resp.headers["X-Cache"] = "HIT"
@@ -1096,19 +2354,14 @@ def daily_challenge():
     )
 
     try:
-        completion = client.chat.completions.create(
-            model=Config.MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+        result = generate_json(
+            client,
+            "daily_challenge",
+            prompt,
+            model=client.model,
             temperature=0.8,
             max_tokens=300,
         )
-        raw = (completion.choices[0].message.content or "").strip()
-        if raw.startswith("```"):
-            raw = raw.split("```")[1]
-            if raw.startswith("json"):
-                raw = raw[4:]
-            raw = raw.strip("`").strip()
-        result = json.loads(raw)
         result["date"] = today
         _cache_set(cache_key, result, ttl=86400)  # cache 24 hours
         return jsonify(result)
@@ -0,0 +1,287 @@
+"""
+Audio preprocessing for speech-to-text.
+
+Browser recordings arrive as 48 kHz (often stereo) Opus/WebM with long
+leading and trailing silence. Before they are uploaded to Whisper they are:
+
+1. decoded with ffmpeg to 16 kHz mono 16-bit PCM (what Whisper uses anyway)
+2. trimmed to the speech found by a simple energy-based voice-activity
+   detector, keeping a little padding around it
+3. re-encoded as low-bitrate Opus in Ogg
+
+so fewer bytes are uploaded and fewer audio seconds are billed. When ffmpeg
+is not installed, or anything fails, the original upload is used unchanged.
+
+``SpeechSegmenter`` applies the same voice-activity detection to a live PCM
+stream, cutting it into utterance segments for streaming transcription.
+"""
+
+import array
+import io
+import logging
+import math
+import shutil
+import subprocess
+import time
+import wave
+from collections import deque
+from typing import List, NamedTuple, Optional, Tuple
+
+from config import Config
+
+try:
+    import audioop  # C implementation of rms(); removed in Python 3.13
+except ImportError:
+    audioop = None
+
+logger = logging.getLogger("audio")
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+# Speech = frames this many dB above the noise floor, never below MIN_SPEECH_RMS
+SPEECH_DB_ABOVE_FLOOR = 12.0
+MIN_SPEECH_RMS = 300
+PAD_MS = 250  # kept before the first and after the last speech frame
+MIN_SPEECH_FRAMES = 3  # ignore clicks shorter than this
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+class PreparedAudio(NamedTuple):
+    data: bytes
+    filename: str
+    original_seconds: Optional[float]  # None when the audio was not decoded
+    speech_seconds: Optional[float]
+    silent: bool
+
+
+def _ffmpeg(args: List[str], data: bytes) -> bytes:
+    result = subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", *args],
+        input=data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=Config.AUDIO_FFMPEG_TIMEOUT,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode("utf-8", "replace").strip()[-300:])
+    return result.stdout
+
+
+def decode_pcm(data: bytes) -> bytes:
+    """Decode any container/codec ffmpeg understands to 16 kHz mono s16le."""
+    return _ffmpeg(
+        ["-i", "pipe:0", "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "pipe:1"],
+        data,
+    )
+
+
+def encode_opus(pcm: bytes) -> bytes:
+    """Encode 16 kHz mono s16le PCM as speech-tuned Opus in an Ogg container."""
+    return _ffmpeg(
+        [
+            "-f",
+            "s16le",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-i",
+            "pipe:0",
+            "-c:a",
+            "libopus",
+            "-b:a",
+            Config.AUDIO_OPUS_BITRATE,
+            "-application",
+            "voip",
+            "-f",
+            "ogg",
+            "pipe:1",
+        ],
+        pcm,
+    )
+
+
+def _frame_rms(pcm: bytes) -> List[float]:
+    frame_bytes = FRAME_SAMPLES * 2
+    usable = len(pcm) - len(pcm) % frame_bytes
+    if audioop is not None:
+        return [
+            float(audioop.rms(pcm[i : i + frame_bytes], 2))
+            for i in range(0, usable, frame_bytes)
+        ]
+    samples = array.array("h")
+    samples.frombytes(pcm[:usable])
+    return [
+        math.sqrt(sum(s * s for s in samples[i : i + FRAME_SAMPLES]) / FRAME_SAMPLES)
+        for i in range(0, len(samples), FRAME_SAMPLES)
+    ]
+
+
+def speech_bounds(pcm: bytes) -> Optional[Tuple[int, int]]:
+    """Byte range of ``pcm`` that contains speech (with padding), or None.
+
+    The noise floor is the 10th-percentile frame energy; frames sufficiently
+    louder than it count as speech, and runs shorter than
+    ``MIN_SPEECH_FRAMES`` are ignored as clicks. None means the clip never
+    gets louder than ``MIN_SPEECH_RMS``, i.e. it is silent.
+    """
+    rms = _frame_rms(pcm)
+    if not rms or max(rms) < MIN_SPEECH_RMS:
+        return None
+    floor = sorted(rms)[len(rms) // 10]
+    # Capped at half the peak so a clip with no pauses still counts as speech
+    threshold = max(
+        MIN_SPEECH_RMS,
+        min(floor * 10 ** (SPEECH_DB_ABOVE_FLOOR / 20), max(rms) / 2),
+    )
+
+    first = last = None
+    run = 0
+    for i, value in enumerate(rms):
+        if value >= threshold:
+            run += 1
+            if run == MIN_SPEECH_FRAMES:
+                if first is None:
+                    first = i - run + 1
+            if run >= MIN_SPEECH_FRAMES:
+                last = i
+        else:
+            run = 0
+    if first is None:
+        return None
+    pad = PAD_MS // FRAME_MS
+    start = max(0, first - pad) * FRAME_SAMPLES * 2
+    end = min(len(rms), last + 1 + pad) * FRAME_SAMPLES * 2
+    return start, end
+
+
+def enabled() -> bool:
+    return bool(Config.AUDIO_PREPROCESS and FFMPEG)
+
+
+def preprocess(data: bytes, filename: str) -> PreparedAudio:
+    """Return the audio to upload for ``data`` (see module docstring)."""
+    original = PreparedAudio(data, filename, None, None, False)
+    if not enabled() or not data:
+        return original
+    started = time.perf_counter()
+    try:
+        pcm = decode_pcm(data)
+        seconds = len(pcm) / (2 * SAMPLE_RATE)
+        bounds = speech_bounds(pcm)
+        if bounds is None:
+            return PreparedAudio(b"", filename, seconds, 0.0, True)
+        speech = pcm[bounds[0] : bounds[1]]
+        encoded = encode_opus(speech)
+    except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Audio preprocessing failed, sending original: {e}")
+        return original
+
+    speech_seconds = len(speech) / (2 * SAMPLE_RATE)
+    if len(encoded) >= len(data) and speech_seconds >= seconds:
+        return original._replace(original_seconds=seconds, speech_seconds=seconds)
+    logger.debug(
+        f"Audio {len(data)}B/{seconds:.1f}s -> {len(encoded)}B/{speech_seconds:.1f}s "
+        f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+    return PreparedAudio(encoded, "audio.ogg", seconds, speech_seconds, False)
+
+
+def pcm_to_wav(pcm: bytes) -> bytes:
+    """Wrap 16 kHz mono s16le PCM in a WAV container (no ffmpeg needed)."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+
+class SpeechSegmenter:
+    """Cut a live 16 kHz mono s16le stream into speech segments.
+
+    ``feed()`` returns ``(start_seconds, pcm)`` for each segment completed by
+    the new audio: a segment ends after ``silence_ms`` of silence following
+    speech, or when it reaches ``max_segment_s``. Each segment keeps
+    ``PAD_MS`` of audio around the speech. The noise floor adapts to the
+    frames classified as silence.
+    """
+
+    FLOOR_ALPHA = 0.05
+
+    def __init__(self, silence_ms: int = None, max_segment_s: float = None):
+        silence_ms = silence_ms or Config.STT_SEGMENT_SILENCE_MS
+        max_segment_s = max_segment_s or Config.STT_MAX_SEGMENT_S
+        self._silence_frames = max(1, silence_ms // FRAME_MS)
+        self._max_frames = int(max_segment_s * 1000 // FRAME_MS)
+        self._pad_frames = PAD_MS // FRAME_MS
+        self._partial = b""
+        self._preroll: deque = deque(maxlen=self._pad_frames)
+        self._segment: List[bytes] = []
+        self._speech_frames = 0
+        self._silent_run = 0
+        self._floor: Optional[float] = None
+        self._frames_seen = 0
+        self._start_frame = 0
+
+    def _is_speech(self, frame: bytes) -> bool:
+        rms = _frame_rms(frame)[0]
+        if self._floor is None:
+            self._floor = rms
+        threshold = max(
+            MIN_SPEECH_RMS, self._floor * 10 ** (SPEECH_DB_ABOVE_FLOOR / 20)
+        )
+        speech = rms >= threshold
+        if not speech:
+            self._floor += self.FLOOR_ALPHA * (rms - self._floor)
+        return speech
+
+    def _close_segment(self) -> Optional[Tuple[float, bytes]]:
+        # Drop the silence beyond the padding at the end
+        keep = len(self._segment) - max(0, self._silent_run - self._pad_frames)
+        segment = b"".join(self._segment[:keep])
+        enough = self._speech_frames >= MIN_SPEECH_FRAMES
+        self._segment, self._speech_frames, self._silent_run = [], 0, 0
+        return (self._start_frame * FRAME_MS / 1000, segment) if enough else None
+
+    def feed(self, pcm: bytes) -> List[Tuple[float, bytes]]:
+        segments = []
+        data = self._partial + pcm
+        frame_bytes = FRAME_SAMPLES * 2
+        usable = len(data) - len(data) % frame_bytes
+        self._partial = data[usable:]
+        for i in range(0, usable, frame_bytes):
+            frame = data[i : i + frame_bytes]
+            self._frames_seen += 1
+            speech = self._is_speech(frame)
+            if not self._segment:
+                if not speech:
+                    self._preroll.append(frame)
+                    continue
+                self._start_frame = self._frames_seen - 1 - len(self._preroll)
+                self._segment.extend(self._preroll)
+                self._preroll.clear()
+            self._segment.append(frame)
+            if speech:
+                self._speech_frames += 1
+                self._silent_run = 0
+            else:
+                self._silent_run += 1
+            if (
+                self._silent_run >= self._silence_frames
+                or len(self._segment) >= self._max_frames
+            ):
+                segment = self._close_segment()
+                if segment:
+                    segments.append(segment)
+        return segments
+
+    def flush(self) -> Optional[Tuple[float, bytes]]:
+        """Close the segment in progress at the end of the stream."""
+        if not self._segment:
+            return None
+        return self._close_segment()
@@ -0,0 +1,146 @@
+"""
+Benchmark the /transcribe audio preprocessing (see audio.py).
+
+For each clip it reports the bytes uploaded before and after preprocessing,
+the audio seconds Whisper would bill, the preprocessing time and the
+estimated end-to-end latency difference (preprocessing time minus the upload
+time saved on a link of --uplink-mbps).
+
+    python benchmarks/audio_preprocess.py                 # synthetic clips
+    python benchmarks/audio_preprocess.py rec1.webm ...   # your own recordings
+    python benchmarks/audio_preprocess.py --whisper       # also time Groq Whisper
+
+Synthetic clips imitate browser recordings: 48 kHz stereo Opus/WebM with a
+voice-band signal framed by leading and trailing near-silence. Requires
+ffmpeg on PATH.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio  # noqa: E402
+from config import Config  # noqa: E402
+
+# (name, leading silence s, speech s, trailing silence s)
+SYNTHETIC = [
+    ("short_reply", 1.5, 2.0, 2.0),
+    ("sentence", 1.0, 6.0, 1.5),
+    ("long_answer", 2.0, 20.0, 3.0),
+    ("late_start", 4.0, 3.0, 4.0),
+]
+
+
+def synth_clip(lead: float, speech: float, tail: float) -> bytes:
+    """Encode a WebM/Opus clip: quiet noise, a voice-like tone burst, quiet noise."""
+    total = lead + speech + tail
+    # Amplitude-modulated harmonics stand in for voiced speech
+    voice = (
+        "0.3*sin(2*PI*180*t)*(0.6+0.4*sin(2*PI*4*t))"
+        "+0.15*sin(2*PI*360*t)+0.08*sin(2*PI*720*t)"
+    )
+    expr = f"if(between(t,{lead},{lead + speech}),{voice},0)+0.002*(random(0)-0.5)"
+    return subprocess.run(
+        [
+            audio.FFMPEG,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            f"aevalsrc='{expr}|{expr}':s=48000:d={total}",
+            "-c:a",
+            "libopus",
+            "-b:a",
+            "96k",
+            "-f",
+            "webm",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+
+
+def time_whisper(data: bytes, filename: str) -> float:
+    from groq import Groq
+
+    client = Groq(api_key=Config.GROQ_API_KEYS[0])
+    started = time.perf_counter()
+    client.audio.transcriptions.create(
+        file=(filename, data), model="whisper-large-v3-turbo", temperature=0
+    )
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("clips", nargs="*", help="audio files (default: synthetic)")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--whisper", action="store_true", help="also time real Whisper calls"
+    )
+    args = parser.parse_args()
+
+    if not audio.FFMPEG:
+        sys.exit("ffmpeg not found on PATH")
+    if args.whisper and not Config.GROQ_API_KEYS:
+        sys.exit("--whisper needs GROQ_API_KEY")
+
+    if args.clips:
+        clips = []
+        for path in args.clips:
+            with open(path, "rb") as f:
+                clips.append((os.path.basename(path), f.read()))
+    else:
+        clips = [(name, synth_clip(*spec)) for name, *spec in SYNTHETIC]
+
+    bytes_per_ms = args.uplink_mbps * 1e6 / 8 / 1000
+    header = (
+        f"{'clip':<14}{'bytes in':>10}{'bytes out':>11}{'saved':>8}"
+        f"{'audio s':>9}{'speech s':>10}{'prep ms':>9}{'net ms':>9}"
+    )
+    if args.whisper:
+        header += f"{'whisper in':>12}{'whisper out':>13}"
+    print(header)
+
+    totals_in = totals_out = 0
+    for name, data in clips:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            prepared = audio.preprocess(data, name)
+            timings.append((time.perf_counter() - started) * 1000)
+        prep_ms = statistics.median(timings)
+        out_bytes = len(prepared.data)
+        upload_saved_ms = (len(data) - out_bytes) / bytes_per_ms
+        totals_in += len(data)
+        totals_out += out_bytes
+        row = (
+            f"{name:<14}{len(data):>10}{out_bytes:>11}"
+            f"{(1 - out_bytes / len(data)) * 100:>7.1f}%"
+            f"{prepared.original_seconds or 0:>9.1f}{prepared.speech_seconds or 0:>10.1f}"
+            f"{prep_ms:>9.1f}{prep_ms - upload_saved_ms:>+9.1f}"
+        )
+        if args.whisper:
+            before = time_whisper(data, name if "." in name else "audio.webm")
+            after = time_whisper(prepared.data, prepared.filename)
+            row += f"{before:>12.0f}{after:>13.0f}"
+        print(row)
+
+    print(
+        f"\ntotal: {totals_in} -> {totals_out} bytes "
+        f"({(1 - totals_out / max(totals_in, 1)) * 100:.1f}% saved); "
+        f"net ms = preprocessing time - upload time saved at {args.uplink_mbps:g} Mbit/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Micro-benchmarks of the pure-Python helpers that run on every request, with
+recorded baselines and a regression threshold.
+
+Covers ``build_system_prompt``, ``_cache_key`` / ``_cache_get`` /
+``_cache_set``, ``is_rate_limited``, ``get_client_ip``,
+``get_welcome_message``, the ``/exercises`` filter and the leaderboard sort,
+with realistic input sizes (a full response cache, a thousand tracked IPs,
+a few thousand leaderboard entries).
+
+    python benchmarks/micro.py --save              # record the baseline
+    python benchmarks/micro.py                     # compare; exit 1 on regression
+    python benchmarks/micro.py --threshold 15 -k cache
+
+Each case runs enough calls to take about --min-time per repeat and keeps
+the fastest of --repeat repeats, which is the least noisy estimate. Baselines
+are machine-specific; record them on the machine that compares against them.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix="echo-micro-")
+# Keep the benchmark away from the learner database, metrics and the network
+os.environ["DATA_DB_PATH"] = os.path.join(_workdir, "micro.db")
+os.environ["METRICS_DIR"] = os.path.join(_workdir, "metrics")
+os.environ["TRACE_SAMPLE_RATE"] = "0"
+for _key in ("GROQ_API_KEY", "NVIDIA_API_KEY"):
+    os.environ[_key] = ""
+
+import logging  # noqa: E402
+
+logging.disable(logging.WARNING)
+
+import app as echo  # noqa: E402
+from config import Config  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "micro.json")
+
+
+_pushed = []  # Flask contexts pushed by the current case
+
+
+def _push(ctx):
+    ctx.push()
+    _pushed.append(ctx)
+
+
+def _text(n: int, rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase + " ") for _ in range(n))
+
+
+# ─── Cases: each returns a zero-argument callable to time ───
+def case_build_system_prompt():
+    rng = random.Random(1)
+    levels = list(Config.DIFFICULTY_LEVELS)
+    topics = [t["id"] for t in Config.TOPICS]
+    languages = list(Config.LANGUAGES)
+    scenarios = [None] * 4 + [s["id"] for s in Config.SCENARIOS]
+    args = [
+        (rng.choice(levels), rng.choice(topics), rng.choice(languages), s)
+        for s in (rng.choice(scenarios) for _ in range(64))
+    ]
+    it = iter(range(1 << 62))
+    return lambda: echo.build_system_prompt(*args[next(it) % 64])
+
+
+def case_cache_key():
+    rng = random.Random(2)
+    messages = [_text(200, rng) for _ in range(64)]
+    it = iter(range(1 << 62))
+    return lambda: echo._cache_key(
+        messages[next(it) % 64], "intermediate", "travel", "en", ""
+    )
+
+
+def _fill_cache():
+    echo._response_cache.clear()
+    keys = [echo._cache_key("bench", i) for i in range(480)]
+    for key in keys:
+        echo._cache_set(key, {"response": "x" * 300})
+    return keys
+
+
+def case_cache_get_hit():
+    keys = _fill_cache()
+    it = iter(range(1 << 62))
+    return lambda: echo._cache_get(keys[next(it) % len(keys)])
+
+
+def case_cache_get_miss():
+    _fill_cache()
+    misses = [echo._cache_key("missing", i) for i in range(256)]
+    it = iter(range(1 << 62))
+    return lambda: echo._cache_get(misses[next(it) % 256])
+
+
+def case_cache_set():
+    # Around the 500-entry mark, where _cache_set starts pruning
+    keys = _fill_cache() + [echo._cache_key("extra", i) for i in range(40)]
+    it = iter(range(1 << 62))
+    return lambda: echo._cache_set(keys[next(it) % len(keys)], {"response": "y"})
+
+
+def case_is_rate_limited():
+    echo.rate_limits.clear()
+    echo.app.config["RATE_LIMIT"] = 10**9
+    now = time.time()
+    ips = [f"10.0.{i // 256}.{i % 256}" for i in range(1000)]
+    for ip in ips:
+        echo.rate_limits[ip] = [now - 50 + j * 2 for j in range(20)]
+    it = iter(range(1 << 62))
+
+    def call():
+        ip = ips[next(it) % 1000]
+        echo.is_rate_limited(ip)
+        echo.rate_limits[ip].pop()  # keep the window size steady
+
+    return call
+
+
+def case_get_client_ip():
+    ctx = echo.app.test_request_context(
+        "/chat",
+        headers={"X-Forwarded-For": "203.0.113.7, 10.0.0.2, 10.0.0.1"},
+        environ_base={"REMOTE_ADDR": "10.0.0.1"},
+    )
+    _push(ctx)
+    return echo.get_client_ip
+
+
+def case_get_welcome_message():
+    rng = random.Random(3)
+    topics = [t["id"] for t in Config.TOPICS] + ["free"]
+    scenarios = [None] * 4 + [s["id"] for s in Config.SCENARIOS]
+    args = [
+        (
+            rng.choice(topics),
+            rng.choice(list(Config.LANGUAGES)),
+            rng.choice(scenarios),
+            rng.choice(["", "Maria Lopez"]),
+        )
+        for _ in range(64)
+    ]
+    it = iter(range(1 << 62))
+    return lambda: echo.get_welcome_message(*args[next(it) % 64])
+
+
+def case_exercises_filter():
+    ctx = echo.app.test_request_context(
+        "/exercises?level=intermediate&type=all&count=10&language=en",
+        environ_base={"REMOTE_ADDR": "198.51.100.9"},
+    )
+    _push(ctx)
+    return echo.get_exercises
+
+
+def case_leaderboard_sort():
+    rng = random.Random(4)
+    echo._leaderboard.clear()
+    for i in range(5000):
+        echo._leaderboard[f"user{i}@example.com"] = {
+            "name": f"Learner {i}",
+            "xp": rng.randint(0, 100000),
+            "level": rng.randint(1, 50),
+            "flag": "\U0001f30d",
+        }
+    _push(echo.app.app_context())
+    return echo.get_leaderboard
+
+
+CASES = {
+    name[len("case_") :]: fn
+    for name, fn in globals().items()
+    if name.startswith("case_")
+}
+
+
+# ─── Timing ───
+def measure(fn, min_time: float, repeat: int) -> float:
+    """Nanoseconds per call: the fastest of ``repeat`` timed batches."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 5:
+            break
+        loops *= 4
+    loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter_ns() - start) / loops)
+    return best
+
+
+def _fmt_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} us"
+    return f"{ns:.0f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="record the results as the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("MICRO_BENCH_THRESHOLD", "20")),
+        help="allowed slowdown in percent before a case fails (default 20)",
+    )
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds")
+    parser.add_argument("-k", dest="filter", help="only cases containing this")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    results = {}
+    failed = []
+    print(f"{'case':<24}{'per call':>12}{'baseline':>12}{'change':>10}")
+    for name, setup in CASES.items():
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            ns = measure(setup(), args.min_time, args.repeat)
+        finally:
+            while _pushed:
+                _pushed.pop().pop()
+        results[name] = round(ns, 1)
+        base = baseline.get(name)
+        change = ""
+        if base:
+            pct = (ns - base) / base * 100
+            change = f"{pct:+.1f}%"
+            if pct > args.threshold:
+                failed.append(name)
+                change += " !"
+        print(
+            f"{name:<24}{_fmt_ns(ns):>12}"
+            f"{_fmt_ns(base) if base else '-':>12}{change:>10}"
+        )
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.platform(),
+                    "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nbaseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"\nno baseline at {args.baseline}; record one with --save")
+    elif failed:
+        print(
+            f"\n{len(failed)} case(s) regressed by more than {args.threshold:g}%: "
+            + ", ".join(failed)
+        )
+        sys.exit(1)
+    else:
+        print(f"\nno regression above {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
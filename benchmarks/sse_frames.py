@@ -0,0 +1,167 @@
+"""
+Frames per reply and CPU per stream for the SSE token path of /chat/stream.
+
+Compares, for replies arriving at a few model speeds:
+
+- ``per_token``: one ``json.dumps`` frame per model delta (the old path)
+- ``templates``: one frame per delta, built by ``sse.token_frame``
+- ``coalesced``: ``sse.coalesce`` + ``sse.token_frame`` (the current path)
+
+Arrival times are simulated with a fake clock, so the numbers do not depend
+on network or provider speed and no time is spent sleeping. CPU is the
+process time to turn one reply into frames (best of --repeat). "held" is the
+p95 / longest time a delta waited in the coalescing buffer.
+
+    python benchmarks/sse_frames.py
+    python benchmarks/sse_frames.py --tokens 500 --rates 80,800 --interval-ms 50
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sse  # noqa: E402
+from config import Config  # noqa: E402
+
+_TEXT = (
+    'Great job! You said "I goed to the shop" — the past tense of go is '
+    'irregular, so it should be "I went to the shop". Let\'s practise: what '
+    "did you buy there, and how much did it cost? Try to answer in two or "
+    "three sentences, using the past simple. ¡Muy bien! 👍 "
+)
+
+
+def make_reply(n_tokens: int, rng: random.Random) -> list:
+    """About four characters per token, like real model deltas."""
+    text = (_TEXT * (n_tokens * 4 // len(_TEXT) + 1))[: n_tokens * 4]
+    tokens, i = [], 0
+    while i < len(text):
+        step = rng.choice((1, 2, 3, 4, 4, 5, 6, 7))
+        tokens.append(text[i : i + step])
+        i += step
+    return tokens
+
+
+class SimulatedStream:
+    """Yields tokens while advancing a fake clock at ``rate`` tokens/s."""
+
+    def __init__(self, tokens, rate: float, rng: random.Random):
+        self.tokens = tokens
+        self.gaps = [rng.expovariate(rate) for _ in tokens]
+        self.now = 0.0
+        self.arrivals = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def __iter__(self):
+        self.now = 0.0
+        self.arrivals = []
+        for token, gap in zip(self.tokens, self.gaps):
+            self.now += gap
+            self.arrivals.append(self.now)
+            yield token
+
+
+def per_token(stream):
+    for token in stream:
+        yield f"data: {json.dumps({'token': token})}\n\n".encode("utf-8")
+
+
+def templates(stream):
+    for token in stream:
+        yield sse.token_frame(token)
+
+
+def coalesced(stream, interval_ms, max_chars):
+    for token in sse.coalesce(stream, interval_ms, max_chars, clock=stream.clock):
+        yield sse.token_frame(token)
+
+
+def held_ms(stream, tokens, interval_ms, max_chars) -> tuple:
+    """p95 and longest wait of a delta between arrival and its frame (ms)."""
+    lengths = [len(t) for t in tokens]
+    waits, i = [], 0
+    for piece in sse.coalesce(stream, interval_ms, max_chars, clock=stream.clock):
+        sent, size = stream.now, 0
+        while size < len(piece):
+            waits.append((sent - stream.arrivals[i]) * 1000)
+            size += lengths[i]
+            i += 1
+    waits.sort()
+    return waits[int(len(waits) * 0.95)], waits[-1]
+
+
+def cpu_per_stream(make_frames, repeat: int, loops: int) -> float:
+    """Microseconds of CPU to produce all frames of one reply."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(loops):
+            for _ in make_frames():
+                pass
+        best = min(best, (time.process_time() - start) / loops)
+    return best * 1e6
+
+
+def check_frames():
+    """token_frame must produce exactly the old frames."""
+    rng = random.Random(9)
+    alphabet = 'abc "\\\n\t/é€👍 <>&'
+    for _ in range(2000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        expected = f"data: {json.dumps({'token': text})}\n\n".encode("utf-8")
+        assert sse.token_frame(text) == expected, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=300, help="deltas per reply")
+    parser.add_argument(
+        "--rates", default="50,200,800", help="model speeds to simulate (tokens/s)"
+    )
+    parser.add_argument("--interval-ms", type=float, default=Config.SSE_COALESCE_MS)
+    parser.add_argument("--max-chars", type=int, default=Config.SSE_COALESCE_MAX_CHARS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--loops", type=int, default=200)
+    args = parser.parse_args()
+
+    check_frames()
+    rng = random.Random(1)
+    tokens = make_reply(args.tokens, rng)
+    print(
+        f"{len(tokens)} deltas per reply, coalescing {args.interval_ms:g} ms / "
+        f"{args.max_chars} chars\n"
+    )
+    print(
+        f"{'tokens/s':>9}  {'mode':<10}{'frames':>8}{'bytes':>9}"
+        f"{'CPU/stream':>13}{'held':>13}"
+    )
+    for rate in (float(r) for r in args.rates.split(",")):
+        stream = SimulatedStream(tokens, rate, rng)
+        modes = {
+            "per_token": lambda: per_token(stream),
+            "templates": lambda: templates(stream),
+            "coalesced": lambda: coalesced(stream, args.interval_ms, args.max_chars),
+        }
+        for name, make_frames in modes.items():
+            frames = list(make_frames())
+            cpu = cpu_per_stream(make_frames, args.repeat, args.loops)
+            held = "-"
+            if name == "coalesced":
+                p95, worst = held_ms(stream, tokens, args.interval_ms, args.max_chars)
+                held = f"{p95:.0f}/{worst:.0f} ms"
+            print(
+                f"{rate:>9g}  {name:<10}{len(frames):>8}"
+                f"{sum(map(len, frames)):>9}{cpu:>10.0f} us{held:>13}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare streaming transcription (WebSocket /transcribe/ws) with a one-shot
+upload to /transcribe, measuring the latency a learner perceives: the time
+from the end of speech to the final transcript.
+
+The utterance is synthetic 16 kHz mono PCM (three phrases separated by
+pauses), sent over the socket in real time. Run the app against the local
+stub so no Whisper calls are made:
+
+    python loadtest/stub_server.py --port 9100
+    GROQ_API_KEY=stub GROQ_BASE_URL=http://127.0.0.1:9100 \\
+        gunicorn -k gthread --threads 8 -b 127.0.0.1:7860 app:app
+    python benchmarks/stt_stream.py --url http://127.0.0.1:7860
+"""
+
+import argparse
+import array
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import requests
+import simple_websocket
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio  # noqa: E402
+
+CHUNK_MS = 100
+
+
+def synth_utterance(phrases=(2.0, 3.0, 1.5), pause=0.9) -> bytes:
+    rate = audio.SAMPLE_RATE
+    rng = random.Random(7)
+
+    def noise(seconds):
+        return [rng.randint(-40, 40) for _ in range(int(seconds * rate))]
+
+    def voice(seconds):
+        return [
+            int(
+                6000
+                * math.sin(2 * math.pi * 180 * i / rate)
+                * (0.6 + 0.4 * math.sin(2 * math.pi * 4 * i / rate))
+            )
+            for i in range(int(seconds * rate))
+        ]
+
+    samples = noise(0.5)
+    for length in phrases:
+        samples += voice(length) + noise(pause)
+    return array.array("h", samples).tobytes()
+
+
+def run_stream(url: str, pcm: bytes, language: str):
+    ws_url = url.replace("http", "ws", 1) + f"/transcribe/ws?language={language}"
+    ws = simple_websocket.Client.connect(ws_url)
+    chunk = audio.SAMPLE_RATE * 2 * CHUNK_MS // 1000
+    partials = []
+    started = time.perf_counter()
+    try:
+        for i in range(0, len(pcm), chunk):
+            ws.send(pcm[i : i + chunk])
+            # Pace like a microphone and collect whatever arrives meanwhile
+            deadline = started + (i + chunk) / (audio.SAMPLE_RATE * 2)
+            while True:
+                message = ws.receive(timeout=max(0.0, deadline - time.perf_counter()))
+                if message is None:
+                    break
+                event = json.loads(message)
+                if event["type"] == "partial":
+                    partials.append(time.perf_counter() - started)
+        speech_ended = time.perf_counter()
+        ws.send(json.dumps({"type": "end"}))
+        while True:
+            event = json.loads(ws.receive(timeout=30))
+            if event["type"] == "final":
+                return time.perf_counter() - speech_ended, event, partials
+            if event["type"] == "error":
+                raise RuntimeError(event["error"])
+    finally:
+        ws.close()
+
+
+def run_upload(url: str, pcm: bytes, language: str):
+    started = time.perf_counter()
+    r = requests.post(
+        f"{url}/transcribe",
+        files={"audio": ("utterance.wav", audio.pcm_to_wav(pcm), "audio/wav")},
+        data={"language": language},
+        timeout=60,
+    )
+    r.raise_for_status()
+    return time.perf_counter() - started, r.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:7860")
+    parser.add_argument("--language", default="en")
+    args = parser.parse_args()
+
+    pcm = synth_utterance()
+    seconds = len(pcm) / (2 * audio.SAMPLE_RATE)
+    print(f"utterance: {seconds:.1f}s of audio")
+
+    upload_s, result = run_upload(args.url, pcm, args.language)
+    print(f"one-shot /transcribe : {upload_s * 1000:7.0f} ms after speech end")
+
+    stream_s, final, partials = run_stream(args.url, pcm, args.language)
+    print(
+        f"streaming /transcribe/ws: {stream_s * 1000:7.0f} ms after speech end "
+        f"({final['segments']} segments, partials at "
+        f"{', '.join(f'{p:.1f}s' for p in partials) or '-'})"
+    )
+    print(f"final: {final['text']!r}")
+
+
+if __name__ == "__main__":
+    main()
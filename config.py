@@ -1,9 +1,24 @@
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
+def _merge_routes(defaults, overrides_json):
+    """Apply per-route overrides given as a JSON object on top of the defaults."""
+    routes = {name: dict(route) for name, route in defaults.items()}
+    for name, override in json.loads(overrides_json or "{}").items():
+        routes[name] = dict(routes.get(name, routes["default"]), **override)
+    return routes
+
+
+def _env_url(name, default):
+    """Base URL from the environment (empty means unset), without trailing /."""
+    return (os.environ.get(name) or default).rstrip("/")
+
+
 class Config:
     """Application configuration loaded from environment variables."""
 
@@ -32,13 +47,19 @@ class Config:
     AI_PROVIDER = os.environ.get("AI_PROVIDER", "groq" if GROQ_API_KEYS else "nvidia")
 
     # --- Provider-specific settings ---
+    # GROQ_BASE_URL / NVIDIA_BASE_URL point the clients elsewhere, e.g. at
+    # the local stub server used by the load tests (loadtest/stub_server.py)
     PROVIDERS = {
         "groq": {
-            "base_url": "https://api.groq.com/openai/v1",
+            "base_url": _env_url("GROQ_BASE_URL", "https://api.groq.com")
+            + "/openai/v1",
             "model": "llama-3.3-70b-versatile",
+            "fast_model": "llama-3.1-8b-instant",
         },
         "nvidia": {
-            "base_url": "https://integrate.api.nvidia.com/v1",
+            "base_url": _env_url(
+                "NVIDIA_BASE_URL", "https://integrate.api.nvidia.com/v1"
+            ),
             "model": "nvidia/llama-3.1-nemotron-nano-4b-v1.1",
         },
     }
@@ -46,14 +67,155 @@ class Config:
     # Active provider config
     OPENAI_API_BASE_URL = PROVIDERS.get(AI_PROVIDER, PROVIDERS["groq"])["base_url"]
     MODEL_NAME = PROVIDERS.get(AI_PROVIDER, PROVIDERS["groq"])["model"]
+    FAST_MODEL_NAME = PROVIDERS.get(AI_PROVIDER, PROVIDERS["groq"]).get(
+        "fast_model", MODEL_NAME
+    )
+
+    # --- Model routing ---
+    # Provider/model per task, with a faster fallback used when the latency
+    # budget (ms until the reply starts arriving) is at risk. Override any
+    # route with MODEL_ROUTES='{"grammar": {"model": "...", "budget_ms": 2000}}'.
+    MODEL_ROUTES = {
+        "default": {
+            "model": MODEL_NAME,
+            "fallback": FAST_MODEL_NAME,
+            "budget_ms": 5000,
+        },
+        "chat": {"model": MODEL_NAME, "fallback": FAST_MODEL_NAME, "budget_ms": 2500},
+        "story": {"model": MODEL_NAME, "fallback": FAST_MODEL_NAME, "budget_ms": 6000},
+        "grammar": {
+            "model": MODEL_NAME,
+            "fallback": FAST_MODEL_NAME,
+            "budget_ms": 3000,
+        },
+        "pronunciation": {"model": FAST_MODEL_NAME, "budget_ms": 1500},
+        "vocab": {"model": MODEL_NAME, "fallback": FAST_MODEL_NAME, "budget_ms": 4000},
+        "challenge": {"model": FAST_MODEL_NAME, "budget_ms": 2000},
+        "exercises": {
+            "model": MODEL_NAME,
+            "fallback": FAST_MODEL_NAME,
+            "budget_ms": 5000,
+        },
+    }
+    MODEL_ROUTES = _merge_routes(MODEL_ROUTES, os.environ.get("MODEL_ROUTES"))
 
     # Generation defaults
     MAX_TOKENS = int(os.environ.get("MAX_TOKENS", "1024"))
     TEMPERATURE = float(os.environ.get("TEMPERATURE", "0.7"))
 
+    # Ask providers for JSON mode on structured (JSON) endpoints
+    LLM_JSON_MODE = os.environ.get("LLM_JSON_MODE", "True").lower() in [
+        "true",
+        "1",
+        "t",
+    ]
+
+    # Streamed replies: join model deltas arriving within this many ms (or
+    # until this many characters) into one SSE token event; 0 disables
+    SSE_COALESCE_MS = float(os.environ.get("SSE_COALESCE_MS", "30"))
+    SSE_COALESCE_MAX_CHARS = int(os.environ.get("SSE_COALESCE_MAX_CHARS", "120"))
+    # Resumable /chat/stream (stream_buffer.py): events are shared with other
+    # workers through DATA_DB_PATH every STREAM_FLUSH_MS, kept for
+    # STREAM_BUFFER_TTL s, and a stream whose worker has been silent for
+    # STREAM_STALE_S s is given up on
+    STREAM_FLUSH_MS = float(os.environ.get("STREAM_FLUSH_MS", "100"))
+    STREAM_BUFFER_TTL = int(os.environ.get("STREAM_BUFFER_TTL", "300"))
+    STREAM_STALE_S = float(os.environ.get("STREAM_STALE_S", "10"))
+    # A generation with no reader for this long is cancelled upstream
+    STREAM_RESUME_GRACE_S = float(os.environ.get("STREAM_RESUME_GRACE_S", "10"))
+    # Server-held chat sessions (sessions.py): idle lifetime (s), messages
+    # kept per session, and sessions cached in memory per worker
+    SESSION_TTL = int(os.environ.get("SESSION_TTL", "86400"))
+    SESSION_MAX_MESSAGES = int(os.environ.get("SESSION_MAX_MESSAGES", "100"))
+    SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "1000"))
+
+    # Concurrent LLM calls per worker for fan-out (batch checks, ...)
+    LLM_POOL_WORKERS = int(os.environ.get("LLM_POOL_WORKERS", "4"))
+    BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "50"))
+
+    # Request body cap, enforced by Flask before the body is read (413)
+    MAX_CONTENT_LENGTH = int(float(os.environ.get("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+    # Uploads are kept in memory up to this size, then spill to a temp file
+    UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", str(4 * 1024 * 1024)))
+
+    # Decode, trim silence and downmix recordings before Whisper (needs ffmpeg)
+    AUDIO_PREPROCESS = os.environ.get("AUDIO_PREPROCESS", "True").lower() in [
+        "true",
+        "1",
+        "t",
+    ]
+    AUDIO_OPUS_BITRATE = os.environ.get("AUDIO_OPUS_BITRATE", "24k")
+    AUDIO_FFMPEG_TIMEOUT = float(os.environ.get("AUDIO_FFMPEG_TIMEOUT", "15"))
+
+    # Transcripts cached by audio hash + language (per worker)
+    TRANSCRIBE_CACHE_SIZE = int(os.environ.get("TRANSCRIBE_CACHE_SIZE", "256"))
+    TRANSCRIBE_CACHE_TTL = int(os.environ.get("TRANSCRIBE_CACHE_TTL", "900"))
+
+    # Story images (Unsplash/Pexels), looked up concurrently and cached by query
+    IMAGE_POOL_WORKERS = int(os.environ.get("IMAGE_POOL_WORKERS", "8"))
+    IMAGE_LOOKUP_TIMEOUT = float(os.environ.get("IMAGE_LOOKUP_TIMEOUT", "5"))
+    IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "512"))
+    IMAGE_CACHE_TTL = int(os.environ.get("IMAGE_CACHE_TTL", "86400"))
+
+    # Streaming speech-to-text (WebSocket /transcribe/ws)
+    STT_SEGMENT_SILENCE_MS = int(os.environ.get("STT_SEGMENT_SILENCE_MS", "600"))
+    STT_MAX_SEGMENT_S = float(os.environ.get("STT_MAX_SEGMENT_S", "15"))
+    STT_MAX_STREAM_S = float(os.environ.get("STT_MAX_STREAM_S", "120"))
+    # Groq API base URL override for Whisper (see PROVIDERS)
+    GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL") or None
+
     # Rate limiting (requests per minute per IP)
     RATE_LIMIT = int(os.environ.get("RATE_LIMIT", "30"))
 
+    # Prometheus metrics: per-worker snapshots shared through this directory
+    METRICS_DIR = os.environ.get(
+        "METRICS_DIR", os.path.join(tempfile.gettempdir(), "echo_tutor_metrics")
+    )
+    METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+    # When set, /metrics requires "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+    # Share of requests whose phase timings are appended to TRACE_LOG_PATH
+    TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+    TRACE_LOG_PATH = os.environ.get("TRACE_LOG_PATH", "echo_traces.jsonl")
+
+    # Bearer token for the /admin routes; request profiling is off while unset
+    ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+    # Folded-stack request profiles (see profiling.py)
+    PROFILE_DIR = os.environ.get(
+        "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "echo_tutor_profiles")
+    )
+    PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+    PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "120"))
+    PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+
+    # LLM usage accounting (usage.py): per-worker totals are added to the
+    # llm_usage table in DATA_DB_PATH this often (s)
+    USAGE_FLUSH_SECONDS = float(os.environ.get("USAGE_FLUSH_SECONDS", "30"))
+    # USD per million prompt/completion tokens, by model; models not listed
+    # are counted as free. Add or override with LLM_PRICES='{"model": {...}}'.
+    LLM_PRICES = dict(
+        {
+            "llama-3.3-70b-versatile": {"prompt": 0.59, "completion": 0.79},
+            "llama-3.1-8b-instant": {"prompt": 0.05, "completion": 0.08},
+        },
+        **json.loads(os.environ.get("LLM_PRICES") or "{}"),
+    )
+
+    # Local SQLite store for learner data (SRS cards, exercise bank, ...)
+    DATA_DB_PATH = os.environ.get("DATA_DB_PATH", "echo_data.db")
+
+    # Offline pronunciation lexicon (compiled .lex files + LLM overlay)
+    LEXICON_DIR = os.environ.get(
+        "LEXICON_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "lexicon"),
+    )
+    LEXICON_OVERLAY_PATH = os.environ.get(
+        "LEXICON_OVERLAY_PATH", os.path.join(LEXICON_DIR, "overlay.jsonl")
+    )
+    # Most LLM-generated words kept in the overlay (loaded by every worker)
+    LEXICON_OVERLAY_MAX = int(os.environ.get("LEXICON_OVERLAY_MAX", "20000"))
+
     # Flask
     FLASK_DEBUG = os.environ.get("FLASK_DEBUG", "False").lower() in ["true", "1", "t"]
 
@@ -0,0 +1,354 @@
+"""
+Searchable exercise bank backed by SQLite FTS5.
+
+The static bank in ``static/data/exercises.json`` is loaded into an indexed
+store at startup. Fill-in-the-blank items are full-text searchable over
+question, answer and explanation, and carry grammatical-pattern tags so that
+``/exercises/generate`` can retrieve existing items before asking the LLM.
+Generated items are written back, so the bank grows over time.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import Config
+
+logger = logging.getLogger("exercise_bank")
+
+# Grammatical patterns recognised in explanations (lower-cased substrings).
+PATTERN_KEYWORDS = {
+    "third_person_singular": ["third person", "3rd person"],
+    "subject_verb_agreement": [
+        "plural subject",
+        "singular subject",
+        "subject is",
+        "closest noun",
+    ],
+    "past_simple": ["past tense", "past simple", "past of"],
+    "present_perfect": ["present perfect"],
+    "past_perfect": ["past perfect"],
+    "conditionals": ["conditional", "subjunctive", "were it not", "if i were"],
+    "inversion": ["inversion", "inverted"],
+    "gerund_infinitive": ["gerund", "infinitive"],
+    "prepositions": ["preposition", "'for' is used", "on the surface", "'since'"],
+    "questions": ["question"],
+    "comparatives": ["comparative", "superlative"],
+    "passive": ["passive"],
+    "articles": ["article", "'the'", "'an'"],
+    "negation": ["negative"],
+    "modals": ["modal"],
+}
+
+ARTICLES = {"a", "an", "the"}
+PREPOSITIONS = {
+    "about",
+    "at",
+    "by",
+    "during",
+    "for",
+    "from",
+    "in",
+    "into",
+    "of",
+    "on",
+    "since",
+    "to",
+    "until",
+    "with",
+}
+THIRD_PERSON_PAIRS = {("have", "has"), ("do", "does"), ("go", "goes"), ("are", "is")}
+MODALS = {"can", "could", "may", "might", "must", "shall", "should", "will", "would"}
+
+_WORD_RE = re.compile(r"[\w']+", re.UNICODE)
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall((text or "").lower())
+
+
+def tag_explanation(*texts: str) -> List[str]:
+    """Return the pattern tags whose keywords appear in any of ``texts``."""
+    haystack = " ".join(t for t in texts if t).lower()
+    return sorted(
+        tag
+        for tag, keywords in PATTERN_KEYWORDS.items()
+        if any(k in haystack for k in keywords)
+    )
+
+
+def infer_error_tags(wrong: str, right: str) -> List[str]:
+    """Guess the grammatical pattern behind a single wrong → right correction."""
+    wrong_only = set(_words(wrong)) - set(_words(right))
+    right_only = set(_words(right)) - set(_words(wrong))
+    tags = set()
+    for r in right_only:
+        for w in wrong_only:
+            if (
+                r in (w + "s", w + "es")
+                or (w.endswith("y") and r == w[:-1] + "ies")
+                or (w, r) in THIRD_PERSON_PAIRS
+            ):
+                tags.add("third_person_singular")
+            if r in (w + "ed", w + "d"):
+                tags.add("past_simple")
+        if r in ("has", "have") and any(w in ("is", "was", "did") for w in wrong_only):
+            tags.add("present_perfect")
+        if r == "had":
+            tags.add("past_perfect")
+    changed = wrong_only | right_only
+    if changed & ARTICLES:
+        tags.add("articles")
+    if changed & PREPOSITIONS:
+        tags.add("prepositions")
+    if changed & MODALS:
+        tags.add("modals")
+    if changed & {"more", "most", "than"} or any(
+        w.endswith("er") and w[:-2] in changed for w in changed
+    ):
+        tags.add("comparatives")
+    if changed & {"is", "are", "was", "were", "am"}:
+        tags.add("subject_verb_agreement")
+    return sorted(tags)
+
+
+def _question_id(question: str) -> str:
+    norm = " ".join(_words(question))
+    return "gen_" + hashlib.md5(norm.encode()).hexdigest()[:12]
+
+
+def _fts_quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+class ExerciseBank:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.DATA_DB_PATH
+        self.fts = True
+        self._init_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        """Create the exercise table and its full-text index."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS exercises (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    level TEXT NOT NULL DEFAULT 'intermediate',
+                    language TEXT NOT NULL DEFAULT 'en',
+                    data TEXT NOT NULL,
+                    tags TEXT NOT NULL DEFAULT '',
+                    source TEXT NOT NULL DEFAULT 'static',
+                    created_at REAL
+                )
+            """
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_exercises_type_level "
+                "ON exercises(type, level)"
+            )
+            try:
+                c.execute(
+                    """
+                    CREATE VIRTUAL TABLE IF NOT EXISTS exercises_fts USING fts5(
+                        id UNINDEXED, question, answer, explanation, tags
+                    )
+                """
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning(f"FTS5 unavailable, falling back to LIKE search: {e}")
+                self.fts = False
+            conn.commit()
+
+    def _insert(self, c, ex_id: str, ex_type: str, item: Dict[str, Any], tags, source):
+        c.execute(
+            """INSERT OR IGNORE INTO exercises
+                   (id, type, level, language, data, tags, source, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                ex_id,
+                ex_type,
+                item.get("level", "intermediate"),
+                item.get("language", "en"),
+                json.dumps(item, ensure_ascii=False),
+                " ".join(tags),
+                source,
+                time.time(),
+            ),
+        )
+        if c.rowcount and self.fts and ex_type == "fill_blank":
+            c.execute(
+                "INSERT INTO exercises_fts (id, question, answer, explanation, tags) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    ex_id,
+                    item.get("q", ""),
+                    item.get("answer", ""),
+                    item.get("explain", ""),
+                    " ".join(tags),
+                ),
+            )
+
+    def load_static(self, exercises: Dict[str, List[Dict[str, Any]]]):
+        """Replace the static part of the bank with the contents of exercises.json."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            if self.fts:
+                c.execute(
+                    "DELETE FROM exercises_fts WHERE id IN "
+                    "(SELECT id FROM exercises WHERE source = 'static')"
+                )
+            c.execute("DELETE FROM exercises WHERE source = 'static'")
+            for ex_type, items in exercises.items():
+                for item in items:
+                    tags = tag_explanation(item.get("explain", ""))
+                    self._insert(c, item["id"], ex_type, item, tags, "static")
+            conn.commit()
+
+    def add_generated(
+        self,
+        items: Iterable[Dict[str, Any]],
+        level: str,
+        language: str,
+        tags: Iterable[str] = (),
+    ) -> List[Dict[str, Any]]:
+        """Write LLM-generated fill-in-the-blank items back into the bank.
+
+        Returns the valid items with their bank ``id`` assigned.
+        """
+        stored = []
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                if not item.get("q") or not item.get("answer"):
+                    continue
+                ex_id = _question_id(item["q"])
+                item = dict(item, id=ex_id, level=level, language=language)
+                item_tags = sorted(
+                    set(tags) | set(tag_explanation(item.get("explain", "")))
+                )
+                self._insert(c, ex_id, "fill_blank", item, item_tags, "generated")
+                stored.append(item)
+            conn.commit()
+        return stored
+
+    def ids(
+        self,
+        ex_type: str,
+        language: Optional[str] = None,
+        level: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """Ids of the items of one type, in random order (``limit`` at most)."""
+        clauses, params = ["type = ?"], [ex_type]
+        if level:
+            clauses.append("level = ?")
+            params.append(level)
+        if language:
+            clauses.append("language = ?")
+            params.append(language)
+        sql = (
+            f"SELECT id FROM exercises WHERE {' AND '.join(clauses)} ORDER BY random()"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._get_conn() as conn:
+            return [row[0] for row in conn.execute(sql, params).fetchall()]
+
+    def types(self) -> List[str]:
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute("SELECT DISTINCT type FROM exercises")
+            return [row[0] for row in c.fetchall()]
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        ids = list(ids)
+        if not ids:
+            return {}
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                f"SELECT id, type, data FROM exercises WHERE id IN ({','.join('?' * len(ids))})",
+                ids,
+            )
+            return {
+                row[0]: dict(json.loads(row[2]), type=row[1]) for row in c.fetchall()
+            }
+
+    def count(self) -> int:
+        with self._get_conn() as conn:
+            return conn.execute("SELECT COUNT(*) FROM exercises").fetchone()[0]
+
+    def search_for_errors(
+        self,
+        errors: List[Dict[str, Any]],
+        level: str = "intermediate",
+        language: str = "en",
+        limit: int = 5,
+    ) -> Dict[str, Any]:
+        """Find fill-in-the-blank items that target the patterns behind ``errors``.
+
+        Returns ``{"items": [...], "tags": [...]}``; ``tags`` are the patterns
+        inferred from the errors, useful for tagging items generated to fill
+        the gap.
+        """
+        tags, terms = set(), set()
+        for e in errors:
+            wrong, right = str(e.get("wrong", "")), str(e.get("right", ""))
+            tags.update(infer_error_tags(wrong, right))
+            terms.update(set(_words(right)) - set(_words(wrong)))
+        terms = {t for t in terms if len(t) > 1}
+        if not tags and not terms:
+            return {"items": [], "tags": []}
+
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            if self.fts:
+                match = "{answer tags} : (%s)" % " OR ".join(
+                    _fts_quote(t.replace("_", " ")) for t in sorted(tags | terms)
+                )
+                c.execute(
+                    """SELECT e.data FROM exercises_fts f
+                       JOIN exercises e ON e.id = f.id
+                       WHERE exercises_fts MATCH ? AND e.language = ?
+                       ORDER BY (e.level = ?) DESC, bm25(exercises_fts, 0, 1.0, 4.0, 1.0, 8.0)
+                       LIMIT ?""",
+                    (match, language, level, limit),
+                )
+            else:
+                likes = [f"% {t} %" for t in sorted(tags)] + sorted(terms)
+                where = " OR ".join(
+                    ["(' ' || tags || ' ') LIKE ?"] * len(tags)
+                    + ["lower(json_extract(data, '$.answer')) = ?"] * len(terms)
+                )
+                c.execute(
+                    f"""SELECT data FROM exercises
+                        WHERE type = 'fill_blank' AND language = ? AND ({where})
+                        ORDER BY (level = ?) DESC LIMIT ?""",
+                    [language, *likes, level, limit],
+                )
+            items = [json.loads(row[0]) for row in c.fetchall()]
+        return {"items": items, "tags": sorted(tags)}
+
+
+# Singleton
+try:
+    exercise_bank = ExerciseBank()
+except sqlite3.Error as e:
+    logger.error(f"Exercise bank unavailable: {e}")
+    exercise_bank = None
@@ -0,0 +1,357 @@
+"""
+Offline pronunciation lexicon (word → IPA / respelling).
+
+Each language has a plain-text source ``data/lexicon/<lang>.tsv`` with
+``word<TAB>ipa[<TAB>respelling]`` rows. It is compiled into a compact sorted
+binary file (``<lang>.lex``) that is memory-mapped read-only, so every
+gunicorn worker shares the same page-cache pages and a lookup is a binary
+search over the mapping with no parsing or per-worker copies.
+
+English ships with the CMU Pronouncing Dictionary (about 125k words,
+converted with ``python lexicon.py cmudict``; hand-written rows come first
+and win). The other languages only have short starter lists, so most of
+their words still go to the LLM until a fuller list (e.g. a WikiPron
+export in the same TSV layout) is added.
+
+Words the lexicon does not know are answered by the LLM and appended to a
+JSON-lines overlay file, which all workers pick up on their next miss. The
+overlay holds at most ``Config.LEXICON_OVERLAY_MAX`` words; later misses are
+only cached in memory by the caller.
+
+    python lexicon.py build data/lexicon/en.tsv
+    python lexicon.py cmudict cmudict.dict data/lexicon/en.tsv
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import unicodedata
+from typing import Any, Dict, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger("lexicon")
+
+MAGIC = b"ECHOLEX1"
+_HEADER = struct.Struct("<8sI")  # magic, entry count
+_OFFSET = struct.Struct("<I")
+
+
+def normalize_word(word: str) -> str:
+    word = unicodedata.normalize("NFC", (word or "").strip())
+    return word.strip(".,!?;:\"'()[]¿¡«»“”").lower()
+
+
+# ARPAbet (CMUdict) to IPA and to a plain respelling; unstressed AH/ER differ
+_ARPA_IPA = {
+    "AA": "ɑ", "AE": "æ", "AH": "ʌ", "AO": "ɔ", "AW": "aʊ", "AY": "aɪ",
+    "EH": "ɛ", "ER": "ɜr", "EY": "eɪ", "IH": "ɪ", "IY": "i", "OW": "oʊ",
+    "OY": "ɔɪ", "UH": "ʊ", "UW": "u", "B": "b", "CH": "tʃ", "D": "d",
+    "DH": "ð", "F": "f", "G": "ɡ", "HH": "h", "JH": "dʒ", "K": "k", "L": "l",
+    "M": "m", "N": "n", "NG": "ŋ", "P": "p", "R": "r", "S": "s", "SH": "ʃ",
+    "T": "t", "TH": "θ", "V": "v", "W": "w", "Y": "j", "Z": "z", "ZH": "ʒ",
+}  # fmt: skip
+_ARPA_RESPELL = {
+    "AA": "ah", "AE": "a", "AH": "u", "AO": "aw", "AW": "ow", "AY": "y",
+    "EH": "e", "ER": "er", "EY": "ay", "IH": "ih", "IY": "ee", "OW": "oh",
+    "OY": "oy", "UH": "oo", "UW": "oo", "B": "b", "CH": "ch", "D": "d",
+    "DH": "th", "F": "f", "G": "g", "HH": "h", "JH": "j", "K": "k", "L": "l",
+    "M": "m", "N": "n", "NG": "ng", "P": "p", "R": "r", "S": "s", "SH": "sh",
+    "T": "t", "TH": "th", "V": "v", "W": "w", "Y": "y", "Z": "z", "ZH": "zh",
+}  # fmt: skip
+# Consonant clusters that can start an English syllable (maximal onset)
+_ONSETS = {
+    ("P", "L"), ("P", "R"), ("B", "L"), ("B", "R"), ("T", "R"), ("D", "R"),
+    ("K", "L"), ("K", "R"), ("K", "W"), ("G", "L"), ("G", "R"), ("F", "L"),
+    ("F", "R"), ("TH", "R"), ("SH", "R"), ("S", "P"), ("S", "T"), ("S", "K"),
+    ("S", "M"), ("S", "N"), ("S", "L"), ("S", "W"), ("T", "W"), ("D", "W"),
+    ("S", "P", "L"), ("S", "P", "R"), ("S", "T", "R"), ("S", "K", "R"),
+    ("S", "K", "W"), ("P", "Y"), ("B", "Y"), ("K", "Y"), ("G", "Y"),
+    ("F", "Y"), ("V", "Y"), ("M", "Y"), ("HH", "Y"), ("S", "P", "Y"),
+    ("S", "K", "Y"),
+}  # fmt: skip
+# Short vowels that keep the next consonant when stressed ("HAP-ee")
+_LAX = {"AE", "EH", "IH", "UH", "AH"}
+
+
+def _syllables(phones):
+    """Split ARPAbet phones into ``(stress, phones)`` syllables."""
+    vowels = [i for i, p in enumerate(phones) if p[-1].isdigit()]
+    if not vowels:
+        return []
+    bounds = [0]
+    for prev, nxt in zip(vowels, vowels[1:]):
+        cluster = phones[prev + 1 : nxt]
+        split = len(cluster)  # consonants before the split stay in the coda
+        for size in range(len(cluster), 0, -1):
+            onset = tuple(cluster[-size:])
+            if size == 1 or onset in _ONSETS:
+                split = len(cluster) - size
+                break
+        if cluster and split == 0 and phones[prev][:-1] in _LAX:
+            split = 1 if phones[prev][-1] != "0" else 0
+        bounds.append(prev + 1 + split)
+    bounds.append(len(phones))
+    return [
+        (int(phones[v][-1]), phones[start:end])
+        for v, start, end in zip(vowels, bounds, bounds[1:])
+    ]
+
+
+def arpabet_to_ipa(phones) -> Tuple[str, str]:
+    """``(ipa, respelling)`` for a CMUdict pronunciation, e.g. ``HH AH0 L OW1``."""
+    ipa, respelling = [], []
+    syllables = _syllables(phones)
+    for stress, syllable in syllables:
+        sounds, spelled = [], []
+        for phone in syllable:
+            base = phone.rstrip("012")
+            if base == "AH" and stress == 0:
+                sounds.append("ə")
+                spelled.append("uh")
+            elif base == "ER" and stress == 0:
+                sounds.append("ər")
+                spelled.append("er")
+            elif base == "IH" and syllable[-1] != phone:
+                sounds.append("ɪ")
+                spelled.append("i")  # closed syllable: "BIZ", open: "bih"
+            elif base == "AY" and not sounds:
+                sounds.append("aɪ")
+                spelled.append("eye")  # "y" alone would read as a consonant
+            else:
+                sounds.append(_ARPA_IPA[base])
+                spelled.append(_ARPA_RESPELL[base])
+        mark = {1: "ˈ", 2: "ˌ"}.get(stress, "") if len(syllables) > 1 else ""
+        ipa.append(mark + "".join(sounds))
+        text = "".join(spelled)
+        respelling.append(text.upper() if stress == 1 else text)
+    return f"/{''.join(ipa)}/", "-".join(respelling)
+
+
+def convert_cmudict(dict_path: str, tsv_path: str) -> int:
+    """Add CMUdict words missing from ``tsv_path`` to it; returns words added.
+
+    Rows already in the TSV (hand-written ones) are kept first so they win;
+    only the first pronunciation of each CMUdict word is used.
+    """
+    kept, known = [], set()
+    if os.path.exists(tsv_path):
+        with open(tsv_path, "r", encoding="utf-8") as f:
+            for line in f:
+                kept.append(line.rstrip("\n"))
+                if line.strip() and not line.startswith("#"):
+                    known.add(normalize_word(line.split("\t", 1)[0]))
+    added = []
+    with open(dict_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].split()
+            if len(line) < 2 or "(" in line[0]:
+                continue  # blank, or an alternative pronunciation
+            word = normalize_word(line[0])
+            if not word or word in known:
+                continue
+            try:
+                ipa, respelling = arpabet_to_ipa(line[1:])
+            except KeyError:
+                continue
+            known.add(word)
+            added.append(f"{word}\t{ipa}\t{respelling}")
+    tmp_path = f"{tsv_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(kept + added) + "\n")
+    os.replace(tmp_path, tsv_path)
+    return len(added)
+
+
+def build_lexicon(tsv_path: str, lex_path: Optional[str] = None) -> int:
+    """Compile a TSV source into the binary ``.lex`` format; returns entry count.
+
+    Layout: header, ``count + 1`` little-endian uint32 record offsets, then
+    the records ``word\\tipa\\trespelling`` (UTF-8) sorted by word bytes.
+    """
+    lex_path = lex_path or os.path.splitext(tsv_path)[0] + ".lex"
+    entries: Dict[bytes, bytes] = {}
+    with open(tsv_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 2:
+                continue
+            word = normalize_word(cols[0])
+            ipa = cols[1].strip()
+            respelling = cols[2].strip() if len(cols) > 2 else ""
+            if word and ipa:
+                key = word.encode("utf-8")
+                entries.setdefault(key, f"{ipa}\t{respelling}".encode("utf-8"))
+
+    records = [k + b"\t" + v for k, v in sorted(entries.items())]
+    offsets, pos = [], 0
+    base = _HEADER.size + _OFFSET.size * (len(records) + 1)
+    for rec in records:
+        offsets.append(base + pos)
+        pos += len(rec)
+    offsets.append(base + pos)
+
+    tmp_path = f"{lex_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(records)))
+        f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        f.write(b"".join(records))
+    # Atomic rename, so concurrent workers never map half a file
+    os.replace(tmp_path, lex_path)
+    return len(records)
+
+
+class LexiconFile:
+    """Read-only view over one memory-mapped ``.lex`` file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lexicon file")
+
+    def _record(self, i: int) -> bytes:
+        start, end = struct.unpack_from("<II", self._mm, _HEADER.size + 4 * i)
+        return self._mm[start:end]
+
+    def get(self, word: str) -> Optional[Dict[str, str]]:
+        key = normalize_word(word).encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            rec = self._record(mid)
+            rec_key = rec[: rec.index(b"\t")]
+            if rec_key < key:
+                lo = mid + 1
+            elif rec_key > key:
+                hi = mid
+            else:
+                _, ipa, respelling = rec.decode("utf-8").split("\t", 2)
+                return {"ipa": ipa, "phonetic": respelling}
+        return None
+
+
+class PronunciationLexicon:
+    def __init__(self, data_dir: str = None, overlay_path: str = None):
+        self.data_dir = data_dir or Config.LEXICON_DIR
+        self.overlay_path = overlay_path or Config.LEXICON_OVERLAY_PATH
+        self.overlay_max = Config.LEXICON_OVERLAY_MAX
+        self._files: Dict[str, Optional[LexiconFile]] = {}
+        self._overlay: Dict[tuple, Dict[str, Any]] = {}
+        self._overlay_pos = 0
+        self._lock = threading.Lock()
+        self._refresh_overlay()
+
+    def _file(self, language: str) -> Optional[LexiconFile]:
+        if language in self._files:
+            return self._files[language]
+        if not language.isalpha():
+            return None
+        lex = None
+        tsv_path = os.path.join(self.data_dir, f"{language}.tsv")
+        lex_path = os.path.join(self.data_dir, f"{language}.lex")
+        try:
+            if os.path.exists(tsv_path) and (
+                not os.path.exists(lex_path)
+                or os.path.getmtime(lex_path) < os.path.getmtime(tsv_path)
+            ):
+                count = build_lexicon(tsv_path, lex_path)
+                logger.info(f"Compiled {language} lexicon: {count} entries")
+            if os.path.exists(lex_path):
+                lex = LexiconFile(lex_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Lexicon for {language} unavailable: {e}")
+        self._files[language] = lex
+        return lex
+
+    def _refresh_overlay(self):
+        """Read overlay lines appended (by any worker) since the last read."""
+        try:
+            if os.path.getsize(self.overlay_path) <= self._overlay_pos:
+                return
+            with open(self.overlay_path, "rb") as f:
+                f.seek(self._overlay_pos)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # partially written line; pick it up next time
+                    self._overlay_pos += len(line)
+                    try:
+                        entry = json.loads(line.decode("utf-8"))
+                        key = (entry["language"], normalize_word(entry["word"]))
+                        if len(self._overlay) < self.overlay_max:
+                            self._overlay[key] = entry["result"]
+                    except (ValueError, KeyError):
+                        continue
+        except OSError:
+            return
+
+    def lookup(self, word: str, language: str) -> Optional[Dict[str, Any]]:
+        """Return a pronunciation result for ``word``, or None if unknown."""
+        norm = normalize_word(word)
+        if not norm:
+            return None
+        lex = self._file(language)
+        entry = lex.get(norm) if lex else None
+        if entry:
+            return {
+                "word": word,
+                "ipa": entry["ipa"],
+                "phonetic": entry["phonetic"],
+                "tips": [],
+                "similar_sound": "",
+            }
+        with self._lock:
+            result = self._overlay.get((language, norm))
+            if result is None:
+                self._refresh_overlay()
+                result = self._overlay.get((language, norm))
+        return dict(result) if result else None
+
+    def remember(self, word: str, language: str, result: Dict[str, Any]):
+        """Append an LLM-generated result to the overlay file."""
+        norm = normalize_word(word)
+        if not norm or not isinstance(result, dict):
+            return
+        line = json.dumps(
+            {"language": language, "word": norm, "result": result},
+            ensure_ascii=False,
+        )
+        with self._lock:
+            if (language, norm) in self._overlay:
+                return
+            if len(self._overlay) >= self.overlay_max:
+                return  # full: the caller's response cache still has it
+            self._overlay[(language, norm)] = result
+            try:
+                # One O_APPEND write per line keeps concurrent workers' lines intact
+                fd = os.open(
+                    self.overlay_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644
+                )
+                try:
+                    os.write(fd, (line + "\n").encode("utf-8"))
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                logger.warning(f"Could not append to lexicon overlay: {e}")
+
+
+pronunciation_lexicon = PronunciationLexicon()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "cmudict":
+        print(f"{sys.argv[3]}: {convert_cmudict(sys.argv[2], sys.argv[3])} words added")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "build":
+        for path in sys.argv[2:]:
+            print(f"{path}: {build_lexicon(path)} entries")
+    else:
+        print("usage: python lexicon.py build <source.tsv> [...]")
+        print("       python lexicon.py cmudict <cmudict.dict> <target.tsv>")
+        sys.exit(1)
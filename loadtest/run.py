@@ -0,0 +1,390 @@
+"""
+End-to-end load test of the app against the local stub of the upstream AI
+APIs (loadtest/stub_server.py), so performance can be measured offline.
+
+For each server configuration (gunicorn workers x threads) it starts the
+stub and the app, drives a weighted mix of requests from concurrent
+clients and reports, per endpoint, throughput, p50/p95/p99 latency and,
+for streamed chat, time to the first token.
+
+    python loadtest/run.py                                  # 2x8, conversation mix
+    python loadtest/run.py --configs 1x8,2x8,4x8 --duration 60
+    python loadtest/run.py --mix study --ttft-ms 500 --error-rate 0.02
+    python loadtest/run.py --url http://127.0.0.1:7860      # an app already running
+
+Every request uses fresh input (message, topic, recording), so the app's
+caches do not hide the upstream latency. Injected upstream errors are
+mostly absorbed by the SDK's retries and show up as latency. Needs
+gunicorn, unless --url is given.
+"""
+
+import argparse
+import array
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import audio  # noqa: E402
+
+# Request mixes: endpoint -> weight
+MIXES = {
+    # A spoken conversation: mostly streamed replies and transcriptions
+    "conversation": {
+        "chat_stream": 55,
+        "transcribe": 25,
+        "exercises": 10,
+        "chat": 5,
+        "story": 5,
+    },
+    # A study session: exercises and stories, some chat
+    "study": {"exercises": 45, "story": 25, "chat_stream": 20, "chat": 10},
+    "uniform": {
+        "chat_stream": 1,
+        "chat": 1,
+        "transcribe": 1,
+        "story": 1,
+        "exercises": 1,
+    },
+}
+
+LEVELS = ("beginner", "intermediate", "advanced")
+
+
+def _recording(seconds: float) -> bytes:
+    """A unique WAV recording: a voice-band tone with a random pitch."""
+    rate = audio.SAMPLE_RATE
+    pitch = random.uniform(120, 260)
+    samples = array.array(
+        "h",
+        (
+            int(5000 * math.sin(2 * math.pi * pitch * i / rate))
+            + random.randint(-50, 50)
+            for i in range(int(seconds * rate))
+        ),
+    )
+    return audio.pcm_to_wav(samples.tobytes())
+
+
+class Client:
+    """One simulated learner issuing requests back to back."""
+
+    def __init__(self, url: str, mix: dict, results: dict, lock, recordings):
+        self.url = url
+        self.session = requests.Session()
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.results = results
+        self.lock = lock
+        self.recordings = recordings
+
+    def _chat_body(self):
+        n = random.getrandbits(40)
+        return {
+            "history": [
+                {"role": "assistant", "content": "Hi! What did you do today?"},
+                {"role": "user", "content": f"I went to the park number {n} today."},
+            ],
+            "level": random.choice(LEVELS),
+            "topic": "free",
+            "language": "en",
+        }
+
+    def chat_stream(self):
+        start = time.perf_counter()
+        ttft = None
+        with self.session.post(
+            f"{self.url}/chat/stream", json=self._chat_body(), stream=True, timeout=60
+        ) as r:
+            if r.status_code != 200:
+                return False, time.perf_counter() - start, None
+            ok = True
+            for line in r.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                if ttft is None and b'"token"' in line:
+                    ttft = time.perf_counter() - start
+                if b'"error"' in line:
+                    ok = False
+        return ok and ttft is not None, time.perf_counter() - start, ttft
+
+    def chat(self):
+        start = time.perf_counter()
+        r = self.session.post(f"{self.url}/chat", json=self._chat_body(), timeout=60)
+        return r.status_code == 200, time.perf_counter() - start, None
+
+    def transcribe(self):
+        start = time.perf_counter()
+        # Salt the cached recording so each upload misses the transcript cache
+        data = random.choice(self.recordings) + os.urandom(8)
+        r = self.session.post(
+            f"{self.url}/transcribe",
+            files={"audio": ("turn.wav", data, "audio/wav")},
+            data={"language": "en"},
+            timeout=60,
+        )
+        return r.status_code == 200, time.perf_counter() - start, None
+
+    def story(self):
+        start = time.perf_counter()
+        r = self.session.post(
+            f"{self.url}/story/generate",
+            json={
+                "topic": f"a trip number {random.getrandbits(40)}",
+                "level": random.choice(LEVELS),
+                "language": "en",
+            },
+            timeout=60,
+        )
+        ok = r.status_code == 200 and "story" in r.json()
+        return ok, time.perf_counter() - start, None
+
+    def exercises(self):
+        start = time.perf_counter()
+        r = self.session.get(
+            f"{self.url}/exercises",
+            params={"level": random.choice(LEVELS), "type": "all", "count": 10},
+            timeout=60,
+        )
+        return r.status_code == 200, time.perf_counter() - start, None
+
+    def run(self, stop_at: float, record_from: float):
+        while time.perf_counter() < stop_at:
+            kind = random.choices(self.kinds, self.weights)[0]
+            try:
+                ok, latency, ttft = getattr(self, kind)()
+            except requests.RequestException:
+                ok, latency, ttft = False, 0.0, None
+            if time.perf_counter() < record_from:
+                continue  # warm-up
+            with self.lock:
+                entry = self.results[kind]
+                entry["latency"].append(latency)
+                if ttft is not None:
+                    entry["ttft"].append(ttft)
+                if not ok:
+                    entry["errors"] += 1
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def run_load(url, mix, concurrency, duration, warmup):
+    results = defaultdict(lambda: {"latency": [], "ttft": [], "errors": 0})
+    lock = threading.Lock()
+    recordings = [_recording(random.uniform(2, 6)) for _ in range(8)]
+    now = time.perf_counter()
+    record_from, stop_at = now + warmup, now + warmup + duration
+    threads = [
+        threading.Thread(
+            target=Client(url, mix, results, lock, recordings).run,
+            args=(stop_at, record_from),
+            daemon=True,
+        )
+        for _ in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    report = {}
+    for kind in sorted(results):
+        entry = results[kind]
+        lat = entry["latency"]
+        report[kind] = {
+            "requests": len(lat),
+            "errors": entry["errors"],
+            "rps": round(len(lat) / duration, 2),
+            **{
+                f"p{p}_ms": round(percentile(lat, p) * 1000, 1) if lat else None
+                for p in (50, 95, 99)
+            },
+            **{
+                f"ttft_p{p}_ms": (
+                    round(percentile(entry["ttft"], p) * 1000, 1)
+                    if entry["ttft"]
+                    else None
+                )
+                for p in (50, 95)
+            },
+        }
+    all_lat = [v for e in results.values() for v in e["latency"]]
+    report["total"] = {
+        "requests": len(all_lat),
+        "errors": sum(e["errors"] for e in results.values()),
+        "rps": round(len(all_lat) / duration, 2),
+        **{
+            f"p{p}_ms": round(percentile(all_lat, p) * 1000, 1) if all_lat else None
+            for p in (50, 95, 99)
+        },
+        "ttft_p50_ms": None,
+        "ttft_p95_ms": None,
+    }
+    return report
+
+
+def print_report(title, report):
+    print(f"\n{title}")
+    print(
+        f"{'endpoint':<13}{'reqs':>7}{'errors':>8}{'req/s':>8}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft50':>9}{'ttft95':>9}"
+    )
+
+    def cell(v):
+        return f"{v:>9.0f}" if v is not None else f"{'-':>9}"
+
+    for kind, r in report.items():
+        print(
+            f"{kind:<13}{r['requests']:>7}{r['errors']:>8}{r['rps']:>8.1f}"
+            + "".join(
+                cell(r[k])
+                for k in ("p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms")
+            )
+        )
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_stub(args):
+    cmd = [
+        sys.executable,
+        os.path.join(ROOT, "loadtest", "stub_server.py"),
+        "--port",
+        str(args.stub_port),
+        "--ttft-ms",
+        str(args.ttft_ms),
+        "--tokens-per-s",
+        str(args.tokens_per_s),
+        "--reply-tokens",
+        str(args.reply_tokens),
+        "--error-rate",
+        str(args.error_rate),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_ready(f"http://127.0.0.1:{args.stub_port}/")
+    return proc
+
+
+def start_app(args, workers, threads, workdir):
+    stub = f"http://127.0.0.1:{args.stub_port}"
+    env = dict(
+        os.environ,
+        AI_PROVIDER="groq",
+        GROQ_API_KEY="stub",
+        GROQ_BASE_URL=stub,
+        RATE_LIMIT="1000000",
+        DATA_DB_PATH=os.path.join(workdir, "loadtest.db"),
+        METRICS_DIR=os.path.join(workdir, f"metrics-{workers}x{threads}"),
+        TRACE_SAMPLE_RATE="0",
+    )
+    for key in ("GROQ_API_KEY_2", "GROQ_API_KEY_3", "GROQ_API_KEY_4"):
+        env.pop(key, None)
+    cmd = [
+        "gunicorn",
+        "--worker-class",
+        "gthread",
+        "--workers",
+        str(workers),
+        "--threads",
+        str(threads),
+        "--bind",
+        f"127.0.0.1:{args.app_port}",
+        "--timeout",
+        "120",
+        "app:app",
+    ]
+    proc = subprocess.Popen(
+        cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_ready(f"http://127.0.0.1:{args.app_port}/health")
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--configs", default="2x8", help="comma-separated WORKERSxTHREADS"
+    )
+    parser.add_argument("--mix", choices=sorted(MIXES), default="conversation")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-s", type=float, default=200)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=7870)
+    parser.add_argument("--url", help="test an app that is already running")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    mix = MIXES[args.mix]
+    runs = {}
+    summary = (
+        f"mix={args.mix} concurrency={args.concurrency} duration={args.duration:g}s "
+        f"stub: ttft={args.ttft_ms:g}ms {args.tokens_per_s:g} tok/s "
+        f"{args.reply_tokens} tokens errors={args.error_rate:g}"
+    )
+
+    if args.url:
+        report = run_load(args.url, mix, args.concurrency, args.duration, args.warmup)
+        print_report(f"{args.url} | {summary}", report)
+        runs[args.url] = report
+    else:
+        stub = start_stub(args)
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                for config in args.configs.split(","):
+                    workers, threads = (int(n) for n in config.lower().split("x"))
+                    app_proc = start_app(args, workers, threads, workdir)
+                    try:
+                        report = run_load(
+                            f"http://127.0.0.1:{args.app_port}",
+                            mix,
+                            args.concurrency,
+                            args.duration,
+                            args.warmup,
+                        )
+                    finally:
+                        app_proc.terminate()
+                        app_proc.wait(timeout=30)
+                    print_report(f"{config} | {summary}", report)
+                    runs[config] = report
+        finally:
+            stub.terminate()
+            stub.wait(timeout=10)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Local stub for the upstream AI APIs, for testing and load tests without
+network access or API cost.
+
+Implements the OpenAI-compatible chat completions endpoint (under the Groq
+``/openai/v1`` and NVIDIA ``/v1`` prefixes, streamed and not) and the Groq
+Whisper transcription endpoint, with configurable, deterministic latency:
+time to first token, token rate and Whisper time per audio second. A share
+of calls can be failed on purpose (``--error-rate``).
+
+Prompts that ask for JSON get a canned object of the right shape (a story
+for the story prompt), so the JSON endpoints parse their replies.
+
+    python loadtest/stub_server.py --port 9100
+    AI_PROVIDER=groq GROQ_API_KEY=stub GROQ_BASE_URL=http://127.0.0.1:9100 \\
+        python app.py
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+app.config["LATENCY"] = {
+    "whisper_base_ms": 150.0,
+    "whisper_per_audio_s_ms": 25.0,
+    "ttft_ms": 300.0,
+    "tokens_per_s": 200.0,
+    "reply_tokens": 60,
+}
+app.config["ERRORS"] = {"rate": 0.0, "status": 500}
+
+# Rough bytes per audio second, to size latency like real Whisper
+_BYTES_PER_SECOND = {"wav": 32000, "ogg": 3000, "webm": 6000}
+
+_WORDS = (
+    "that sounds great tell me more about your day what did you enjoy most "
+    "try saying it again with the past tense nice work keep going"
+).split()
+
+_STORY = {
+    "title": "A Day at the Market",
+    "story": (
+        "Anna walks to the market every Saturday. She buys fresh bread, "
+        "apples and cheese. The baker smiles and asks about her family. "
+        "Anna laughs and tells him about her new job in the city."
+    ),
+    "vocabulary": [
+        {"word": w, "translation": w, "example": f"I like the {w}."}
+        for w in ("market", "bread", "apples", "cheese", "baker", "city")
+    ],
+    "image_prompt": "a busy outdoor market with fresh bread and apples on a sunny morning",
+}
+
+
+def _injected_error():
+    errors = app.config["ERRORS"]
+    if errors["rate"] and random.random() < errors["rate"]:
+        status = errors["status"]
+        return (
+            jsonify(
+                {
+                    "error": {
+                        "message": "stub: injected error",
+                        "type": "rate_limit_error" if status == 429 else "server_error",
+                    }
+                }
+            ),
+            status,
+        )
+    return None
+
+
+def _reply_pieces(body) -> list:
+    """The reply, split into the chunks it is streamed as."""
+    prompt = json.dumps(body.get("messages", [])[-1:])
+    wants_json = (
+        body.get("response_format", {}).get("type") == "json_object" or "JSON" in prompt
+    )
+    if wants_json:
+        text = json.dumps(_STORY if "story" in prompt else {"items": []})
+        return [text[i : i + 4] for i in range(0, len(text), 4)]
+    n = int(app.config["LATENCY"]["reply_tokens"])
+    return [random.choice(_WORDS) + " " for _ in range(n)]
+
+
+@app.route("/openai/v1/chat/completions", methods=["POST"])
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    error = _injected_error()
+    if error:
+        return error
+    body = request.get_json(force=True)
+    latency = app.config["LATENCY"]
+    pieces = _reply_pieces(body)
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body["messages"]) // 4
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(pieces),
+        "total_tokens": prompt_tokens + len(pieces),
+    }
+    base = {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+    }
+    per_token = 1.0 / latency["tokens_per_s"]
+
+    if not body.get("stream"):
+        time.sleep(latency["ttft_ms"] / 1000 + per_token * len(pieces))
+        return jsonify(
+            dict(
+                base,
+                object="chat.completion",
+                choices=[
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(pieces)},
+                        "finish_reason": "stop",
+                    }
+                ],
+                usage=usage,
+            )
+        )
+
+    def chunk(delta, finish=None, **extra):
+        payload = dict(
+            base,
+            object="chat.completion.chunk",
+            choices=[{"index": 0, "delta": delta, "finish_reason": finish}],
+            **extra,
+        )
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def generate():
+        time.sleep(latency["ttft_ms"] / 1000)
+        yield chunk({"role": "assistant", "content": ""})
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(per_token)
+            yield chunk({"content": piece})
+        # Groq reports usage on the last chunk
+        yield chunk({}, "stop", x_groq={"usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return Response(generate(), mimetype="text/event-stream")
+
+
+@app.route("/openai/v1/audio/transcriptions", methods=["POST"])
+def transcriptions():
+    error = _injected_error()
+    if error:
+        return error
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"error": {"message": "file is required"}}), 400
+    data = upload.read()
+    ext = (upload.filename or "").rsplit(".", 1)[-1].lower()
+    seconds = len(data) / _BYTES_PER_SECOND.get(ext, 6000)
+    latency = app.config["LATENCY"]
+    time.sleep(
+        (latency["whisper_base_ms"] + latency["whisper_per_audio_s_ms"] * seconds)
+        / 1000
+    )
+    return jsonify(
+        {
+            "text": f"stub transcript of {seconds:.1f} seconds",
+            "language": request.form.get("language", "en"),
+            "duration": round(seconds, 2),
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub upstream AI APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=300.0)
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--whisper-base-ms", type=float, default=150.0)
+    parser.add_argument("--whisper-per-audio-s-ms", type=float, default=25.0)
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of calls to fail (0-1)"
+    )
+    parser.add_argument("--error-status", type=int, default=500)
+    args = parser.parse_args()
+    app.config["LATENCY"] = {
+        "whisper_base_ms": args.whisper_base_ms,
+        "whisper_per_audio_s_ms": args.whisper_per_audio_s_ms,
+        "ttft_ms": args.ttft_ms,
+        "tokens_per_s": args.tokens_per_s,
+        "reply_tokens": args.reply_tokens,
+    }
+    app.config["ERRORS"] = {"rate": args.error_rate, "status": args.error_status}
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
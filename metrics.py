@@ -0,0 +1,442 @@
+"""
+Prometheus-compatible metrics, aggregated across gunicorn workers.
+
+Each worker keeps its counters, gauges and histograms in memory and writes a
+snapshot to ``Config.METRICS_DIR/worker-<pid>.json`` every
+``Config.METRICS_FLUSH_SECONDS`` (and at exit). ``render()`` merges the
+snapshots of every worker into the Prometheus text format:
+
+- counters and histograms are summed over all workers, including workers
+  that have exited, so totals never go backwards when gunicorn recycles one;
+  a dead worker's file is folded into ``archive.json`` and removed
+- gauges are summed over live workers only
+
+The metric families used by the app are defined at the bottom of this
+module; callers import them and call ``inc`` / ``set`` / ``observe`` with
+label values as keyword arguments.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+
+try:
+    import fcntl  # serialises archive updates between workers (POSIX only)
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+AUDIO_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _Family:
+    def __init__(self, registry, kind, name, doc, labelnames, buckets=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets else None
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+
+class Counter(_Family):
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self, self._key(labels), amount)
+
+
+class Gauge(_Family):
+    def inc(self, amount: float = 1, **labels):
+        self.registry._add(self, self._key(labels), amount)
+
+    def dec(self, amount: float = 1, **labels):
+        self.registry._add(self, self._key(labels), -amount)
+
+    def set(self, value: float, **labels):
+        self.registry._set(self, self._key(labels), value)
+
+
+class Histogram(_Family):
+    def observe(self, value: float, **labels):
+        self.registry._observe(self, self._key(labels), value)
+
+
+class MetricsRegistry:
+    def __init__(self, directory: str = None, flush_seconds: float = None):
+        self.directory = directory or Config.METRICS_DIR
+        self.flush_seconds = flush_seconds or Config.METRICS_FLUSH_SECONDS
+        self._families: Dict[str, _Family] = {}
+        self._reset_process()
+        if hasattr(os, "register_at_fork"):
+            # gunicorn --preload forks workers from a process that may have
+            # recorded metrics already; each worker starts from zero
+            os.register_at_fork(after_in_child=self._reset_process)
+        atexit.register(self.flush)
+
+    def _reset_process(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._token = uuid.uuid4().hex
+        self._values: Dict[Tuple[str, tuple], float] = {}
+        self._histograms: Dict[Tuple[str, tuple], List[float]] = {}
+        self._dirty = False
+        self._flusher: Optional[threading.Thread] = None
+        self._claimed = False
+
+    # ── Definition ──
+
+    def _register(self, family: _Family) -> _Family:
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name, doc, labelnames=()) -> Counter:
+        return self._register(Counter(self, "counter", name, doc, labelnames))
+
+    def gauge(self, name, doc, labelnames=()) -> Gauge:
+        return self._register(Gauge(self, "gauge", name, doc, labelnames))
+
+    def histogram(self, name, doc, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(
+            Histogram(self, "histogram", name, doc, labelnames, buckets)
+        )
+
+    # ── Recording ──
+
+    def _touch(self):
+        self._dirty = True
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="metrics-flush", daemon=True
+            )
+            self._flusher.start()
+
+    def _add(self, family, key, amount):
+        with self._lock:
+            k = (family.name, key)
+            self._values[k] = self._values.get(k, 0.0) + amount
+            self._touch()
+
+    def _set(self, family, key, value):
+        with self._lock:
+            self._values[(family.name, key)] = float(value)
+            self._touch()
+
+    def _observe(self, family, key, value):
+        with self._lock:
+            k = (family.name, key)
+            h = self._histograms.get(k)
+            if h is None:
+                # bucket counts (non-cumulative, last = +Inf), then sum, count
+                h = self._histograms[k] = [0.0] * (len(family.buckets) + 3)
+            n = len(family.buckets)
+            h[bisect_left(family.buckets, value)] += 1
+            h[n + 1] += value
+            h[n + 2] += 1
+            self._touch()
+
+    # ── Snapshots ──
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pid": self._pid,
+                "token": self._token,
+                "values": [[n, list(k), v] for (n, k), v in self._values.items()],
+                "histograms": [
+                    [n, list(k), list(h)] for (n, k), h in self._histograms.items()
+                ],
+            }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def flush(self):
+        """Write this worker's snapshot (atomically) if anything changed."""
+        if not self._dirty or not self.directory:
+            return
+        self._dirty = False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(self._pid)
+            if not self._claimed:
+                # A previous process with the same pid left counts behind
+                self._claimed = True
+                with self._locked():
+                    previous = self._read(path)
+                    if previous and previous.get("token") != self._token:
+                        self._archive([previous], [path])
+            tmp = f"{path}.{self._token}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    @staticmethod
+    def _read(path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _locked(self):
+        """Exclusive lock over archive.json and dead workers' files."""
+        lock = open(os.path.join(self.directory, ".lock"), "a")
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock  # released when closed
+
+    def _archive(self, snapshots: List[dict], remove: Iterable[str] = ()):
+        """Fold dead workers' counters and histograms into archive.json.
+
+        Must be called with ``_locked()`` held.
+        """
+        archive_path = os.path.join(self.directory, "archive.json")
+        merged = _Merged()
+        merged.add(self._read(archive_path) or {}, gauges=True)
+        for snapshot in snapshots:
+            merged.add(snapshot, gauges=False, families=self._families)
+        tmp = f"{archive_path}.{self._token}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(merged.to_snapshot(), f)
+        os.replace(tmp, archive_path)
+        for path in remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def collect(self) -> "_Merged":
+        """Merge this worker's live values with every other worker's snapshot."""
+        merged = _Merged()
+        merged.add(self._snapshot(), gauges=True)
+        if not self.directory:
+            return merged
+        self.flush()
+        try:
+            lock = self._locked()
+        except OSError as e:
+            logger.warning(f"Could not read metrics snapshots: {e}")
+            return merged
+        with lock:
+            dead, dead_paths = [], []
+            for path in glob.glob(os.path.join(self.directory, "worker-*.json")):
+                snapshot = self._read(path)
+                if not snapshot or snapshot.get("pid") == self._pid:
+                    continue
+                if _pid_alive(snapshot["pid"]):
+                    merged.add(snapshot, gauges=True)
+                else:
+                    dead.append(snapshot)
+                    dead_paths.append(path)
+            merged.add(
+                self._read(os.path.join(self.directory, "archive.json")) or {},
+                gauges=True,
+            )
+            if dead:
+                merged_dead = _Merged()
+                for snapshot in dead:
+                    merged_dead.add(snapshot, gauges=False, families=self._families)
+                merged.add(merged_dead.to_snapshot(), gauges=True)
+                try:
+                    self._archive(dead, dead_paths)
+                except OSError as e:
+                    logger.warning(f"Could not archive metrics snapshots: {e}")
+        return merged
+
+    def render(self) -> str:
+        """All metrics, summed across workers, in Prometheus text format."""
+        merged = self.collect()
+        lines = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {family.doc}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            if family.kind == "histogram":
+                for key, h in sorted(merged.histograms.get(family.name, {}).items()):
+                    n = len(family.buckets)
+                    if len(h) != n + 3:
+                        continue  # bucket layout changed between deploys
+                    cumulative = 0.0
+                    for bound, count in zip(family.buckets + (float("inf"),), h):
+                        cumulative += count
+                        le = f'le="{_fmt(bound)}"'
+                        labels = _labels(family.labelnames, key, le)
+                        lines.append(f"{family.name}_bucket{labels} {_fmt(cumulative)}")
+                    labels = _labels(family.labelnames, key)
+                    lines.append(f"{family.name}_sum{labels} {_fmt(h[n + 1])}")
+                    lines.append(f"{family.name}_count{labels} {_fmt(h[n + 2])}")
+            else:
+                for key, value in sorted(merged.values.get(family.name, {}).items()):
+                    labels = _labels(family.labelnames, key)
+                    lines.append(f"{family.name}{labels} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Merged:
+    """Values summed over several snapshots, keyed by family then labels."""
+
+    def __init__(self):
+        self.values: Dict[str, Dict[tuple, float]] = {}
+        self.histograms: Dict[str, Dict[tuple, List[float]]] = {}
+
+    def add(self, snapshot: dict, gauges: bool, families: Dict[str, _Family] = None):
+        for name, key, value in snapshot.get("values", []):
+            if not gauges and (families is None or families.get(name) is None):
+                continue
+            if not gauges and families[name].kind == "gauge":
+                continue
+            series = self.values.setdefault(name, {})
+            series[tuple(key)] = series.get(tuple(key), 0.0) + value
+        for name, key, h in snapshot.get("histograms", []):
+            series = self.histograms.setdefault(name, {})
+            current = series.get(tuple(key))
+            if current is None or len(current) != len(h):
+                series[tuple(key)] = list(h)
+            else:
+                series[tuple(key)] = [a + b for a, b in zip(current, h)]
+
+    def to_snapshot(self) -> dict:
+        return {
+            "values": [
+                [n, list(k), v] for n, s in self.values.items() for k, v in s.items()
+            ],
+            "histograms": [
+                [n, list(k), h]
+                for n, s in self.histograms.items()
+                for k, h in s.items()
+            ],
+        }
+
+
+registry = MetricsRegistry()
+
+# ─── HTTP ───
+HTTP_REQUESTS = registry.counter(
+    "echo_http_requests_total",
+    "HTTP requests by route, method and status code.",
+    ("route", "method", "status"),
+)
+HTTP_LATENCY = registry.histogram(
+    "echo_http_request_duration_seconds",
+    "Time to serve a request, including the streamed body.",
+    ("route", "method"),
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "echo_http_requests_in_flight",
+    "Requests currently being served (streams count until closed).",
+    ("route",),
+)
+RATE_LIMITED = registry.counter(
+    "echo_rate_limit_rejections_total",
+    "Requests rejected by the per-IP rate limiter.",
+    ("route",),
+)
+
+# ─── LLM calls ───
+LLM_REQUESTS = registry.counter(
+    "echo_llm_requests_total",
+    "LLM completion calls by route, provider, model and outcome.",
+    ("route", "provider", "model", "outcome"),
+)
+LLM_ERRORS = registry.counter(
+    "echo_llm_errors_total",
+    "Failed LLM calls by exception type.",
+    ("provider", "model", "error_type"),
+)
+LLM_TTFT = registry.histogram(
+    "echo_llm_time_to_first_token_seconds",
+    "Time until the first streamed chunk (whole call when not streamed).",
+    ("provider", "model"),
+)
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "echo_llm_tokens_per_second",
+    "Completion tokens per second after the first token.",
+    ("provider", "model"),
+    buckets=RATE_BUCKETS,
+)
+LLM_PROMPT_TOKENS = registry.counter(
+    "echo_llm_prompt_tokens_total",
+    "Prompt tokens reported by the provider.",
+    ("provider", "model"),
+)
+LLM_COMPLETION_TOKENS = registry.counter(
+    "echo_llm_completion_tokens_total",
+    "Completion tokens (reported, or streamed chunks when not reported).",
+    ("provider", "model"),
+)
+LLM_CANCELLED = registry.counter(
+    "echo_llm_streams_cancelled_total",
+    "Streamed replies whose upstream call was closed before it finished.",
+    ("route",),
+)
+LLM_TOKENS_SAVED = registry.counter(
+    "echo_llm_tokens_saved_total",
+    "Completion tokens not generated because a stream was cancelled "
+    "(max_tokens minus the tokens already streamed; an upper bound).",
+    ("route",),
+)
+
+# ─── Caches and speech-to-text ───
+CACHE_REQUESTS = registry.counter(
+    "echo_cache_requests_total",
+    "Cache lookups by namespace and result (hit, miss, shared, partial).",
+    ("namespace", "result"),
+)
+WHISPER_LATENCY = registry.histogram(
+    "echo_whisper_request_duration_seconds",
+    "Whisper transcription call duration.",
+    ("model",),
+)
+WHISPER_AUDIO = registry.histogram(
+    "echo_whisper_audio_seconds",
+    "Audio duration sent to Whisper.",
+    ("model",),
+    buckets=AUDIO_BUCKETS,
+)
@@ -0,0 +1,264 @@
+"""
+On-demand sampling profiler for single requests.
+
+A request is profiled when it carries ``X-Echo-Profile: <ADMIN_TOKEN>``, or
+when an admin has armed profiling for its route (``arm()``, shared by all
+workers through ``PROFILE_DIR/armed.json``). A background thread then
+samples the request thread's stack every ``PROFILE_INTERVAL_MS`` until the
+response is closed, so streamed (SSE) bodies are covered for their whole
+lifetime. The result is written to ``PROFILE_DIR`` in the folded-stack
+format read by flamegraph.pl, speedscope and similar tools, next to a small
+JSON file describing the request.
+
+It is wall-clock sampling: time spent waiting on the provider shows up in
+the frame that waits. Nothing runs unless ``Config.ADMIN_TOKEN`` is set and
+a request asks for (or is armed for) profiling.
+"""
+
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from config import Config
+
+try:
+    import fcntl  # serialises updates of armed.json between workers (POSIX only)
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger("profiling")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+# armed.json is re-read at most this often per worker
+ARMED_CHECK_SECONDS = 1.0
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """True when ``token`` matches ``Config.ADMIN_TOKEN`` (never if unset)."""
+    if not Config.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token, Config.ADMIN_TOKEN)
+
+
+def _where(code) -> str:
+    path = code.co_filename
+    if path.startswith(ROOT + os.sep):
+        path = os.path.relpath(path, ROOT)
+    else:
+        path = "/".join(path.split(os.sep)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of the request's thread(s) and counts folded stacks."""
+
+    def __init__(self, thread_id: int = None, interval_ms: float = None):
+        self.thread_ids = {thread_id or threading.get_ident()}
+        self.interval = (interval_ms or Config.PROFILE_INTERVAL_MS) / 1000
+        self.id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self._wall = time.time()
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name=f"profiler-{self.id}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        max_samples = Config.PROFILE_MAX_SECONDS / self.interval
+        while not self._stop.wait(self.interval) and self.samples < max_samples:
+            current = sys._current_frames()
+            frames = [current[t] for t in list(self.thread_ids) if t in current]
+            if not frames:
+                break
+            for frame in frames:
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_where(frame.f_code))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def follow(self, thread_id: int = None):
+        """Also sample another thread, e.g. one producing a streamed reply."""
+        self.thread_ids.add(thread_id or threading.get_ident())
+
+    def stop(self) -> float:
+        """Stop sampling; returns the profiled wall time in seconds."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+        return time.perf_counter() - self._started
+
+    def save(self, **info) -> Dict[str, Any]:
+        """Stop, write ``<id>.folded`` and ``<id>.json``; returns the metadata."""
+        duration = self.stop()
+        meta = dict(
+            info,
+            id=self.id,
+            started=round(self._wall, 3),
+            duration_ms=round(duration * 1000, 1),
+            samples=self.samples,
+            interval_ms=self.interval * 1000,
+        )
+        try:
+            os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+            base = os.path.join(Config.PROFILE_DIR, self.id)
+            with open(base + ".folded", "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(base + ".json", "w") as f:
+                json.dump(meta, f)
+            _prune()
+        except OSError as e:
+            logger.warning(f"Could not save profile {self.id}: {e}")
+        return meta
+
+
+# ─── Stored profiles ───
+def _prune():
+    profiles = list_profiles()
+    for meta in profiles[Config.PROFILE_MAX_FILES :]:
+        for ext in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(Config.PROFILE_DIR, meta["id"] + ext))
+            except OSError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Metadata of the stored profiles, newest first."""
+    try:
+        names = os.listdir(Config.PROFILE_DIR)
+    except OSError:
+        return []
+    profiles = []
+    for name in names:
+        if not name.endswith(".json") or not PROFILE_ID.match(name[:-5]):
+            continue
+        try:
+            with open(os.path.join(Config.PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda m: m.get("started", 0), reverse=True)
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Path of a stored folded profile, or None for unknown or invalid ids."""
+    if not PROFILE_ID.match(profile_id or ""):
+        return None
+    path = os.path.join(Config.PROFILE_DIR, profile_id + ".folded")
+    return path if os.path.exists(path) else None
+
+
+# ─── Arming (admin toggle shared by all workers) ───
+_armed_cache = {"checked": 0.0, "mtime": None, "routes": {}}
+_armed_lock = threading.Lock()
+
+
+def _armed_path() -> str:
+    return os.path.join(Config.PROFILE_DIR, "armed.json")
+
+
+def _update_armed(update) -> Dict[str, int]:
+    """Apply ``update(routes) -> result`` to armed.json under a file lock."""
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(Config.PROFILE_DIR, ".lock"), "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(_armed_path()) as f:
+                routes = json.load(f)
+        except (OSError, ValueError):
+            routes = {}
+        result = update(routes)
+        routes = {r: n for r, n in routes.items() if n > 0}
+        tmp = _armed_path() + f".{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(routes, f)
+        os.replace(tmp, _armed_path())
+    _armed_cache["checked"] = 0.0  # re-read on the next request
+    return result
+
+
+def arm(route: str, count: int) -> Dict[str, int]:
+    """Profile the next ``count`` requests to ``route`` ("*" for any route)."""
+
+    def update(routes):
+        routes[route] = routes.get(route, 0) + count
+        return dict(routes)
+
+    return _update_armed(update)
+
+
+def disarm() -> Dict[str, int]:
+    return _update_armed(lambda routes: routes.clear() or {})
+
+
+def armed() -> Dict[str, int]:
+    """Armed routes and remaining counts, from a per-worker cached read."""
+    now = time.monotonic()
+    cache = _armed_cache
+    if now - cache["checked"] < ARMED_CHECK_SECONDS:
+        return cache["routes"]
+    with _armed_lock:
+        cache["checked"] = now
+        try:
+            mtime = os.stat(_armed_path()).st_mtime_ns
+        except OSError:
+            cache["mtime"], cache["routes"] = None, {}
+            return cache["routes"]
+        if mtime != cache["mtime"]:
+            try:
+                with open(_armed_path()) as f:
+                    cache["routes"] = json.load(f)
+            except (OSError, ValueError):
+                cache["routes"] = {}
+            cache["mtime"] = mtime
+    return cache["routes"]
+
+
+def _claim(route: str) -> bool:
+    """Take one armed slot for ``route``; False if another worker got it."""
+
+    def update(routes):
+        for key in (route, "*"):
+            if routes.get(key, 0) > 0:
+                routes[key] -= 1
+                return True
+        return False
+
+    try:
+        return _update_armed(update)
+    except OSError as e:
+        logger.warning(f"Could not claim armed profile: {e}")
+        return False
+
+
+def wanted(header_token: Optional[str], route: str) -> bool:
+    """Whether to profile this request (header or armed route)."""
+    if not Config.ADMIN_TOKEN:
+        return False
+    if header_token and is_admin(header_token):
+        return True
+    routes = armed()
+    if routes and (routes.get(route) or routes.get("*")):
+        return _claim(route)
+    return False
@@ -0,0 +1,334 @@
+"""
+Per-route model selection with latency budgets.
+
+Each LLM task (chat, story, grammar, ...) has a route in
+``Config.MODEL_ROUTES``: a provider, a model, an optional faster fallback
+model and a latency budget. The budget is the time until the reply starts
+arriving: the first token for streamed calls, the whole call otherwise.
+
+The router keeps a moving average of each route/model's observed latency.
+When the primary model's average runs close to the budget, calls are
+downgraded to the fallback; a small share of calls still probe the primary
+so the route recovers once it speeds up again. A primary call that fails
+(timeout, rate limit, server error) is retried once on the fallback.
+
+Every call's choice, latency and outcome is counted for ``stats()``, and
+exported as Prometheus metrics (time to first token, tokens per second,
+token counts and errors; see metrics.py) and added to the usage ledger
+with the API key and the request's endpoint and user (see usage.py).
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import metrics
+from config import Config
+from usage import estimate_tokens, usage_ledger
+
+logger = logging.getLogger("routing")
+
+EWMA_ALPHA = 0.2
+# Downgrade once the primary's average latency reaches this share of the budget
+BUDGET_RISK = 0.8
+# While downgraded, send every Nth call to the primary to refresh its average
+PROBE_EVERY = 10
+
+
+class Choice(NamedTuple):
+    route: str
+    provider: str
+    model: str
+    reason: str  # primary | downgraded | probe | failover
+    budget_ms: int
+
+
+class ModelRouter:
+    def __init__(self, routes: Dict[str, Dict[str, Any]] = None):
+        self.routes = routes if routes is not None else Config.MODEL_ROUTES
+        self._lock = threading.Lock()
+        self._ewma: Dict[tuple, float] = {}
+        self._downgraded_calls: Dict[str, int] = {}
+        self._stats: Dict[tuple, Dict[str, Any]] = {}
+
+    def _route(self, route: str) -> Dict[str, Any]:
+        return self.routes.get(route) or self.routes["default"]
+
+    def choose(self, route: str) -> Choice:
+        spec = self._route(route)
+        provider = spec.get("provider", Config.AI_PROVIDER)
+        budget_ms = int(spec.get("budget_ms", 5000))
+        primary, fallback = spec["model"], spec.get("fallback")
+        if not fallback or fallback == primary:
+            return Choice(route, provider, primary, "primary", budget_ms)
+
+        with self._lock:
+            avg = self._ewma.get((route, primary))
+            if avg is None or avg < budget_ms * BUDGET_RISK:
+                self._downgraded_calls.pop(route, None)
+                return Choice(route, provider, primary, "primary", budget_ms)
+            n = self._downgraded_calls.get(route, 0) + 1
+            self._downgraded_calls[route] = n
+        if n % PROBE_EVERY == 0:
+            return Choice(route, provider, primary, "probe", budget_ms)
+        return Choice(route, provider, fallback, "downgraded", budget_ms)
+
+    def failover(self, choice: Choice) -> Optional[Choice]:
+        """The fallback to retry on after ``choice`` failed, if there is one."""
+        fallback = self._route(choice.route).get("fallback")
+        if not fallback or fallback == choice.model:
+            return None
+        return choice._replace(model=fallback, reason="failover")
+
+    def observe(self, choice: Choice, latency_s: float, ok: bool = True):
+        """Record one call's latency (to first token) and outcome."""
+        ms = latency_s * 1000
+        key = (choice.route, choice.model)
+        with self._lock:
+            if ok:
+                prev = self._ewma.get(key)
+                self._ewma[key] = (
+                    ms if prev is None else prev + EWMA_ALPHA * (ms - prev)
+                )
+            else:
+                # A failed call counts as a blown budget for the next choice
+                prev = self._ewma.get(key, 0.0)
+                self._ewma[key] = max(prev, float(choice.budget_ms))
+            s = self._stats.setdefault(
+                (choice.route, choice.provider, choice.model),
+                {"calls": 0, "errors": 0, "over_budget": 0, "total_ms": 0.0},
+            )
+            s["calls"] += 1
+            s[choice.reason] = s.get(choice.reason, 0) + 1
+            if not ok:
+                s["errors"] += 1
+            else:
+                s["total_ms"] += ms
+                if ms > choice.budget_ms:
+                    s["over_budget"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Per route: budget, current averages and per-model call counts."""
+        with self._lock:
+            result: Dict[str, Any] = {}
+            for (route, provider, model), s in sorted(self._stats.items()):
+                entry = result.setdefault(
+                    route,
+                    {"budget_ms": self._route(route).get("budget_ms"), "models": {}},
+                )
+                ok_calls = s["calls"] - s["errors"]
+                entry["models"][model] = dict(
+                    {k: v for k, v in s.items() if k != "total_ms"},
+                    provider=provider,
+                    avg_ms=round(s["total_ms"] / ok_calls, 1) if ok_calls else None,
+                    ewma_ms=round(self._ewma.get((route, model), 0.0), 1),
+                )
+            return result
+
+
+model_router = ModelRouter()
+
+
+# ─── Client wrapper ───
+def _usage(obj):
+    """Token usage of a completion or chunk: OpenAI ``usage`` or Groq ``x_groq``."""
+    usage = getattr(obj, "usage", None)
+    if usage is None:
+        extra = getattr(obj, "x_groq", None) or (
+            getattr(obj, "model_extra", None) or {}
+        ).get("x_groq")
+        usage = extra.get("usage") if isinstance(extra, dict) else None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    if usage is not None:
+        return (
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None),
+        )
+    return None
+
+
+class _TimedStream:
+    """Iterates a streamed completion, timing the first chunk and the rest.
+
+    ``on_first(ok)`` fires once, when the first chunk arrives (or the stream
+    fails before it); ``on_done(ok, first_at, usage, chunks, error)`` fires
+    when the stream ends, fails or is closed early.
+    """
+
+    def __init__(self, stream, on_first: Callable[[bool], None], on_done=None):
+        self._stream = stream
+        self._on_first = on_first
+        self._on_done = on_done
+        self._first_at = None
+        self._usage = None
+        self._chunks = 0
+        self._error = None
+
+    def _report(self, ok: bool):
+        if self._on_first:
+            self._on_first(ok)
+            self._on_first = None
+
+    def _done(self, ok: bool):
+        if self._on_done:
+            self._on_done(ok, self._first_at, self._usage, self._chunks, self._error)
+            self._on_done = None
+
+    def __iter__(self):
+        ok = True
+        try:
+            for chunk in self._stream:
+                if self._first_at is None:
+                    self._first_at = time.perf_counter()
+                self._report(True)
+                if getattr(chunk, "choices", None):
+                    delta = getattr(chunk.choices[0], "delta", None)
+                    if getattr(delta, "content", None):
+                        self._chunks += 1
+                self._usage = _usage(chunk) or self._usage
+                yield chunk
+        except Exception as e:
+            ok, self._error = False, e
+            self._report(False)
+            raise
+        finally:
+            self._done(ok)
+        self._report(True)
+
+    def close(self):
+        close = getattr(self._stream, "close", None)
+        if close:
+            close()
+        self._done(True)
+
+
+def _record_call(choice, start, ok, first_at=None, usage=None, chunks=None, error=None):
+    """Export one completion call to the Prometheus metrics.
+
+    ``chunks`` is None for a non-streamed call, whose first token is taken
+    to arrive with the whole reply.
+    """
+    labels = {"provider": choice.provider, "model": choice.model}
+    end = time.perf_counter()
+    metrics.LLM_REQUESTS.inc(
+        route=choice.route, outcome="ok" if ok else "error", **labels
+    )
+    if error is not None:
+        metrics.LLM_ERRORS.inc(error_type=type(error).__name__, **labels)
+    if chunks is None and ok:
+        first_at = end
+    if first_at is not None:
+        metrics.LLM_TTFT.observe(first_at - start, **labels)
+
+    prompt_tokens, completion_tokens = usage or (None, None)
+    if completion_tokens is None:
+        completion_tokens = chunks or 0  # about one token per streamed chunk
+    if prompt_tokens:
+        metrics.LLM_PROMPT_TOKENS.inc(prompt_tokens, **labels)
+    if completion_tokens:
+        metrics.LLM_COMPLETION_TOKENS.inc(completion_tokens, **labels)
+        # Streams: generation rate after the first token; otherwise whole call
+        elapsed = end - first_at if chunks is not None else end - start
+        if elapsed > 0 and (chunks is None or chunks > 1):
+            metrics.LLM_TOKENS_PER_SECOND.observe(completion_tokens / elapsed, **labels)
+
+
+class RoutedClient:
+    """Stand-in for an OpenAI client, bound to one route's model choice.
+
+    ``client.chat.completions.create(...)`` uses ``client.model``, records the
+    call with the router and retries once on the route's fallback model if
+    the call fails before any output arrives.
+    """
+
+    def __init__(
+        self,
+        client,
+        choice: Choice,
+        router: ModelRouter = None,
+        attribution: Optional[tuple] = None,
+    ):
+        self.choice = choice
+        self.router = router or model_router
+        # (endpoint, user_key) the calls are accounted to, see usage.py
+        self.attribution = attribution
+        self._client = client
+        self.chat = self  # so that ``client.chat.completions.create`` works
+        self.completions = self
+
+    @property
+    def model(self) -> str:
+        return self.choice.model
+
+    @property
+    def base_url(self):
+        return getattr(self._client, "base_url", "")
+
+    def _account(self, choice: Choice, kwargs, ok, usage=None, chunks=None):
+        """Add a call to the usage ledger, estimating usage the reply lacked."""
+        prompt_tokens, completion_tokens = usage or (None, None)
+        estimated = prompt_tokens is None or completion_tokens is None
+        if prompt_tokens is None:
+            # A call that failed before any output is not billed
+            sent = ok or bool(chunks)
+            prompt_tokens = estimate_tokens(kwargs.get("messages")) if sent else 0
+        if completion_tokens is None:
+            completion_tokens = chunks or 0
+        usage_ledger.record(
+            choice.route,
+            choice.provider,
+            choice.model,
+            getattr(self._client, "api_key", None),
+            self.attribution,
+            ok,
+            prompt_tokens,
+            completion_tokens,
+            estimated,
+        )
+
+    def _call(self, choice: Choice, kwargs):
+        kwargs = dict(kwargs, model=choice.model)
+        start = time.perf_counter()
+        try:
+            result = self._client.chat.completions.create(**kwargs)
+        except Exception as e:
+            self.router.observe(choice, time.perf_counter() - start, ok=False)
+            _record_call(choice, start, ok=False, error=e)
+            self._account(choice, kwargs, ok=False)
+            raise
+        if kwargs.get("stream"):
+
+            def done(ok, first_at, usage, chunks, error):
+                _record_call(choice, start, ok, first_at, usage, chunks, error)
+                self._account(choice, kwargs, ok, usage, chunks)
+
+            return _TimedStream(
+                result,
+                lambda ok: self.router.observe(choice, time.perf_counter() - start, ok),
+                done,
+            )
+        self.router.observe(choice, time.perf_counter() - start)
+        usage = _usage(result)
+        _record_call(choice, start, True, usage=usage)
+        if usage is None:
+            content = result.choices[0].message.content if result.choices else ""
+            usage = (None, len(content or "") // 4)
+        self._account(choice, kwargs, True, usage)
+        return result
+
+    def create(self, **kwargs):
+        try:
+            return self._call(self.choice, kwargs)
+        except Exception as e:
+            # Client errors (bad request, auth) would fail on any model
+            status = getattr(e, "status_code", None)
+            retry = self.router.failover(self.choice)
+            if retry is None or (status is not None and status < 429):
+                raise
+            logger.warning(
+                f"{self.choice.route}: {self.choice.model} failed ({e}); "
+                f"retrying on {retry.model}"
+            )
+            return self._call(retry, kwargs)
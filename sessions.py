@@ -0,0 +1,273 @@
+"""
+Server-held conversation sessions.
+
+Instead of sending the whole ``history`` with every turn, a chat client can
+create a session once and then send only the new user message with its
+``session_id``; the user message and the reply are appended to the session
+when the reply completes.
+
+Messages are stored append-only in SQLite (``chat_sessions`` /
+``chat_messages`` in ``Config.DATA_DB_PATH``) so any worker can serve the
+next turn, with bodies over ``PACK_MIN_CHARS`` zlib-compressed. Each worker
+keeps recently used sessions in an LRU cache and refreshes an entry by
+reading only the messages it has not seen, so a turn normally costs one
+primary-key lookup. Only the last ``Config.SESSION_MAX_MESSAGES`` messages
+are kept, and sessions idle for ``Config.SESSION_TTL`` seconds are deleted.
+"""
+
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger("sessions")
+
+ROLES = ("user", "assistant")
+MAX_CONTENT_CHARS = 4000
+PACK_MIN_CHARS = 512
+# How often expired sessions are deleted (s)
+SWEEP_SECONDS = 300
+
+
+def clean_history(history: Iterable[Any]) -> List[Tuple[str, str]]:
+    """(role, content) pairs from a client history, capped like /chat does."""
+    messages = []
+    for msg in list(history or [])[-Config.SESSION_MAX_MESSAGES :]:
+        if isinstance(msg, dict) and msg.get("role") in ROLES:
+            messages.append(
+                (msg["role"], str(msg.get("content", ""))[:MAX_CONTENT_CHARS])
+            )
+    return messages
+
+
+def _pack(content: str) -> Tuple[Any, int]:
+    if len(content) < PACK_MIN_CHARS:
+        return content, 0
+    return zlib.compress(content.encode("utf-8"), 6), 1
+
+
+def _unpack(content, packed: int) -> str:
+    return zlib.decompress(content).decode("utf-8") if packed else content
+
+
+class _Cached:
+    __slots__ = ("length", "messages")
+
+    def __init__(self, length: int, messages: List[Tuple[str, str]]):
+        self.length = length  # messages ever appended (seq of the last one)
+        self.messages = messages  # the kept tail, oldest first
+
+
+class SessionStore:
+    def __init__(self, db_path: str = None, cache_size: int = None):
+        self.db_path = db_path or Config.DATA_DB_PATH
+        self.cache_size = cache_size or Config.SESSION_CACHE_SIZE
+        self._init_db()
+        self._reset_process()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_process)
+
+    def _reset_process(self):
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, _Cached]" = OrderedDict()
+        self._last_sweep = time.time()
+        self._hits = 0
+        self._misses = 0
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        """Create the session and message tables."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    length INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chat_messages (
+                    session_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content BLOB NOT NULL,
+                    packed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (session_id, seq)
+                ) WITHOUT ROWID
+                """
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated "
+                "ON chat_sessions (updated_at)"
+            )
+
+    # ── Cache ──
+
+    def _cache_put(self, session_id: str, entry: _Cached):
+        with self._lock:
+            self._cache[session_id] = entry
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, session_id: str) -> Optional[_Cached]:
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                self._cache.move_to_end(session_id)
+            return entry
+
+    # ── API ──
+
+    def create(self, messages: Iterable[Tuple[str, str]] = ()) -> str:
+        """Start a session, optionally seeded with earlier messages."""
+        session_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self._get_conn() as conn:
+            conn.execute(
+                "INSERT INTO chat_sessions (session_id, length, created_at, "
+                "updated_at) VALUES (?, 0, ?, ?)",
+                (session_id, now, now),
+            )
+        self._cache_put(session_id, _Cached(0, []))
+        messages = list(messages)
+        if messages:
+            self.append(session_id, messages)
+        self._maybe_sweep(now)
+        return session_id
+
+    def history(self, session_id: str) -> Optional[List[Dict[str, str]]]:
+        """The session's messages as chat messages, or None if unknown/expired."""
+        with self._get_conn() as conn:
+            row = conn.execute(
+                "SELECT length, updated_at FROM chat_sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None or time.time() - row[1] > Config.SESSION_TTL:
+                return None
+            length = row[0]
+            entry = self._cache_get(session_id)
+            if entry is not None and entry.length == length:
+                self._hits += 1
+            else:
+                # Read only what this worker has not seen yet
+                self._misses += 1
+                seen = entry.length if entry is not None else 0
+                since = max(seen, length - Config.SESSION_MAX_MESSAGES)
+                rows = conn.execute(
+                    "SELECT role, content, packed FROM chat_messages "
+                    "WHERE session_id = ? AND seq > ? ORDER BY seq",
+                    (session_id, since),
+                ).fetchall()
+                new = [
+                    (role, _unpack(content, packed)) for role, content, packed in rows
+                ]
+                kept = entry.messages if entry is not None and seen == since else []
+                entry = _Cached(length, (kept + new)[-Config.SESSION_MAX_MESSAGES :])
+                self._cache_put(session_id, entry)
+        return [{"role": role, "content": content} for role, content in entry.messages]
+
+    def append(self, session_id: str, messages: List[Tuple[str, str]]) -> bool:
+        """Append messages atomically; False if the session is unknown/expired."""
+        now = time.time()
+        conn = self._get_conn()
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT length, updated_at FROM chat_sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None or now - row[1] > Config.SESSION_TTL:
+                conn.execute("ROLLBACK")
+                return False
+            length = row[0]
+            conn.executemany(
+                "INSERT INTO chat_messages (session_id, seq, role, content, packed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (session_id, length + i + 1, role) + _pack(content)
+                    for i, (role, content) in enumerate(messages)
+                ],
+            )
+            new_length = length + len(messages)
+            conn.execute(
+                "UPDATE chat_sessions SET length = ?, updated_at = ? "
+                "WHERE session_id = ?",
+                (new_length, now, session_id),
+            )
+            conn.execute(
+                "DELETE FROM chat_messages WHERE session_id = ? AND seq <= ?",
+                (session_id, new_length - Config.SESSION_MAX_MESSAGES),
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        entry = self._cache_get(session_id)
+        if entry is not None and entry.length == length:
+            entry = _Cached(
+                new_length,
+                (entry.messages + list(messages))[-Config.SESSION_MAX_MESSAGES :],
+            )
+            self._cache_put(session_id, entry)
+        self._maybe_sweep(now)
+        return True
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._cache.pop(session_id, None)
+        with self._get_conn() as conn:
+            conn.execute(
+                "DELETE FROM chat_messages WHERE session_id = ?", (session_id,)
+            )
+            cursor = conn.execute(
+                "DELETE FROM chat_sessions WHERE session_id = ?", (session_id,)
+            )
+            return cursor.rowcount > 0
+
+    def _maybe_sweep(self, now: float):
+        if now - self._last_sweep < SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        cutoff = now - Config.SESSION_TTL
+        try:
+            with self._get_conn() as conn:
+                conn.execute(
+                    "DELETE FROM chat_messages WHERE session_id IN "
+                    "(SELECT session_id FROM chat_sessions WHERE updated_at < ?)",
+                    (cutoff,),
+                )
+                conn.execute(
+                    "DELETE FROM chat_sessions WHERE updated_at < ?", (cutoff,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not expire sessions: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached = len(self._cache)
+        return {"cached": cached, "hits": self._hits, "misses": self._misses}
+
+
+session_store = SessionStore()
@@ -0,0 +1,232 @@
+"""
+Spaced-repetition scheduler (SM-2) backed by SQLite.
+
+Card state is stored per user in a single WITHOUT ROWID table whose index on
+(user_key, due_at) turns "what is due next" into one index range scan, no
+matter how many cards a learner has accumulated.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config import Config
+
+logger = logging.getLogger("srs")
+
+DAY_SECONDS = 86400
+MIN_EASE = 1.3
+DEFAULT_EASE = 2.5
+# Card ids per ``IN (...)`` query, well under SQLite's bound-parameter limit
+ID_CHUNK = 500
+
+# Friendly grade names accepted by the API, mapped to SM-2 quality (0-5).
+GRADES = {"again": 1, "hard": 3, "good": 4, "easy": 5}
+
+
+def sm2_schedule(
+    ease: float, interval_days: float, reps: int, quality: int
+) -> Dict[str, float]:
+    """Apply one SM-2 review and return the new (ease, interval_days, reps)."""
+    quality = max(0, min(5, int(quality)))
+    if quality < 3:
+        reps = 0
+        interval_days = 1.0
+    else:
+        reps += 1
+        if reps == 1:
+            interval_days = 1.0
+        elif reps == 2:
+            interval_days = 6.0
+        else:
+            interval_days = round(interval_days * ease, 2)
+    ease = ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    return {
+        "ease": max(MIN_EASE, round(ease, 3)),
+        "interval_days": interval_days,
+        "reps": reps,
+    }
+
+
+class SRSStore:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.DATA_DB_PATH
+        self._init_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        """Create the card table and its due-queue indexes."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS srs_cards (
+                    user_key TEXT NOT NULL,
+                    card_id TEXT NOT NULL,
+                    kind TEXT NOT NULL DEFAULT 'exercise',
+                    payload TEXT,
+                    ease REAL NOT NULL DEFAULT 2.5,
+                    interval_days REAL NOT NULL DEFAULT 0,
+                    reps INTEGER NOT NULL DEFAULT 0,
+                    lapses INTEGER NOT NULL DEFAULT 0,
+                    due_at REAL NOT NULL,
+                    last_review REAL,
+                    PRIMARY KEY (user_key, card_id)
+                ) WITHOUT ROWID
+            """
+            )
+            for idx in [
+                "CREATE INDEX IF NOT EXISTS idx_srs_due ON srs_cards(user_key, due_at)",
+                "CREATE INDEX IF NOT EXISTS idx_srs_kind_due ON srs_cards(user_key, kind, due_at)",
+            ]:
+                c.execute(idx)
+            conn.commit()
+
+    @staticmethod
+    def _row_to_card(row: sqlite3.Row) -> Dict[str, Any]:
+        card = dict(row)
+        payload = card.pop("payload", None)
+        card["payload"] = json.loads(payload) if payload else None
+        return card
+
+    def due_batch(
+        self,
+        user_key: str,
+        kind: Optional[str] = None,
+        limit: int = 20,
+        now: Optional[float] = None,
+        card_ids: Optional[Iterable[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Return the cards due for review, oldest first (one indexed query).
+
+        ``card_ids`` restricts the queue to those cards (one query per
+        ``ID_CHUNK`` ids).
+        """
+        now = time.time() if now is None else now
+        clauses, params = ["user_key = ?", "due_at <= ?"], [user_key, now]
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if card_ids is None:
+            chunks = [[]]
+        else:
+            card_ids = list(dict.fromkeys(card_ids))
+            chunks = [
+                card_ids[start : start + ID_CHUNK]
+                for start in range(0, len(card_ids), ID_CHUNK)
+            ]
+        cards = []
+        with self._get_conn() as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            for chunk in chunks:
+                where = " AND ".join(clauses)
+                if chunk:
+                    where += f" AND card_id IN ({', '.join('?' * len(chunk))})"
+                c.execute(
+                    f"SELECT * FROM srs_cards WHERE {where} ORDER BY due_at LIMIT ?",
+                    [*params, *chunk, limit],
+                )
+                cards.extend(self._row_to_card(r) for r in c.fetchall())
+        if len(chunks) > 1:
+            cards.sort(key=lambda card: card["due_at"])
+        return cards[:limit]
+
+    def seen_ids(self, user_key: str, card_ids: Iterable[str]) -> Set[str]:
+        """The subset of ``card_ids`` the user already has cards for."""
+        card_ids = list(dict.fromkeys(card_ids))
+        seen = set()
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            for start in range(0, len(card_ids), ID_CHUNK):
+                chunk = card_ids[start : start + ID_CHUNK]
+                c.execute(
+                    "SELECT card_id FROM srs_cards WHERE user_key = ? "
+                    f"AND card_id IN ({', '.join('?' * len(chunk))})",
+                    [user_key, *chunk],
+                )
+                seen.update(row[0] for row in c.fetchall())
+        return seen
+
+    def record_reviews(
+        self, user_key: str, reviews: Iterable[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Apply a batch of reviews in one transaction and return the new states.
+
+        Each review is a dict with ``card_id``, ``quality`` (0-5) and optionally
+        ``kind`` and ``payload``. Unknown cards are created on first review.
+        """
+        now = time.time()
+        results = []
+        with self._get_conn() as conn:
+            conn.row_factory = sqlite3.Row
+            c = conn.cursor()
+            for review in reviews:
+                card_id = review["card_id"]
+                c.execute(
+                    "SELECT ease, interval_days, reps, lapses FROM srs_cards "
+                    "WHERE user_key = ? AND card_id = ?",
+                    (user_key, card_id),
+                )
+                row = c.fetchone()
+                ease, interval_days, reps, lapses = (
+                    tuple(row) if row else (DEFAULT_EASE, 0.0, 0, 0)
+                )
+                state = sm2_schedule(ease, interval_days, reps, review["quality"])
+                if review["quality"] < 3 and row:
+                    lapses += 1
+                due_at = now + state["interval_days"] * DAY_SECONDS
+                payload = review.get("payload")
+                c.execute(
+                    """INSERT INTO srs_cards
+                           (user_key, card_id, kind, payload, ease, interval_days,
+                            reps, lapses, due_at, last_review)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(user_key, card_id) DO UPDATE SET
+                           payload = COALESCE(excluded.payload, srs_cards.payload),
+                           ease = excluded.ease,
+                           interval_days = excluded.interval_days,
+                           reps = excluded.reps,
+                           lapses = excluded.lapses,
+                           due_at = excluded.due_at,
+                           last_review = excluded.last_review""",
+                    (
+                        user_key,
+                        card_id,
+                        review.get("kind") or "exercise",
+                        json.dumps(payload, ensure_ascii=False) if payload else None,
+                        state["ease"],
+                        state["interval_days"],
+                        state["reps"],
+                        lapses,
+                        due_at,
+                        now,
+                    ),
+                )
+                results.append(
+                    {
+                        "card_id": card_id,
+                        "ease": state["ease"],
+                        "interval_days": state["interval_days"],
+                        "reps": state["reps"],
+                        "lapses": lapses,
+                        "due_at": due_at,
+                    }
+                )
+            conn.commit()
+        return results
+
+
+# Singleton
+try:
+    srs_store = SRSStore()
+except sqlite3.Error as e:
+    logger.error(f"SRS store unavailable: {e}")
+    srs_store = None
@@ -209,7 +209,7 @@ window.EchoFeatures = (function () {
         const data = await res.json();
         this.pool = (data.exercises || []).map((e, i) => ({
           ...e,
-          id: 'ai_' + i,
+          id: e.id || 'ai_' + i,
           type: 'fill_blank',
         }));
         this.index = 0;
@@ -437,8 +437,114 @@ window.EchoFeatures = (function () {
     },
   };
 
+  // ─── LIVE STT (WebSocket, transcribes while the learner speaks) ───
+  const LiveTranscriber = {
+    open(stream, lang) {
+      const AudioCtx = window.AudioContext || window.webkitAudioContext;
+      if (!window.WebSocket || !AudioCtx) return null;
+      const proto = location.protocol === 'https:' ? 'wss' : 'ws';
+      const session = {
+        ws: null,
+        ctx: null,
+        queue: [],
+        failed: false,
+        final: null,
+        onFinal: null,
+      };
+      try {
+        session.ws = new WebSocket(
+          `${proto}://${location.host}/transcribe/ws?language=${encodeURIComponent(lang || 'en')}`,
+        );
+        session.ws.binaryType = 'arraybuffer';
+      } catch (e) {
+        return null;
+      }
+      session.ws.onopen = () => {
+        session.queue.forEach((buf) => session.ws.send(buf));
+        session.queue = [];
+      };
+      session.ws.onmessage = (e) => {
+        let event;
+        try {
+          event = JSON.parse(e.data);
+        } catch (err) {
+          return;
+        }
+        if (event.type === 'final') session.final = event.text || '';
+        if (event.type === 'error') session.failed = true;
+        if ((event.type === 'final' || event.type === 'error') && session.onFinal)
+          session.onFinal();
+      };
+      const fail = () => {
+        session.failed = true;
+        if (session.onFinal) session.onFinal();
+      };
+      session.ws.onerror = fail;
+      session.ws.onclose = fail;
+
+      // Downsample the mic to 16 kHz mono 16-bit PCM and send ~100 ms chunks
+      try {
+        session.ctx = new AudioCtx();
+        const source = session.ctx.createMediaStreamSource(stream);
+        const node = session.ctx.createScriptProcessor(4096, 1, 1);
+        const ratio = session.ctx.sampleRate / 16000;
+        node.onaudioprocess = (e) => {
+          const input = e.inputBuffer.getChannelData(0);
+          const out = new Int16Array(Math.floor(input.length / ratio));
+          for (let i = 0; i < out.length; i++) {
+            const s = Math.max(-1, Math.min(1, input[Math.floor(i * ratio)]));
+            out[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+          }
+          if (session.ws.readyState === WebSocket.OPEN) {
+            session.ws.send(out.buffer);
+          } else if (session.ws.readyState === WebSocket.CONNECTING) {
+            session.queue.push(out.buffer);
+          }
+        };
+        source.connect(node);
+        node.connect(session.ctx.destination);
+      } catch (e) {
+        session.ws.close();
+        return null;
+      }
+      return session;
+    },
+    stopAudio(session) {
+      if (session?.ctx) {
+        session.ctx.close().catch(() => {});
+        session.ctx = null;
+      }
+    },
+    // Resolves with the final transcript, or null if streaming failed
+    finish(session, timeoutMs = 8000) {
+      this.stopAudio(session);
+      return new Promise((resolve) => {
+        const done = () => {
+          clearTimeout(timer);
+          try {
+            session.ws.close();
+          } catch (e) {}
+          resolve(session.failed ? null : session.final);
+        };
+        const timer = setTimeout(() => {
+          session.failed = session.final === null;
+          done();
+        }, timeoutMs);
+        if (session.final !== null || session.failed) return done();
+        session.onFinal = done;
+        try {
+          session.ws.send(JSON.stringify({ type: 'end' }));
+        } catch (e) {
+          session.failed = true;
+          done();
+        }
+      });
+    },
+  };
+
   // ─── WHISPER STT ───
   const Whisper = {
+    live: null,
     recorder: null,
     chunks: [],
     recording: false,
@@ -482,6 +588,8 @@ window.EchoFeatures = (function () {
         };
         this.recorder.start(250);
         this.recording = true;
+        if (this.live) this.live.ws.close();
+        this.live = LiveTranscriber.open(stream, lang);
 
         // Simple VAD (Voice Activity Detection) for auto-stop
         if (onSilence) {
@@ -551,6 +659,7 @@ window.EchoFeatures = (function () {
 
         const finish = () => {
           this.recording = false;
+          LiveTranscriber.stopAudio(this.live);
           if (this.recorder && this.recorder.stream) {
             this.recorder.stream.getTracks().forEach((t) => t.stop());
           }
@@ -579,6 +688,16 @@ window.EchoFeatures = (function () {
       });
     },
     async transcribe(blob, lang) {
+      // Streaming session: only the last segment is still being transcribed
+      const live = this.live;
+      this.live = null;
+      if (live) {
+        const text = await LiveTranscriber.finish(live);
+        if (text && text.trim()) {
+          return { ok: true, text: text, language: lang || 'en' };
+        }
+      }
+
       const form = new FormData();
       form.append('audio', blob, `recording.${this.fileExt || 'webm'}`);
       form.append('language', lang || 'en');
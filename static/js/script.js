@@ -51,6 +51,11 @@ document.addEventListener('DOMContentLoaded', () => {
   let autoListen = true;
   let isMuted = false;
   let ended = false;
+  // Reply being streamed: server stream id and fetch controller
+  let activeStream = null;
+  // Server-held conversation (/sessions): once set, chat turns send only
+  // the new message; the local history stays the source for recreating it
+  let chatSessionId = sessionStorage.getItem('echo_chat_session');
   let turn = 'user';
   let autoMicRetryCount = 0;
   let autoMicBlockedUntil = 0;
@@ -1208,6 +1213,7 @@ document.addEventListener('DOMContentLoaded', () => {
     msgCount = 0;
     guestUserMessages = 0;
     conversationHistory = [];
+    forgetChatSession({ remove: true });
     ended = false;
     turn = 'user';
     updateStats();
@@ -1676,6 +1682,7 @@ document.addEventListener('DOMContentLoaded', () => {
   function enforceGuestTrialLimit() {
     if (!isGuestTrialExpired()) return false;
     ended = true;
+    cancelActiveStream();
     turn = 'done';
     closeMic();
     speechSessionId += 1;
@@ -1715,20 +1722,74 @@ document.addEventListener('DOMContentLoaded', () => {
     if (!userScrolledUp) messagesDiv.scrollTop = messagesDiv.scrollHeight;
   }
 
-  async function fetchNonStreamingResponse(history, { signal } = {}) {
-    const res = await fetch('/chat', {
+  function forgetChatSession({ remove = false } = {}) {
+    if (remove && chatSessionId) {
+      fetch(`/sessions/${encodeURIComponent(chatSessionId)}`, {
+        method: 'DELETE',
+        keepalive: true,
+      }).catch(() => {});
+    }
+    chatSessionId = null;
+    try {
+      sessionStorage.removeItem('echo_chat_session');
+    } catch (e) {}
+  }
+
+  // Request body for a chat turn: the new message of the server-held session
+  // when there is one (created from the history on the first real turn),
+  // otherwise the whole history
+  async function chatRequestBody(history) {
+    const body = {
+      level: selectedLevel,
+      topic: selectedTopic,
+      language: selectedLanguage,
+      scenario: selectedScenario,
+      user_name: currentUser?.full_name || currentUser?.email || '',
+    };
+    const last = history[history.length - 1];
+    if (history.length < 2 || last?.role !== 'user') return { ...body, history };
+    if (!chatSessionId) {
+      try {
+        const res = await fetch('/sessions', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ history: history.slice(0, -1) }),
+        });
+        const data = await res.json().catch(() => ({}));
+        if (res.ok && data.session_id) {
+          chatSessionId = data.session_id;
+          sessionStorage.setItem('echo_chat_session', chatSessionId);
+        }
+      } catch (e) {}
+    }
+    if (!chatSessionId) return { ...body, history };
+    return { ...body, session_id: chatSessionId, message: last.content };
+  }
+
+  // POST a chat turn; an expired session is recreated from the local history
+  async function postChatTurn(url, history, { signal } = {}) {
+    let body = await chatRequestBody(history);
+    let res = await fetch(url, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        history,
-        level: selectedLevel,
-        topic: selectedTopic,
-        language: selectedLanguage,
-        scenario: selectedScenario,
-        user_name: currentUser?.full_name || currentUser?.email || '',
-      }),
+      body: JSON.stringify(body),
       signal,
     });
+    if (res.status === 404 && body.session_id) {
+      forgetChatSession();
+      body = await chatRequestBody(history);
+      res = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal,
+      });
+    }
+    return res;
+  }
+
+  async function fetchNonStreamingResponse(history, { signal } = {}) {
+    const res = await postChatTurn('/chat', history, { signal });
 
     const data = await res.json().catch(() => ({}));
     if (!res.ok) {
@@ -1797,17 +1858,7 @@ document.addEventListener('DOMContentLoaded', () => {
         streamController.abort();
       }, 90000);
 
-      const res = await fetch('/chat/stream', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          history,
-          level: selectedLevel,
-          topic: selectedTopic,
-          language: selectedLanguage,
-          scenario: selectedScenario,
-          user_name: currentUser?.full_name || currentUser?.email || '',
-        }),
+      const res = await postChatTurn('/chat/stream', history, {
         signal: streamController.signal,
       });
 
@@ -1821,12 +1872,13 @@ document.addEventListener('DOMContentLoaded', () => {
         clearTimeout(hardTimeout);
         throw new Error('Streaming unsupported on this browser');
       }
+      activeStream = { id: res.headers.get('X-Stream-Id'), controller: streamController };
 
       if (typingEl.parentNode) typingEl.remove();
       const streamMsg = addMessageToDOM('', 'ai', true);
       let fullText = '';
-      const reader = res.body.getReader();
-      const decoder = new TextDecoder();
+      let reader = res.body.getReader();
+      let decoder = new TextDecoder();
       let buffer = '';
       let firstTokenSeen = false;
       let firstTokenTimeout = setTimeout(() => {
@@ -1834,21 +1886,65 @@ document.addEventListener('DOMContentLoaded', () => {
           streamController.abort();
         } catch (e) {}
       }, 20000);
+      // SSE id of the last event handled ("<stream>:<seq>"), for resuming
+      let eventId = '';
+      let lastEventId = '';
+      let streamFinished = false;
+      let resumeAttempts = 0;
 
       setAvatarState('speaking');
       startLipSync();
 
       while (true) {
-        const { done, value } = await reader.read();
+        let chunk;
+        try {
+          chunk = await reader.read();
+        } catch (readError) {
+          // Connection dropped mid-reply: fetch the rest of the same reply
+          if (!lastEventId || streamFinished || streamController.signal.aborted) {
+            throw readError;
+          }
+          let resumed = null;
+          while (!resumed && resumeAttempts < 3) {
+            resumeAttempts++;
+            await new Promise((resolve) => setTimeout(resolve, 1000 * resumeAttempts));
+            try {
+              const retry = await fetch('/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Last-Event-ID': lastEventId },
+                body: '{}',
+                signal: streamController.signal,
+              });
+              if (retry.ok && retry.body) resumed = retry;
+              else if (retry.status < 500) break;
+            } catch (e) {
+              if (streamController.signal.aborted) throw e;
+            }
+          }
+          if (!resumed) throw readError;
+          reader = resumed.body.getReader();
+          decoder = new TextDecoder();
+          buffer = '';
+          continue;
+        }
+        const { done, value } = chunk;
         if (done) break;
         buffer += decoder.decode(value, { stream: true });
         const lines = buffer.split('\n');
         buffer = lines.pop();
 
         for (const line of lines) {
+          if (line.startsWith('id: ')) {
+            eventId = line.slice(4).trim();
+            continue;
+          }
           if (!line.startsWith('data: ')) continue;
+          if (eventId) lastEventId = eventId;
           const payload = line.slice(6).trim();
-          if (payload === '[DONE]') continue;
+          if (payload === '[DONE]') {
+            streamFinished = true;
+            continue;
+          }
           try {
             const data = JSON.parse(payload);
             if (data.error) throw new Error(data.error);
@@ -1869,6 +1965,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
       clearTimeout(firstTokenTimeout);
       clearTimeout(hardTimeout);
+      activeStream = null;
 
       if (!fullText.trim()) {
         throw new Error('Empty streaming response');
@@ -1898,6 +1995,12 @@ document.addEventListener('DOMContentLoaded', () => {
         if (autoListen && !ended) setTimeout(() => openMic(), 300);
       }
     } catch (error) {
+      activeStream = null;
+      if (ended && error?.name === 'AbortError') {
+        // Session ended mid-reply (see cancelActiveStream)
+        if (typingEl.parentNode) typingEl.remove();
+        return;
+      }
       const canFallbackToJson =
         error?.name === 'AbortError' ||
         /Streaming unsupported|Empty streaming response|Failed to fetch|NetworkError/i.test(
@@ -1905,6 +2008,8 @@ document.addEventListener('DOMContentLoaded', () => {
         );
 
       if (canFallbackToJson) {
+        // The failed stream may still have completed into the session
+        forgetChatSession();
         try {
           if (typingEl.parentNode) typingEl.remove();
           const fallbackTyping = showTypingIndicator();
@@ -2250,11 +2355,27 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   });
 
+  // Stop a reply that is still streaming, on the server too
+  function cancelActiveStream() {
+    const stream = activeStream;
+    activeStream = null;
+    if (!stream) return;
+    if (stream.id) {
+      fetch(`/chat/stream/${encodeURIComponent(stream.id)}/cancel`, {
+        method: 'POST',
+        keepalive: true,
+      }).catch(() => {});
+    }
+    stream.controller.abort();
+  }
+  window.addEventListener('pagehide', cancelActiveStream);
+
   // ============================================
   // 11. END CONVERSATION → SHOW SUMMARY
   // ============================================
   endBtn.addEventListener('click', () => {
     ended = true;
+    cancelActiveStream();
     closeMic();
     speechSessionId += 1;
     window.speechSynthesis.cancel();
@@ -2276,6 +2397,7 @@ document.addEventListener('DOMContentLoaded', () => {
   $('summary-restart')?.addEventListener('click', () => {
     $('summary-modal')?.classList.add('hidden');
     sessionStorage.removeItem('echo_history');
+    forgetChatSession({ remove: true });
     location.reload();
   });
 
@@ -129,18 +129,26 @@ window.EchoExtra = (function () {
         // Get current language from global state (set by script.js)
         const language = window._echoLanguage || 'en';
 
-        const res = await fetch('/story/generate', {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({
-            language: language,
-            level: this.currentLevel,
-            topic: this.currentTopic,
-          }),
+        const body = JSON.stringify({
+          language: language,
+          level: this.currentLevel,
+          topic: this.currentTopic,
         });
 
-        if (!res.ok) throw new Error('Server error');
-        const data = await res.json();
+        let data;
+        const streamable =
+          typeof TextDecoder !== 'undefined' && window.ReadableStream;
+        if (streamable) {
+          data = await this.generateStreaming(body);
+        } else {
+          const res = await fetch('/story/generate', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: body,
+          });
+          if (!res.ok) throw new Error('Server error');
+          data = await res.json();
+        }
         if (data.error) throw new Error(data.error);
 
         this.currentStory = data;
@@ -163,6 +171,58 @@ window.EchoExtra = (function () {
       }
     },
 
+    async generateStreaming(body) {
+      const res = await fetch('/story/generate/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: body,
+      });
+      if (!res.ok || !res.body || !res.body.getReader) {
+        throw new Error('Server error');
+      }
+
+      const card = $('story-card');
+      const titleEl = $('story-title');
+      const bodyEl = $('story-body');
+      const text = { title: '', story: '' };
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let story = null;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+
+        for (const line of lines) {
+          if (!line.startsWith('data: ')) continue;
+          const payload = line.slice(6).trim();
+          if (payload === '[DONE]') continue;
+          let event;
+          try {
+            event = JSON.parse(payload);
+          } catch (e) {
+            continue;
+          }
+          if (event.error) throw new Error(event.error);
+          if (event.done) {
+            story = event.story;
+          } else if (event.delta !== undefined && event.field in text) {
+            // Show the text as it is written; render() replaces it at the end
+            text[event.field] += event.delta;
+            if (card) card.classList.remove('hidden');
+            if (titleEl) titleEl.textContent = text.title;
+            if (bodyEl) bodyEl.textContent = text.story;
+          }
+        }
+      }
+      if (!story) throw new Error('Incomplete story stream');
+      return story;
+    },
+
     render(data) {
       const imgEl = $('story-image');
       const shimmer = $('story-shimmer');
@@ -0,0 +1,172 @@
+"""
+Story illustration lookup for ``/story/image``.
+
+Unsplash and Pexels are queried concurrently over pooled HTTP sessions and
+the first good result wins, so a slow provider no longer adds its timeout
+to the other's. Results are cached by normalised query for a long TTL, and
+identical lookups that arrive while one is in flight wait for it instead of
+calling the providers again. ``prefetch()`` starts a lookup in the
+background, so the image is usually ready by the time the client asks for
+it after a story is generated.
+
+A lookup that finds nothing returns ``{"url": None, "source":
+"pollinations"}`` and the client falls back to Pollinations.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from ttl_cache import TTLCache
+
+logger = logging.getLogger("story_images")
+
+FALLBACK = {"url": None, "source": "pollinations"}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def image_query(topic: str, image_prompt: str = "") -> str:
+    """The search query ``/story/image`` uses for a story."""
+    topic = str(topic or "")[:60]
+    return topic or str(image_prompt or "")[:80]
+
+
+def _session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config.IMAGE_POOL_WORKERS)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class StoryImageFinder:
+    """Concurrent Unsplash/Pexels lookup with an LRU + TTL result cache."""
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries or Config.IMAGE_CACHE_SIZE
+        self.ttl = ttl or Config.IMAGE_CACHE_TTL
+        self.timeout = Config.IMAGE_LOOKUP_TIMEOUT
+        self._pool = ThreadPoolExecutor(
+            max_workers=Config.IMAGE_POOL_WORKERS, thread_name_prefix="image"
+        )
+        # Prefetches wait on provider calls, so they get their own threads
+        self._prefetch_pool = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="image-prefetch"
+        )
+        self._sessions = {"unsplash": _session(), "pexels": _session()}
+        self._cache = TTLCache(
+            "story_image", self.max_entries, self.ttl, ttl_for=self._ttl_for
+        )
+        self._lock = threading.Lock()
+        self.prefetches = 0
+
+    # ── Providers ──
+
+    def _unsplash(self, query: str) -> Optional[Dict[str, Any]]:
+        r = self._sessions["unsplash"].get(
+            "https://api.unsplash.com/photos/random",
+            params={
+                "query": query,
+                "orientation": "landscape",
+                "count": 1,
+                "content_filter": "high",
+            },
+            headers={"Authorization": f"Client-ID {Config.UNSPLASH_ACCESS_KEY}"},
+            timeout=self.timeout,
+        )
+        if r.ok:
+            photos = r.json()
+            if isinstance(photos, list) and photos:
+                return {"url": photos[0]["urls"]["regular"], "source": "unsplash"}
+        return None
+
+    def _pexels(self, query: str) -> Optional[Dict[str, Any]]:
+        r = self._sessions["pexels"].get(
+            "https://api.pexels.com/v1/search",
+            params={"query": query, "per_page": 1, "orientation": "landscape"},
+            headers={"Authorization": Config.PEXELS_API_KEY},
+            timeout=self.timeout,
+        )
+        if r.ok:
+            d = r.json()
+            if d.get("photos"):
+                return {"url": d["photos"][0]["src"]["large"], "source": "pexels"}
+        return None
+
+    def _providers(self) -> List[Tuple[str, Callable[[str], Optional[dict]]]]:
+        providers = []
+        if Config.UNSPLASH_ACCESS_KEY:
+            providers.append(("unsplash", self._unsplash))
+        if Config.PEXELS_API_KEY:
+            providers.append(("pexels", self._pexels))
+        return providers
+
+    def _search(self, query: str) -> Dict[str, Any]:
+        """Query every configured provider at once; first good result wins."""
+        pending = {self._pool.submit(fn, query): name for name, fn in self._providers()}
+        deadline = time.monotonic() + self.timeout + 1
+        while pending:
+            done, _ = wait(
+                pending,
+                timeout=max(0.0, deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                logger.warning(f"Image lookup timed out for {query!r}")
+                break
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"{name.title()} image fetch failed: {e}")
+                    continue
+                if result:
+                    # Losers finish in the background; their results are dropped
+                    return result
+        return dict(FALLBACK)
+
+    # ── Cache ──
+
+    def _ttl_for(self, result: Dict[str, Any]) -> float:
+        # Misses are cached briefly so a provider outage is retried soon
+        return self.ttl if result.get("url") else min(self.ttl, 60)
+
+    def lookup(self, query: str) -> Tuple[Dict[str, Any], bool]:
+        """Return ``(result, cached)`` for ``query``."""
+        key = normalize_query(query)
+        return self._cache.get_or_compute(key, lambda: self._search(key))
+
+    def prefetch(self, query: str):
+        """Start a lookup in the background unless it is cached or running."""
+        key = normalize_query(query)
+        if not key or not self._providers():
+            return
+        if self._cache.known(key):
+            return
+        with self._lock:
+            self.prefetches += 1
+        self._prefetch_pool.submit(self._prefetch, key)
+
+    def _prefetch(self, key: str):
+        try:
+            self.lookup(key)
+        except Exception as e:
+            logger.warning(f"Image prefetch failed for {key!r}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            prefetches = self.prefetches
+        return dict(self._cache.stats(), prefetches=prefetches)
+
+
+story_images = StoryImageFinder()
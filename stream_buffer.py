@@ -0,0 +1,399 @@
+"""
+Resumable SSE streams.
+
+The events of a resumable stream are produced by a background thread, so the
+generation outlives the connection that started it, and kept in a
+short-lived buffer: in memory for readers in the same worker, and in SQLite
+(``sse_streams`` / ``sse_events`` in ``Config.DATA_DB_PATH``) for readers in
+other workers, written every ``Config.STREAM_FLUSH_MS``.
+
+Events are numbered from 1 and sent with the SSE id ``<stream_id>:<seq>``,
+so the ``Last-Event-ID`` of a reconnect names both the stream and the
+position to resume after. A reader replays what it missed, then follows the
+generation until it ends. Buffers are dropped ``Config.STREAM_BUFFER_TTL``
+seconds after their last event.
+
+A generation nobody is reading is cancelled: once its last reader has gone
+(and no reader in another worker has polled it) for
+``Config.STREAM_RESUME_GRACE_S``, or at once through ``cancel()``. The
+producer's ``emit`` then returns False, and the producer should stop and
+close its upstream call.
+"""
+
+import atexit
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger("stream_buffer")
+
+# How often the flusher drops expired buffers (s)
+SWEEP_SECONDS = 30
+# A running stream's row is touched at least this often (s), so readers in
+# other workers can tell a slow generation from a dead worker
+HEARTBEAT_SECONDS = 2
+
+
+CANCELLED_FRAME = b'data: {"error": "The reply was cancelled."}\n\n'
+
+
+class StreamLost(Exception):
+    """The stream is unknown, expired, or its worker stopped producing it."""
+
+
+class _Stream:
+    __slots__ = (
+        "id",
+        "frames",
+        "done",
+        "cond",
+        "updated",
+        "persisted",
+        "beat",
+        "readers",
+        "detached",
+        "cancelled",
+    )
+
+    def __init__(self, stream_id: str):
+        self.id = stream_id
+        self.frames: List[bytes] = []
+        self.done = False
+        self.cond = threading.Condition()
+        self.updated = time.time()
+        self.persisted = 0  # frames written to SQLite
+        self.beat = 0.0  # last time the sse_streams row was written
+        self.readers = 0  # readers in this worker
+        self.detached: Optional[float] = self.updated  # when the last one left
+        self.cancelled: Optional[str] = None  # "abandoned" | "requested"
+
+
+class StreamBuffer:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.DATA_DB_PATH
+        self._init_db()
+        self._reset_process()
+        if hasattr(os, "register_at_fork"):
+            # gunicorn --preload: streams belong to the process producing them
+            os.register_at_fork(after_in_child=self._reset_process)
+        atexit.register(self.flush)
+
+    def _reset_process(self):
+        self._lock = threading.Lock()
+        self._local: Dict[str, _Stream] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._last_sweep = time.time()
+        self._cancelled = {"abandoned": 0, "requested": 0}
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        """Create the stream and event tables."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sse_streams (
+                    stream_id TEXT PRIMARY KEY,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    read_at REAL NOT NULL DEFAULT 0,
+                    cancel INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+                """
+            )
+            # Safe migrations for existing DBs
+            for col, defn in [
+                ("read_at", "REAL NOT NULL DEFAULT 0"),
+                ("cancel", "INTEGER NOT NULL DEFAULT 0"),
+            ]:
+                try:
+                    c.execute(f"ALTER TABLE sse_streams ADD COLUMN {col} {defn}")
+                except sqlite3.OperationalError:
+                    pass
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sse_events (
+                    stream_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    frame BLOB NOT NULL,
+                    PRIMARY KEY (stream_id, seq)
+                ) WITHOUT ROWID
+                """
+            )
+            c.execute(
+                "CREATE INDEX IF NOT EXISTS idx_sse_streams_updated "
+                "ON sse_streams (updated_at)"
+            )
+
+    # ── Producing ──
+
+    def start(self, produce: Callable[[Callable[[bytes], bool]], None]) -> str:
+        """Run ``produce(emit)`` on a new thread; returns the stream id.
+
+        Each ``emit(frame)`` call appends one SSE frame (``data: ...\\n\\n``,
+        without an ``id:`` line) and returns False once the stream has been
+        cancelled. The stream ends when ``produce`` returns.
+        """
+        stream = _Stream(secrets.token_urlsafe(12))
+        with self._lock:
+            self._local[stream.id] = stream
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="stream-buffer-flush", daemon=True
+                )
+                self._flusher.start()
+        threading.Thread(
+            target=self._produce,
+            args=(stream, produce),
+            name=f"stream-{stream.id}",
+            daemon=True,
+        ).start()
+        return stream.id
+
+    def _produce(self, stream: _Stream, produce):
+        def emit(frame) -> bool:
+            if isinstance(frame, str):
+                frame = frame.encode("utf-8")
+            with stream.cond:
+                if stream.cancelled:
+                    return False
+                if frame:
+                    stream.frames.append(frame)
+                    stream.updated = time.time()
+                    stream.cond.notify_all()
+            return True
+
+        try:
+            produce(emit)
+        except Exception as e:
+            logger.error(f"Stream {stream.id} failed: {e}", exc_info=True)
+        finally:
+            with stream.cond:
+                if stream.cancelled:
+                    stream.frames.append(CANCELLED_FRAME)
+                stream.done = True
+                stream.updated = time.time()
+                stream.cond.notify_all()
+
+    # ── Reading ──
+
+    def events(self, stream_id: str, after: int = 0) -> Iterator[Tuple[int, bytes]]:
+        """(seq, frame) for every event after ``after``, until the stream ends.
+
+        Raises ``StreamLost`` if the stream is unknown or expired, or if it is
+        produced by another worker that has stopped updating it.
+        """
+        stream = self._local.get(stream_id)
+        if stream is not None:
+            yield from self._local_events(stream, after)
+        else:
+            yield from self._shared_events(stream_id, after)
+
+    @staticmethod
+    def _local_events(stream: _Stream, after: int):
+        with stream.cond:
+            stream.readers += 1
+            stream.detached = None
+        try:
+            while True:
+                with stream.cond:
+                    while len(stream.frames) <= after and not stream.done:
+                        stream.cond.wait()
+                    frames = stream.frames[after:]
+                    done = stream.done
+                for frame in frames:
+                    after += 1
+                    yield after, frame
+                if done and after >= len(stream.frames):
+                    return
+        finally:
+            # Also reached when the client disconnects and the response closes
+            with stream.cond:
+                stream.readers -= 1
+                if not stream.readers:
+                    stream.detached = time.time()
+
+    def _shared_events(self, stream_id: str, after: int):
+        poll = Config.STREAM_FLUSH_MS / 1000
+        beat = min(HEARTBEAT_SECONDS, Config.STREAM_RESUME_GRACE_S / 2)
+        read_at = 0.0
+        while True:
+            with self._get_conn() as conn:
+                if time.time() - read_at >= beat:
+                    # Tells the producing worker someone is still reading
+                    read_at = time.time()
+                    conn.execute(
+                        "UPDATE sse_streams SET read_at = ? WHERE stream_id = ?",
+                        (read_at, stream_id),
+                    )
+                row = conn.execute(
+                    "SELECT done, updated_at FROM sse_streams WHERE stream_id = ?",
+                    (stream_id,),
+                ).fetchone()
+                rows = conn.execute(
+                    "SELECT seq, frame FROM sse_events "
+                    "WHERE stream_id = ? AND seq > ? ORDER BY seq",
+                    (stream_id, after),
+                ).fetchall()
+            if row is None or time.time() - row[1] > Config.STREAM_BUFFER_TTL:
+                raise StreamLost(stream_id)
+            for seq, frame in rows:
+                after = seq
+                yield seq, bytes(frame)
+            if row[0] and not rows:
+                return
+            if not rows and time.time() - row[1] > Config.STREAM_STALE_S:
+                raise StreamLost(stream_id)
+            time.sleep(poll)
+
+    # ── Cancelling ──
+
+    def cancel(self, stream_id: str) -> bool:
+        """Stop a running generation, in this worker or another one.
+
+        Returns False if the stream is unknown or has already finished.
+        """
+        stream = self._local.get(stream_id)
+        if stream is not None:
+            return self._cancel(stream, "requested")
+        try:
+            with self._get_conn() as conn:
+                cursor = conn.execute(
+                    "UPDATE sse_streams SET cancel = 1 "
+                    "WHERE stream_id = ? AND done = 0",
+                    (stream_id,),
+                )
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.warning(f"Could not cancel stream {stream_id}: {e}")
+            return False
+
+    def _cancel(self, stream: _Stream, reason: str) -> bool:
+        with stream.cond:
+            if stream.done or stream.cancelled:
+                return False
+            stream.cancelled = reason
+            stream.cond.notify_all()
+        self._cancelled[reason] += 1
+        logger.info(f"Stream {stream.id} cancelled ({reason})")
+        return True
+
+    def _check_cancels(self, conn, running: List[_Stream], now: float):
+        """Cancel running streams that were asked to stop or lost their readers."""
+        marks = {}
+        for i in range(0, len(running), 500):
+            ids = [s.id for s in running[i : i + 500]]
+            marks.update(
+                (row[0], row[1:])
+                for row in conn.execute(
+                    "SELECT stream_id, cancel, read_at FROM sse_streams "
+                    f"WHERE stream_id IN ({','.join('?' * len(ids))})",
+                    ids,
+                )
+            )
+        grace = Config.STREAM_RESUME_GRACE_S
+        for stream in running:
+            cancel, read_at = marks.get(stream.id, (0, 0.0))
+            if cancel:
+                self._cancel(stream, "requested")
+            elif (
+                stream.detached is not None
+                and now - stream.detached >= grace
+                and now - read_at >= grace
+            ):
+                self._cancel(stream, "abandoned")
+
+    # ── Persistence ──
+
+    def flush(self):
+        """Write new frames and stream state of this worker's streams."""
+        now = time.time()
+        with self._lock:
+            streams = list(self._local.values())
+        events, states, marks = [], [], []
+        for stream in streams:
+            with stream.cond:
+                frames = stream.frames[stream.persisted :]
+                done = stream.done
+                count = len(stream.frames)
+            if stream.beat == -1 or (
+                not frames and not done and now - stream.beat < HEARTBEAT_SECONDS
+            ):
+                continue  # finished and written, or nothing new yet
+            start = stream.persisted
+            events.extend(
+                (stream.id, start + i + 1, frame) for i, frame in enumerate(frames)
+            )
+            states.append((stream.id, int(done), now))
+            marks.append((stream, count, done))
+        running = [s for s in streams if not s.done and not s.cancelled]
+        if states or running:
+            try:
+                with self._get_conn() as conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO sse_events (stream_id, seq, frame) "
+                        "VALUES (?, ?, ?)",
+                        events,
+                    )
+                    conn.executemany(
+                        "INSERT INTO sse_streams (stream_id, done, updated_at) "
+                        "VALUES (?, ?, ?) ON CONFLICT (stream_id) DO UPDATE SET "
+                        "done = excluded.done, updated_at = excluded.updated_at",
+                        states,
+                    )
+                    if running:
+                        self._check_cancels(conn, running, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write stream buffers: {e}")
+                return
+            for stream, count, done in marks:
+                stream.persisted = count
+                stream.beat = -1 if done else now
+        if now - self._last_sweep >= SWEEP_SECONDS:
+            self._last_sweep = now
+            self._sweep(now)
+
+    def _sweep(self, now: float):
+        cutoff = now - Config.STREAM_BUFFER_TTL
+        with self._lock:
+            for stream_id, stream in list(self._local.items()):
+                if stream.done and stream.beat == -1 and stream.updated < cutoff:
+                    del self._local[stream_id]
+        try:
+            with self._get_conn() as conn:
+                conn.execute(
+                    "DELETE FROM sse_events WHERE stream_id IN "
+                    "(SELECT stream_id FROM sse_streams WHERE updated_at < ?)",
+                    (cutoff,),
+                )
+                conn.execute("DELETE FROM sse_streams WHERE updated_at < ?", (cutoff,))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not expire stream buffers: {e}")
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(Config.STREAM_FLUSH_MS / 1000)
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            streams = list(self._local.values())
+        return {
+            "local_streams": len(streams),
+            "running": sum(1 for s in streams if not s.done),
+            "cancelled": dict(self._cancelled),
+        }
+
+
+stream_buffer = StreamBuffer()
@@ -0,0 +1,668 @@
+"""
+Structured (JSON) generation for the LLM-backed endpoints.
+
+One pipeline replaces the per-endpoint "strip code fences, json.loads,
+return 500" handling:
+
+1. ask the provider for JSON mode (``response_format={"type": "json_object"}``)
+2. parse, then validate against the endpoint's schema
+3. on failure, try cheap local repairs (code fences, trailing text,
+   single quotes, trailing commas, truncated output)
+4. only as a last resort, send one repair prompt back to the model
+
+Per-endpoint outcome counters are kept so parse-failure rates are visible.
+
+``stream_json_object`` streams the completion instead and parses the object
+incrementally, so string fields can be forwarded to the client as they are
+generated.
+"""
+
+import json
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+import tracing
+
+logger = logging.getLogger("structured")
+
+# ─── Per-endpoint schemas (a small JSON-Schema subset) ───
+_STR = {"type": "string"}
+
+SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "generate_exercises": {
+        "type": "array",
+        "minItems": 1,
+        "items": {
+            "type": "object",
+            "required": ["q", "options", "answer"],
+            "properties": {
+                "q": _STR,
+                "options": {"type": "array", "items": _STR},
+                "answer": _STR,
+                "explain": _STR,
+            },
+        },
+    },
+    "generate_story": {
+        "type": "object",
+        "required": ["title", "story"],
+        "properties": {
+            "title": _STR,
+            "story": _STR,
+            "vocabulary": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["word"],
+                    "properties": {"word": _STR, "translation": _STR, "example": _STR},
+                },
+            },
+            "image_prompt": _STR,
+        },
+    },
+    "vocab_suggest": {
+        "type": "array",
+        "minItems": 1,
+        "items": {
+            "type": "object",
+            "required": ["word", "translation"],
+            "properties": {
+                "word": _STR,
+                "translation": _STR,
+                "example": _STR,
+                "tip": _STR,
+            },
+        },
+    },
+    "grammar_check": {
+        "type": "object",
+        "required": ["is_correct", "corrected"],
+        "properties": {
+            "is_correct": {"type": "boolean"},
+            "corrected": _STR,
+            "errors": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["original", "corrected"],
+                    "properties": {
+                        "original": _STR,
+                        "corrected": _STR,
+                        "explanation": _STR,
+                    },
+                },
+            },
+            "score": {"type": "integer"},
+            "tip": _STR,
+        },
+    },
+    "pronunciation_tip": {
+        "type": "object",
+        "required": ["word", "ipa"],
+        "properties": {
+            "word": _STR,
+            "ipa": _STR,
+            "phonetic": _STR,
+            "tips": {"type": "array", "items": _STR},
+            "similar_sound": _STR,
+        },
+    },
+    "daily_challenge": {
+        "type": "object",
+        "required": ["title", "description", "prompt"],
+        "properties": {
+            "title": _STR,
+            "description": _STR,
+            "prompt": _STR,
+            "xp_reward": {"type": "integer"},
+            "category": {
+                "type": "string",
+                "enum": [
+                    "speaking",
+                    "vocabulary",
+                    "grammar",
+                    "roleplay",
+                    "pronunciation",
+                ],
+            },
+        },
+    },
+}
+
+
+class StructuredOutputError(Exception):
+    """The model's reply could not be turned into schema-valid JSON."""
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# ─── Validation ───
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "number": (int, float),
+}
+
+
+def validate(value: Any, schema: Optional[Dict[str, Any]], path: str = "$") -> Any:
+    """Validate ``value`` against ``schema`` and return it, lightly coerced.
+
+    Integers given as numeric strings or floats are coerced; optional
+    properties may be ``null``. Everything else that does not match raises
+    ``SchemaError``.
+    """
+    if not schema:
+        return value
+    expected = schema.get("type")
+    if expected == "integer":
+        if isinstance(value, bool):
+            raise SchemaError(f"{path}: expected integer")
+        try:
+            value = int(float(value))
+        except (TypeError, ValueError):
+            raise SchemaError(f"{path}: expected integer")
+    elif expected == "boolean" and isinstance(value, str):
+        if value.lower() not in ("true", "false"):
+            raise SchemaError(f"{path}: expected boolean")
+        value = value.lower() == "true"
+    elif expected and not isinstance(value, _TYPES[expected]):
+        raise SchemaError(f"{path}: expected {expected}")
+
+    if "enum" in schema and value not in schema["enum"]:
+        raise SchemaError(f"{path}: must be one of {schema['enum']}")
+
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                raise SchemaError(f"{path}: missing '{key}'")
+            if value[key] is None:
+                raise SchemaError(f"{path}.{key}: must not be null")
+        for key, sub in schema.get("properties", {}).items():
+            if key in value and value[key] is not None:
+                value[key] = validate(value[key], sub, f"{path}.{key}")
+    elif expected == "array":
+        if len(value) < schema.get("minItems", 0):
+            raise SchemaError(f"{path}: expected at least {schema['minItems']} items")
+        item_schema = schema.get("items")
+        value = [validate(v, item_schema, f"{path}[{i}]") for i, v in enumerate(value)]
+    return value
+
+
+def _unwrap(value: Any, schema: Optional[Dict[str, Any]]) -> Any:
+    """JSON mode only allows objects; unwrap ``{"items": [...]}`` for array schemas."""
+    if schema and schema.get("type") == "array" and isinstance(value, dict):
+        if isinstance(value.get("items"), list):
+            return value["items"]
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            return lists[0]
+    return value
+
+
+# ─── Local repair ───
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+
+def _normalise(text: str) -> str:
+    """Rewrite single-quoted strings as JSON strings and drop trailing commas."""
+    out: List[str] = []
+    quote = None
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if quote:
+            if ch == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                # \' is not a valid JSON escape
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"' and quote == "'":
+                out.append('\\"')
+            else:
+                out.append(ch)
+        elif ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch == ",":
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j >= n or text[j] not in "}]":
+                out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _scan(text: str, start: int):
+    """Scan one JSON value from ``start``.
+
+    Returns ``(end, stack, cuts, in_string)``: ``end`` is the index just past
+    a complete top-level value (or None if the text ends first), ``stack``
+    holds the pending closers, and ``cuts`` lists ``(index, closers)`` where
+    the text could be cut and closed to yield valid JSON.
+    """
+    stack: List[str] = []
+    cuts: List[Tuple[int, str]] = []
+    in_str = esc = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            if not stack or stack[-1] != ch:
+                return None, [], cuts, False
+            stack.pop()
+            if not stack:
+                return i + 1, [], cuts, False
+            cuts.append((i + 1, "".join(reversed(stack))))
+        elif ch == "," and stack:
+            cuts.append((i, "".join(reversed(stack))))
+    return None, stack, cuts, in_str
+
+
+def _candidates(raw: str, schema: Optional[Dict[str, Any]]):
+    """Yield progressively more aggressive repairs of ``raw``."""
+    text = raw.strip()
+    yield text
+
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+        yield text
+
+    opener = "[" if schema and schema.get("type") == "array" else "{"
+    start = text.find(opener)
+    if start < 0:
+        starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+        if not starts:
+            return
+        start = min(starts)
+    for body in (text, _normalise(text)):
+        end, stack, cuts, in_str = _scan(body, start)
+        if end is not None:
+            # Complete value followed by trailing prose
+            yield body[start:end]
+            continue
+        # Truncated: close what is open, then try earlier cut points
+        if stack:
+            yield body[start:] + ('"' if in_str else "") + "".join(reversed(stack))
+            for idx, closers in reversed(cuts[-20:]):
+                yield body[start:idx] + closers
+
+
+def parse_json(raw: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[Any, bool]:
+    """Parse and validate ``raw``; return ``(value, repaired)``.
+
+    Raises ``StructuredOutputError`` if no repair yields schema-valid JSON.
+    """
+    last_error = "empty response"
+    seen = set()
+    for n, candidate in enumerate(_candidates(raw or "", schema)):
+        if not candidate or candidate in seen:
+            continue
+        seen.add(candidate)
+        try:
+            value = json.loads(candidate)
+            return validate(_unwrap(value, schema), schema), n > 0
+        except (ValueError, SchemaError) as e:
+            last_error = str(e)
+    raise StructuredOutputError(last_error)
+
+
+# ─── Outcome counters ───
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+_OUTCOMES = ("calls", "parsed", "repaired_locally", "repaired_by_prompt", "failed")
+
+
+def _record(endpoint: str, outcome: str):
+    with _stats_lock:
+        counters = _stats.setdefault(endpoint, dict.fromkeys(_OUTCOMES, 0))
+        counters[outcome] += 1
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    """Per-endpoint outcome counts plus the resulting parse-failure rate."""
+    with _stats_lock:
+        result = {}
+        for endpoint, counters in _stats.items():
+            calls = counters["calls"] or 1
+            result[endpoint] = dict(
+                counters,
+                first_pass_failure_rate=round(1 - counters["parsed"] / calls, 4),
+                failure_rate=round(counters["failed"] / calls, 4),
+            )
+        return result
+
+
+# ─── Generation ───
+_json_mode_unsupported: set = set()
+
+
+def _complete(client, messages, json_mode: bool, **kwargs) -> str:
+    base_url = str(getattr(client, "base_url", ""))
+    if json_mode and base_url not in _json_mode_unsupported:
+        try:
+            completion = client.chat.completions.create(
+                messages=messages, response_format={"type": "json_object"}, **kwargs
+            )
+            return (completion.choices[0].message.content or "").strip()
+        except Exception as e:
+            if getattr(e, "status_code", None) != 400:
+                raise
+            if "response_format" in str(e):
+                # Provider/model rejects JSON mode: remember and use plain text
+                logger.warning(f"JSON mode rejected by {base_url}: {e}")
+                _json_mode_unsupported.add(base_url)
+            # Otherwise the provider refused its own invalid JSON
+            # (e.g. json_validate_failed): retry this call without JSON mode.
+    completion = client.chat.completions.create(messages=messages, **kwargs)
+    return (completion.choices[0].message.content or "").strip()
+
+
+def generate_json(
+    client,
+    endpoint: str,
+    prompt: str,
+    *,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    schema: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """Run ``prompt`` and return schema-valid JSON for ``endpoint``.
+
+    Raises ``StructuredOutputError`` when neither local repair nor one repair
+    prompt produces valid output; provider errors propagate unchanged.
+    """
+    schema = schema if schema is not None else SCHEMAS.get(endpoint)
+    json_mode = Config.LLM_JSON_MODE
+    if json_mode and schema and schema.get("type") == "array":
+        prompt += '\nWrap the array in a JSON object under the key "items".'
+    messages = [{"role": "user", "content": prompt}]
+    kwargs = dict(model=model, temperature=temperature, max_tokens=max_tokens)
+
+    _record(endpoint, "calls")
+    with tracing.span("llm"):
+        raw = _complete(client, messages, json_mode, **kwargs)
+    try:
+        with tracing.span("parse"):
+            value, repaired = parse_json(raw, schema)
+        _record(endpoint, "repaired_locally" if repaired else "parsed")
+        return value
+    except StructuredOutputError as e:
+        logger.warning(f"{endpoint}: invalid JSON ({e}) | raw: {raw[:200]}")
+        error = e
+
+    repair_messages = messages + [
+        {"role": "assistant", "content": raw},
+        {
+            "role": "user",
+            "content": (
+                f"Your reply was not valid JSON for the requested format ({error}). "
+                "Reply again with ONLY the corrected JSON, no markdown, no extra text."
+            ),
+        },
+    ]
+    with tracing.span("repair"):
+        raw = _complete(client, repair_messages, json_mode, **kwargs)
+    try:
+        with tracing.span("parse"):
+            value, _ = parse_json(raw, schema)
+    except StructuredOutputError:
+        _record(endpoint, "failed")
+        raise
+    _record(endpoint, "repaired_by_prompt")
+    return value
+
+
+# ─── Incremental parsing of a streamed JSON object ───
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class IncrementalObjectParser:
+    """Parse a top-level JSON object as it streams in, one chunk at a time.
+
+    ``feed()`` returns a list of events:
+
+    - ``("delta", key, text)`` — decoded text appended to the string value of
+      ``key``, for keys listed in ``stream_keys``
+    - ``("value", key, value)`` — the complete value of ``key``, emitted for
+      every top-level key once its value has been fully received
+
+    Text before the opening brace (prose, code fences) is ignored. The parsed
+    object so far is available as ``result``.
+    """
+
+    def __init__(self, stream_keys=()):
+        self.stream_keys = set(stream_keys)
+        self.result: Dict[str, Any] = {}
+        self.done = False
+        self._state = "before_object"
+        self._key: List[str] = []
+        self._value: List[str] = []
+        self._escape = ""  # pending escape sequence inside a string
+        self._depth = 0
+        self._in_str = False
+        self._raw_escape = False
+
+    def _decode_escape(self) -> Optional[str]:
+        """Return the decoded pending escape, or None if more chars are needed."""
+        esc = self._escape
+        if esc[1] != "u":
+            return _ESCAPES.get(esc[1], esc[1])
+        if len(esc) < 6:
+            return None
+        code = int(esc[2:6], 16)
+        if 0xD800 <= code < 0xDC00:  # high surrogate: wait for the low half
+            if len(esc) < 12:
+                return None
+            low = int(esc[8:12], 16)
+            return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00))
+        return chr(code)
+
+    def _finish_value(self, events, value):
+        key = "".join(self._key)
+        self.result[key] = value
+        events.append(("value", key, value))
+        self._key, self._value = [], []
+        self._state = "expect_key"
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        events: List[Tuple[str, str, Any]] = []
+        delta: List[str] = []
+        for ch in chunk:
+            state = self._state
+            if state == "done":
+                break
+            if state == "before_object":
+                if ch == "{":
+                    self._state = "expect_key"
+            elif state == "expect_key":
+                if ch == '"':
+                    self._state = "key"
+                elif ch == "}":
+                    self._state = "done"
+                    self.done = True
+            elif state == "key":
+                if self._escape:
+                    self._escape += ch
+                    decoded = self._decode_escape()
+                    if decoded is not None:
+                        self._key.append(decoded)
+                        self._escape = ""
+                elif ch == "\\":
+                    self._escape = ch
+                elif ch == '"':
+                    self._state = "after_key"
+                else:
+                    self._key.append(ch)
+            elif state == "after_key":
+                if ch == ":":
+                    self._state = "before_value"
+            elif state == "before_value":
+                if ch == '"':
+                    self._state = "string"
+                elif not ch.isspace():
+                    self._state = "raw"
+                    self._depth = 0
+                    self._in_str = self._raw_escape = False
+                    self._feed_raw(ch, events)
+            elif state == "string":
+                streaming = "".join(self._key) in self.stream_keys
+                if self._escape:
+                    self._escape += ch
+                    decoded = self._decode_escape()
+                    if decoded is None:
+                        continue
+                    self._escape = ""
+                    self._value.append(decoded)
+                    if streaming:
+                        delta.append(decoded)
+                elif ch == "\\":
+                    self._escape = ch
+                elif ch == '"':
+                    if streaming and delta:
+                        events.append(("delta", "".join(self._key), "".join(delta)))
+                        delta = []
+                    self._finish_value(events, "".join(self._value))
+                else:
+                    self._value.append(ch)
+                    if streaming:
+                        delta.append(ch)
+            elif state == "raw":
+                self._feed_raw(ch, events)
+        if delta and self._state == "string":
+            events.append(("delta", "".join(self._key), "".join(delta)))
+        return events
+
+    def _feed_raw(self, ch: str, events):
+        """Accumulate a non-string value (number, literal, array, object)."""
+        if self._in_str:
+            self._value.append(ch)
+            if self._raw_escape:
+                self._raw_escape = False
+            elif ch == "\\":
+                self._raw_escape = True
+            elif ch == '"':
+                self._in_str = False
+            return
+        if self._depth == 0 and ch in ",}":
+            raw = "".join(self._value).strip()
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                value = raw
+            self._finish_value(events, value)
+            if ch == "}":
+                self._state = "done"
+                self.done = True
+            return
+        self._value.append(ch)
+        if ch == '"':
+            self._in_str = True
+        elif ch in "{[":
+            self._depth += 1
+        elif ch in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                raw = "".join(self._value)
+                try:
+                    value = json.loads(raw)
+                except ValueError:
+                    value = parse_json(raw)[0]
+                self._finish_value(events, value)
+
+
+def stream_json_object(
+    client,
+    endpoint: str,
+    prompt: str,
+    *,
+    stream_keys=(),
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    schema: Optional[Dict[str, Any]] = None,
+):
+    """Stream ``prompt`` and yield parser events as the object arrives.
+
+    Yields the ``IncrementalObjectParser`` events, then a final
+    ``("result", None, value)`` with the schema-valid object. Partial output
+    has already reached the client, so there is no repair prompt: if the
+    streamed object cannot be repaired locally ``StructuredOutputError`` is
+    raised after the last event.
+    """
+    schema = schema if schema is not None else SCHEMAS.get(endpoint)
+    parser = IncrementalObjectParser(stream_keys)
+    raw: List[str] = []
+
+    _record(endpoint, "calls")
+    with tracing.span("connect"):
+        stream = client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+    try:
+        for chunk in tracing.timed_stream(stream):
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content or ""
+            if text:
+                raw.append(text)
+                yield from parser.feed(text)
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+    try:
+        if parser.done:
+            try:
+                value = validate(parser.result, schema)
+                _record(endpoint, "parsed")
+                yield ("result", None, value)
+                return
+            except SchemaError:
+                pass
+        value, _ = parse_json("".join(raw), schema)
+    except StructuredOutputError:
+        _record(endpoint, "failed")
+        raise
+    _record(endpoint, "repaired_locally")
+    yield ("result", None, value)
@@ -0,0 +1,129 @@
+"""
+Per-request phase timing.
+
+Endpoints wrap their phases (cache lookup, prompt building, client
+construction, provider connect, first token, streaming, ...) in
+``span("name")``. The spans of a request are returned as a ``Server-Timing``
+header, and SSE streams, whose headers leave before the work is done, end
+with a ``{"timing": ...}`` event from ``timing_event()``. A share of
+requests (``Config.TRACE_SAMPLE_RATE``) is also appended as JSON lines to
+``Config.TRACE_LOG_PATH``.
+
+Outside a request context ``span()`` is a no-op, so shared helpers can be
+instrumented without caring who calls them.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import g, has_request_context
+
+from config import Config
+
+logger = logging.getLogger("tracing")
+
+_log_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[tuple] = []  # (name, start offset s, duration s)
+        self.sampled = random.random() < Config.TRACE_SAMPLE_RATE
+
+    def add(self, name: str, start: float, end: float = None):
+        end = time.perf_counter() if end is None else end
+        self.spans.append((name, start - self.start, end - start))
+
+    def durations(self) -> Dict[str, float]:
+        """Milliseconds per phase; repeated phases (e.g. a retry) are summed."""
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration * 1000
+        return {name: round(ms, 1) for name, ms in totals.items()}
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def server_timing(self) -> str:
+        parts = [f"{name};dur={ms}" for name, ms in self.durations().items()]
+        parts.append(f"total;dur={self.total_ms()}")
+        return ", ".join(parts)
+
+    def log(self, route: str, method: str, status: str):
+        """Append this request to the trace log if it was sampled."""
+        if not self.sampled or not Config.TRACE_LOG_PATH:
+            return
+        record = {
+            "ts": round(time.time(), 3),
+            "route": route,
+            "method": method,
+            "status": status,
+            "total_ms": self.total_ms(),
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round(start * 1000, 1),
+                    "dur_ms": round(duration * 1000, 1),
+                }
+                for name, start, duration in self.spans
+            ],
+        }
+        try:
+            with _log_lock, open(Config.TRACE_LOG_PATH, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write trace log: {e}")
+
+
+def current() -> Optional[Trace]:
+    """The trace of the current request, created on first use."""
+    if not has_request_context():
+        return None
+    trace = g.get("trace")
+    if trace is None:
+        trace = g.trace = Trace()
+    return trace
+
+
+@contextmanager
+def span(name: str):
+    trace = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add(name, start)
+
+
+def timed_stream(stream: Iterable[Any]):
+    """Iterate a streamed completion, recording ``first_token`` and ``stream``."""
+    trace = current()
+    start = first = time.perf_counter()
+    seen = False
+    try:
+        for chunk in stream:
+            if not seen:
+                seen = True
+                first = time.perf_counter()
+                if trace is not None:
+                    trace.add("first_token", start, first)
+            yield chunk
+    finally:
+        if trace is not None and seen:
+            trace.add("stream", first)
+
+
+def timing_event() -> str:
+    """SSE event with the phase timings so far, sent before ``[DONE]``."""
+    trace = current()
+    if trace is None:
+        return ""
+    payload = {"timing": {"phases_ms": trace.durations(), "total_ms": trace.total_ms()}}
+    return f"data: {json.dumps(payload)}\n\n"
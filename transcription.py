@@ -0,0 +1,163 @@
+"""
+Whisper transcription helpers shared by ``/transcribe`` and the streaming
+WebSocket endpoint.
+
+``StreamingTranscription`` takes live 16 kHz mono PCM, cuts it into segments
+at voice-activity boundaries (``audio.SpeechSegmenter``) and transcribes the
+segments concurrently on a thread pool while the learner is still speaking.
+Results are released strictly in segment order, so when the learner stops
+only the last segment is still waiting for Whisper.
+
+``transcription_cache`` (a ``ttl_cache.TTLCache``) de-duplicates uploads by a
+hash of the audio bytes and language: retries and double submissions are
+answered from memory, and identical uploads that arrive while the first is
+still being transcribed wait for that call instead of making their own.
+"""
+
+import hashlib
+import logging
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, List, Optional
+
+import audio
+import metrics
+from config import Config
+from ttl_cache import TTLCache
+
+logger = logging.getLogger("transcription")
+
+WHISPER_MODEL = "whisper-large-v3-turbo"
+
+
+def whisper_transcribe(client, filename: str, data, language: str) -> Dict[str, Any]:
+    """One Whisper call; returns ``{"text", "language", "duration"}``."""
+    started = time.perf_counter()
+    transcription = client.audio.transcriptions.create(
+        file=(filename, data),
+        model=WHISPER_MODEL,
+        language=language,
+        temperature=0,
+        response_format="verbose_json",
+    )
+    duration = getattr(transcription, "duration", 0)
+    metrics.WHISPER_LATENCY.observe(time.perf_counter() - started, model=WHISPER_MODEL)
+    if duration:
+        metrics.WHISPER_AUDIO.observe(duration, model=WHISPER_MODEL)
+    return {
+        "text": transcription.text,
+        "language": getattr(transcription, "language", language),
+        "duration": duration,
+    }
+
+
+class StreamingTranscription:
+    """One live transcription session.
+
+    ``feed()`` PCM as it arrives, poll ``events()`` for transcripts that are
+    ready, then ``finish()`` to flush the last segment and wait for the rest.
+    Events are dicts:
+
+    - ``{"type": "segment", "index", "text", "start", "end"}`` per segment,
+      in order, with ``start``/``end`` in seconds from the start of the stream
+    - ``{"type": "partial", "text"}`` — the transcript so far, after each segment
+    - ``{"type": "final", "text", "segments", "duration"}`` — once, at the end
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[str, bytes], Dict[str, Any]],
+        pool: Executor,
+        segmenter: Optional[audio.SpeechSegmenter] = None,
+    ):
+        self._transcribe = transcribe
+        self._pool = pool
+        self._segmenter = segmenter or audio.SpeechSegmenter()
+        self._futures: List[Future] = []
+        self._bounds: List[tuple] = []
+        self._released = 0
+        self._texts: List[str] = []
+        self.bytes_received = 0
+
+    @property
+    def seconds_received(self) -> float:
+        return self.bytes_received / (2 * audio.SAMPLE_RATE)
+
+    def _submit(self, start: float, segment: bytes):
+        self._bounds.append((start, start + len(segment) / (2 * audio.SAMPLE_RATE)))
+        self._futures.append(self._pool.submit(self._run, segment))
+
+    def _run(self, segment: bytes) -> Dict[str, Any]:
+        if audio.enabled():
+            try:
+                return self._transcribe("segment.ogg", audio.encode_opus(segment))
+            except RuntimeError as e:
+                logger.warning(f"Opus encode failed, sending WAV: {e}")
+        return self._transcribe("segment.wav", audio.pcm_to_wav(segment))
+
+    def feed(self, pcm: bytes):
+        self.bytes_received += len(pcm)
+        for start, segment in self._segmenter.feed(pcm):
+            self._submit(start, segment)
+
+    def _release(self, index: int) -> List[Dict[str, Any]]:
+        future = self._futures[index]
+        start, end = self._bounds[index]
+        event = {"type": "segment", "index": index, "start": start, "end": end}
+        try:
+            text = (future.result().get("text") or "").strip()
+            event["text"] = text
+        except Exception as e:
+            logger.error(f"Segment {index} transcription failed: {e}")
+            text = ""
+            event.update(text="", error="Transcription failed for this segment")
+        if text:
+            self._texts.append(text)
+        self._released += 1
+        return [event, {"type": "partial", "text": " ".join(self._texts)}]
+
+    def events(self) -> List[Dict[str, Any]]:
+        """Transcripts of segments that are ready, without blocking."""
+        ready = []
+        while self._released < len(self._futures):
+            if not self._futures[self._released].done():
+                break
+            ready.extend(self._release(self._released))
+        return ready
+
+    def finish(self):
+        """Flush the last segment and yield every remaining event, in order."""
+        last = self._segmenter.flush()
+        if last:
+            self._submit(*last)
+        while self._released < len(self._futures):
+            yield from self._release(self._released)
+        yield {
+            "type": "final",
+            "text": " ".join(self._texts),
+            "segments": len(self._futures),
+            "duration": round(self.seconds_received, 2),
+        }
+
+    def cancel(self):
+        for future in self._futures[self._released :]:
+            future.cancel()
+
+
+def max_stream_bytes() -> int:
+    return int(Config.STT_MAX_STREAM_S * 2 * audio.SAMPLE_RATE)
+
+
+def audio_digest(stream, language: str, chunk_size: int = 1 << 16) -> str:
+    """SHA-256 of an upload stream plus language; rewinds the stream."""
+    digest = hashlib.sha256(language.encode("utf-8") + b"\0")
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+transcription_cache = TTLCache(
+    "transcription", Config.TRANSCRIBE_CACHE_SIZE, Config.TRANSCRIBE_CACHE_TTL
+)
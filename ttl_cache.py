@@ -0,0 +1,91 @@
+"""
+Bounded LRU cache with a TTL and in-flight sharing.
+
+``get_or_compute()`` returns a fresh cached value or runs ``compute`` for
+it; concurrent calls for a key that is being computed wait for that result
+instead of computing it again. Failures are not cached. Lookups are counted
+in ``echo_cache_requests_total`` under the cache's namespace as ``hit``,
+``miss`` or ``shared`` (waited for an in-flight computation).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+
+
+class TTLCache:
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int,
+        ttl: float,
+        ttl_for: Optional[Callable[[Any], float]] = None,
+    ):
+        """``ttl_for(result)``, if given, picks each entry's TTL instead of ``ttl``."""
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ttl_for = ttl_for
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = self.shared = self.misses = 0
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return ``(result, cached)``; ``cached`` is False only for the call
+        that actually ran ``compute``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.CACHE_REQUESTS.inc(namespace=self.namespace, result="hit")
+                return entry[1], True
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.shared += 1
+        metrics.CACHE_REQUESTS.inc(
+            namespace=self.namespace, result="miss" if owner else "shared"
+        )
+        if not owner:
+            return future.result(), True
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        ttl = self.ttl_for(result) if self.ttl_for else self.ttl
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._entries[key] = (time.time() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        future.set_result(result)
+        return result, False
+
+    def known(self, key: str) -> bool:
+        """Whether ``key`` is cached and fresh, or being computed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return bool(entry and entry[0] > time.time()) or key in self._inflight
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "shared_inflight": self.shared,
+                "misses": self.misses,
+            }
@@ -0,0 +1,238 @@
+"""
+Token and cost accounting for LLM calls, backed by SQLite.
+
+Every completion made through a routed client (``routing.RoutedClient``) is
+recorded with the token usage the provider reported. Streams that carry no
+usage are estimated: prompt characters / 4 and about one token per streamed
+chunk, and flagged as estimated. Calls are attributed to the HTTP endpoint,
+task route, provider, model, API key (masked) and user (JWT ``sub`` or
+client IP).
+
+Each worker sums its calls in memory per UTC day and attribution, and adds
+them to the ``llm_usage`` table every ``Config.USAGE_FLUSH_SECONDS`` (and at
+exit) with one upsert per row. ``rollup()`` reports daily tokens and spend,
+priced with ``Config.LLM_PRICES`` (USD per million tokens).
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger("usage")
+
+DIMENSIONS = ("endpoint", "task", "provider", "model", "api_key", "user_key")
+_COUNTS = ("calls", "errors", "estimated", "prompt_tokens", "completion_tokens")
+
+
+def mask_key(api_key: Optional[str]) -> str:
+    """Enough of an API key to tell keys apart in reports, never the secret."""
+    if not api_key:
+        return "-"
+    if len(api_key) < 16:
+        return "***"
+    return f"{api_key[:4]}...{api_key[-4:]}"
+
+
+def estimate_tokens(messages) -> int:
+    """Rough prompt size (about four characters per token)."""
+    chars = 0
+    for message in messages or ():
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(str(part.get("text", ""))) for part in content)
+    return chars // 4
+
+
+def price(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Cost in USD; models missing from ``Config.LLM_PRICES`` count as free."""
+    rates = Config.LLM_PRICES.get(model)
+    if not rates:
+        return 0.0
+    return (
+        prompt_tokens * rates.get("prompt", 0.0)
+        + completion_tokens * rates.get("completion", 0.0)
+    ) / 1_000_000
+
+
+class UsageLedger:
+    def __init__(self, db_path: str = None, flush_seconds: float = None):
+        self.db_path = db_path or Config.DATA_DB_PATH
+        self.flush_seconds = flush_seconds or Config.USAGE_FLUSH_SECONDS
+        self._init_db()
+        self._reset_process()
+        if hasattr(os, "register_at_fork"):
+            # gunicorn --preload: pending rows belong to the parent
+            os.register_at_fork(after_in_child=self._reset_process)
+        atexit.register(self.flush)
+
+    def _reset_process(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, ...], List[float]] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._flushed_rows = 0
+        self._last_flush: Optional[float] = None
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        """Create the usage table: one row per day and attribution."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    day TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    task TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    api_key TEXT NOT NULL,
+                    user_key TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    estimated INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    cost_usd REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, endpoint, task, provider, model,
+                                 api_key, user_key)
+                ) WITHOUT ROWID
+                """
+            )
+
+    # ── Recording ──
+
+    def record(
+        self,
+        task: str,
+        provider: str,
+        model: str,
+        api_key: str,
+        attribution: Optional[Tuple[str, str]],
+        ok: bool,
+        prompt_tokens: int,
+        completion_tokens: int,
+        estimated: bool = False,
+    ):
+        """Add one call; ``attribution`` is (endpoint, user_key) or None."""
+        endpoint, user_key = attribution or ("-", "-")
+        key = (
+            time.strftime("%Y-%m-%d", time.gmtime()),
+            endpoint,
+            task,
+            provider,
+            model,
+            mask_key(api_key),
+            str(user_key)[:128],
+        )
+        cost = price(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._pending[key] = [0, 0, 0, 0, 0, 0.0]
+            row[0] += 1
+            row[1] += 0 if ok else 1
+            row[2] += 1 if estimated else 0
+            row[3] += prompt_tokens
+            row[4] += completion_tokens
+            row[5] += cost
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="usage-flush", daemon=True
+                )
+                self._flusher.start()
+
+    # ── Persistence ──
+
+    def flush(self) -> int:
+        """Add the pending totals to the usage table; returns rows written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with self._get_conn() as conn:
+                conn.executemany(
+                    """
+                    INSERT INTO llm_usage (day, endpoint, task, provider, model,
+                        api_key, user_key, calls, errors, estimated,
+                        prompt_tokens, completion_tokens, cost_usd)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (day, endpoint, task, provider, model, api_key,
+                        user_key)
+                    DO UPDATE SET
+                        calls = calls + excluded.calls,
+                        errors = errors + excluded.errors,
+                        estimated = estimated + excluded.estimated,
+                        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                        completion_tokens =
+                            completion_tokens + excluded.completion_tokens,
+                        cost_usd = cost_usd + excluded.cost_usd
+                    """,
+                    [key + tuple(row) for key, row in pending.items()],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not flush usage ({len(pending)} rows): {e}")
+            with self._lock:  # keep them for the next attempt
+                for key, row in pending.items():
+                    merged = self._pending.setdefault(key, [0, 0, 0, 0, 0, 0.0])
+                    for i, value in enumerate(row):
+                        merged[i] += value
+            return 0
+        self._flushed_rows += len(pending)
+        self._last_flush = time.time()
+        return len(pending)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    # ── Reporting ──
+
+    def rollup(
+        self, days: int = 7, group_by: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Daily totals for the last ``days`` days, optionally per dimension.
+
+        Totals from other workers appear once they have flushed (at most
+        ``USAGE_FLUSH_SECONDS`` late); this worker's are flushed first.
+        """
+        if group_by is not None and group_by not in DIMENSIONS:
+            raise ValueError(f"group_by must be one of {', '.join(DIMENSIONS)}")
+        self.flush()
+        since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+        group = f", {group_by}" if group_by else ""
+        sums = ", ".join(f"SUM({name})" for name in _COUNTS + ("cost_usd",))
+        with self._get_conn() as conn:
+            rows = conn.execute(
+                f"SELECT day{group}, {sums} FROM llm_usage WHERE day >= ? "
+                f"GROUP BY day{group} ORDER BY day DESC{group}",
+                (since,),
+            ).fetchall()
+        names = ("day",) + ((group_by,) if group_by else ()) + _COUNTS
+        return [dict(zip(names, row[:-1]), cost_usd=round(row[-1], 6)) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_rows": pending,
+            "flushed_rows": self._flushed_rows,
+            "last_flush": self._last_flush,
+        }
+
+
+usage_ledger = UsageLedger()
@@ -0,0 +1,148 @@
+"""
+Vocabulary store for ``/vocab/suggest``.
+
+Suggested words are kept per (language, topic, level) as one growing,
+deduplicated list. A request for N words is served by slicing (or sampling)
+that list; the LLM is only asked to top it up, with the words already held
+excluded, when the list is shorter than N. Requests for 8 and 12 words on the
+same topic therefore share one generation instead of making two.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List
+
+from config import Config
+from lexicon import normalize_word
+
+logger = logging.getLogger("vocab_store")
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join((topic or "").lower().split())
+
+
+class VocabStore:
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.DATA_DB_PATH
+        self._init_db()
+
+    def _get_conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        """Create the word table and its slice index."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS vocab_words (
+                    language TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    level TEXT NOT NULL,
+                    word_norm TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL,
+                    PRIMARY KEY (language, topic, level, word_norm)
+                ) WITHOUT ROWID
+            """
+            )
+            for idx in [
+                "CREATE INDEX IF NOT EXISTS idx_vocab_slice ON vocab_words(language, topic, level, position)",
+            ]:
+                c.execute(idx)
+            conn.commit()
+
+    def count(self, language: str, topic: str, level: str) -> int:
+        with self._get_conn() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM vocab_words "
+                "WHERE language = ? AND topic = ? AND level = ?",
+                (language, normalize_topic(topic), level),
+            ).fetchone()[0]
+
+    def words(
+        self,
+        language: str,
+        topic: str,
+        level: str,
+        limit: int,
+        sample: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` words: the first ``limit`` in insertion order,
+        or a random sample when ``sample`` is true."""
+        order = "random()" if sample else "position"
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT data FROM vocab_words "
+                "WHERE language = ? AND topic = ? AND level = ? "
+                f"ORDER BY {order} LIMIT ?",
+                (language, normalize_topic(topic), level, limit),
+            )
+            return [json.loads(row[0]) for row in c.fetchall()]
+
+    def known_words(self, language: str, topic: str, level: str) -> List[str]:
+        """Every word held for this list, for the LLM's exclusion list."""
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT json_extract(data, '$.word') FROM vocab_words "
+                "WHERE language = ? AND topic = ? AND level = ? ORDER BY position",
+                (language, normalize_topic(topic), level),
+            )
+            return [row[0] for row in c.fetchall()]
+
+    def add(
+        self, language: str, topic: str, level: str, items: Iterable[Dict[str, Any]]
+    ) -> int:
+        """Append new words, skipping ones already held; returns how many were added."""
+        topic = normalize_topic(topic)
+        added = 0
+        with self._get_conn() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT COALESCE(MAX(position), -1) FROM vocab_words "
+                "WHERE language = ? AND topic = ? AND level = ?",
+                (language, topic, level),
+            )
+            position = c.fetchone()[0] + 1
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                word_norm = normalize_word(str(item.get("word", "")))
+                if not word_norm:
+                    continue
+                c.execute(
+                    """INSERT OR IGNORE INTO vocab_words
+                           (language, topic, level, word_norm, position, data, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (
+                        language,
+                        topic,
+                        level,
+                        word_norm,
+                        position,
+                        json.dumps(item, ensure_ascii=False),
+                        time.time(),
+                    ),
+                )
+                if c.rowcount:
+                    added += 1
+                    position += 1
+            conn.commit()
+        return added
+
+
+# Singleton
+try:
+    vocab_store = VocabStore()
+except sqlite3.Error as e:
+    logger.error(f"Vocabulary store unavailable: {e}")
+    vocab_store = None